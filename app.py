@@ -1,60 +1,140 @@
 from flask import (
+    Blueprint,
     Flask,
-    send_from_directory,
+    current_app,
     abort,
     render_template,
     request,
+    stream_template,
     redirect,
     url_for,
     session,
     Response,
     jsonify,
+    g,
+    stream_with_context,
 )
 import base64
+import json
+import logging
+import threading
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import quote
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from functools import wraps
 from sqlalchemy.orm import Session
-from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from markupsafe import Markup
 
 from flask_compress import Compress
 
-from app.db import engine, Base
-from app.models import VPS, User, InviteCode, SiteConfig, VisitStats
+from app.db import engine, read_engine, run_migrations
+from app.emoji import TWEMOJI_BASE, emoji_code, has_emoji, load_emoji_assets
+from app.geo import country_flag, lookup_geo_many
+from app.latency import (
+    LATENCY_FLUSH_SECONDS,
+    LATENCY_RETENTION_DAYS,
+    flush_latency,
+    latency_series,
+    recent_samples,
+)
+from app.probe import cached_statuses, probe_fleet
+from app.models import VPS, User, InviteCode, SiteConfig
+from app.rates import load_rate_snapshot
+from app.traceroute import (
+    TRACEROUTE_TIMEOUT,
+    TracerouteBusy,
+    get_job,
+    parse_hop,
+    start_traceroute,
+)
+from app.valuation import (
+    VALUATION_REFRESH_MINUTES,
+    delete_valuation,
+    get_valuations,
+    refresh_stale_valuations,
+    refresh_valuations,
+)
+from app.visits import VISIT_FLUSH_SECONDS, flush_visits, get_visit_totals, record_visit
+from app.vps_index import (
+    VPSIndex,
+    latest_vps_change,
+    page_rows,
+    record_vps_change,
+    sort_key,
+    vps_changes_since,
+)
+from app.vps_api import last_modified, parse_fields, project, vps_record
+from app.vps_query import (
+    DEFAULT_SORT,
+    SORTS,
+    VPS_PAGE_SIZE,
+    encode_cursor,
+    filter_options,
+    list_query,
+    parse_list_args,
+    query_page,
+)
 from app.utils import (
-    calculate_remaining,
+    build_ip_info,
     generate_svg,
+    render_svg,
+    svg_cache_key,
+    svg_is_current,
     parse_instance_config,
     mask_ip,
     ping_ip,
-    traceroute_ip,
     run_speedtest,
     ip_to_flag,
     ip_to_isp,
     twemoji_url,
 )
 
-app = Flask(__name__)
-Compress(app)
-app.secret_key = "change-me"
-
-# Cache static files for one year to leverage browser caching
-app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 31536000
-
-
-@app.after_request
+def _env_flag(name: str, default: str = "") -> bool:
+    return os.environ.get(name, default).lower() in ("1", "true", "yes")
+
+
+DEFAULT_CONFIG = {
+    "SECRET_KEY": "change-me",
+    # Cache static files for one year to leverage browser caching
+    "SEND_FILE_MAX_AGE_DEFAULT": 31536000,
+    "ASSET_VERSION": os.environ.get("ASSET_VERSION"),
+    # Startup stages run by create_app.  Only the schema check (a single
+    # read when current) and loading the local emoji are on by default;
+    # the rest are opt-in so tests, the CLI and extra workers start fast.
+    "RUN_MIGRATIONS": True,
+    "LOAD_EMOJI": True,
+    "SEED_SAMPLE": _env_flag("SEED_SAMPLE"),
+    "START_SCHEDULER": _env_flag("START_SCHEDULER"),
+    "HASH_ASSETS": False,
+    # Stream the public list; set STREAM_VPS_LIST=0 to render it in one piece
+    "STREAM_VPS_LIST": _env_flag("STREAM_VPS_LIST", "1"),
+    # Flask-Compress buffers a streamed body to compress it, which would
+    # hold the whole page back; streamed responses go out uncompressed
+    "COMPRESS_STREAMS": False,
+}
+
+# Upper bound for Cache-Control max-age on /vps/<name>.svg, in seconds
+SVG_MAX_AGE = int(os.environ.get("SVG_MAX_AGE", "300"))
+
+# Worker threads used by refresh_images
+SVG_REFRESH_WORKERS = int(os.environ.get("SVG_REFRESH_WORKERS", "8"))
+
+bp = Blueprint("main", __name__)
+logger = logging.getLogger(__name__)
+
+
+@bp.after_app_request
 def add_cache_headers(response):
     if request.path.startswith("/static/"):
         response.headers.setdefault(
             "Cache-Control", "public, max-age=31536000, immutable"
         )
     return response
-TWEMOJI_BASE = "https://cdnjs.cloudflare.com/ajax/libs/twemoji/14.0.2/svg"
+
 
 # Animated favicon (16x16 diamond that cycles through colors)
 FAVICON_BASE64 = (
@@ -66,18 +146,15 @@ FAVICON_BASE64 = (
 )
 
 
-def get_asset_version() -> str:
+def compute_asset_version(root_path: str) -> str:
     """Return a cache-busting version for static assets.
 
-    Prefer an explicit ASSET_VERSION in production; otherwise derive a stable
-    version from local CSS mtimes so rebuilt containers get fresh URLs.
+    Derive a stable version from local CSS mtimes so rebuilt containers get
+    fresh URLs.  Production deployments can skip this by setting
+    ASSET_VERSION.
     """
 
-    configured = os.environ.get("ASSET_VERSION")
-    if configured:
-        return configured
-
-    static_root = os.path.join(app.root_path, "static", "css")
+    static_root = os.path.join(root_path, "static", "css")
     mtimes = []
     css_files = (
         "cards.css",
@@ -94,24 +171,35 @@ def get_asset_version() -> str:
     return str(int(max(mtimes))) if mtimes else "1"
 
 
-ASSET_VERSION = get_asset_version()
+def get_asset_version() -> str:
+    """Return the app's asset version, hashing CSS files on first use."""
 
+    version = current_app.config.get("ASSET_VERSION")
+    if not version:
+        version = compute_asset_version(current_app.root_path)
+        current_app.config["ASSET_VERSION"] = version
+    return version
 
-@app.route("/favicon.ico")
+
+@bp.route("/favicon.ico")
 def favicon():
     icon_bytes = base64.b64decode(FAVICON_BASE64)
     return Response(icon_bytes, mimetype="image/gif")
 
 
-@app.template_filter("twemoji")
+@bp.app_template_filter("twemoji")
 def twemoji_filter(emoji: str, width: int = 16, height: int = 16, extra_class: str = "") -> str:
     """Return an HTML img tag rendering the emoji via Twemoji.
 
     Allows specifying explicit width/height and an extra CSS class to
-    help reserve layout space and reduce CLS.
+    help reserve layout space and reduce CLS.  Bundled emoji are served
+    from ``static/twemoji``; others fall back to the CDN.
     """
-    code_points = "-".join(f"{ord(c):x}" for c in emoji)
-    url = f"{TWEMOJI_BASE}/{code_points}.svg"
+    code_points = emoji_code(emoji)
+    if has_emoji(emoji):
+        url = url_for("static", filename=f"twemoji/{code_points}.svg")
+    else:
+        url = f"{TWEMOJI_BASE}/{code_points}.svg"
     return Markup(
         f'<img src="{url}" alt="{emoji}" class="twemoji {extra_class}" '
         f'width="{width}" height="{height}" '
@@ -119,110 +207,236 @@ def twemoji_filter(emoji: str, width: int = 16, height: int = 16, extra_class: s
     )
 
 
-app.add_template_filter(twemoji_url, "twemoji_url")
+bp.add_app_template_filter(twemoji_url, "twemoji_url")
+
+
+# Process-wide cache for values shown on every page.  Entries expire after
+# SITE_CACHE_TTL seconds so other workers pick up changes, and writes in
+# this process invalidate them immediately.
+SITE_CACHE_TTL = int(os.environ.get("SITE_CACHE_TTL", "60"))
+_site_cache = {}
+
+
+def cached_site_value(key, loader):
+    now = time.time()
+    hit = _site_cache.get(key)
+    if hit and now - hit[0] < SITE_CACHE_TTL:
+        return hit[1]
+    value = loader()
+    _site_cache[key] = (now, value)
+    return value
+
+
+def invalidate_site_cache(*keys) -> None:
+    """Drop cached site values; all of them when no key is given."""
 
-Base.metadata.create_all(bind=engine)
+    if not keys:
+        _site_cache.clear()
+    for key in keys:
+        _site_cache.pop(key, None)
 
 
 def get_current_user():
     user_id = session.get("user_id")
-    if user_id:
+    if not user_id:
+        return None
+    # Memoized per request: decorators and the template context share it
+    if "current_user" not in g:
         with Session(engine) as db:
-            return db.get(User, user_id)
-    return None
+            g.current_user = db.get(User, user_id)
+    return g.current_user
 
 
-def get_site_config():
-    with Session(engine) as db:
+def _load_site_config():
+    with Session(read_engine) as db:
         return db.query(SiteConfig).first()
 
 
-def get_site_stats():
-    with Session(engine) as db:
+def get_site_config():
+    return cached_site_value("config", _load_site_config)
+
+
+def _load_site_stats():
+    with Session(read_engine) as db:
         active_vps = db.query(VPS).filter(VPS.status == "active").all()
         count = len(active_vps)
         total = sum(
-            calculate_remaining(vps)["remaining_value"] for vps in active_vps
+            data["remaining_value"]
+            for data in get_valuations(db, active_vps).values()
         )
     return {"count": count, "total_value": round(total, 2)}
 
 
-def get_visit_stats():
-    with Session(engine) as db:
-        stats = db.get(VisitStats, 1)
-        if not stats:
-            return {"visitors": 0, "crawlers": 0}
-        return {"visitors": stats.visitors, "crawlers": stats.crawlers}
+def get_site_stats():
+    return cached_site_value("stats", _load_site_stats)
 
 
-@app.before_request
+@bp.before_app_request
 def track_visits():
     if request.endpoint == "static":
         return
     ua = request.headers.get("User-Agent", "").lower()
     bots = ("bot", "spider", "crawl", "slurp")
     is_bot = any(keyword in ua for keyword in bots)
-    with Session(engine) as db:
-        stats = db.get(VisitStats, 1)
-        if not stats:
-            stats = VisitStats(id=1, visitors=0, crawlers=0)
-            db.add(stats)
-        if is_bot:
-            stats.crawlers += 1
-        else:
-            stats.visitors += 1
-        db.commit()
+    record_visit(is_bot)
 
 
-@app.context_processor
+@bp.app_context_processor
 def inject_visit_stats():
-    return {"visit_stats": get_visit_stats()}
+    return {"visit_stats": get_visit_totals()}
 
 
-_vps_cache = {"data": None, "time": 0}
+# Public VPS list.  After VPS_CACHE_TTL seconds the list is stale: it is
+# still served while one background thread rebuilds it.  Past
+# VPS_CACHE_MAX_AGE it is not served at all and the request rebuilds it
+# from local data only (stored valuations, cached ping and geo results).
+# Between rebuilds, writes logged by any worker are applied row by row.
+VPS_CACHE_TTL = int(os.environ.get("VPS_CACHE_TTL", "60"))
+VPS_CACHE_MAX_AGE = int(os.environ.get("VPS_CACHE_MAX_AGE", "600"))
+_vps_cache = {"index": None, "time": 0, "cursor": 0, "generation": 0, "refreshing": False}
+_vps_cache_lock = threading.Lock()
+_vps_index_lock = threading.Lock()
 
 
-def invalidate_vps_cache() -> None:
-    """Clear cached VPS list data after writes so public pages update immediately."""
+def invalidate_vps_cache(vps_id: int = None) -> None:
+    """Update cached VPS list data after writes so public pages update immediately.
 
-    _vps_cache["data"] = None
-    _vps_cache["time"] = 0
+    With ``vps_id`` only that server is reloaded, in every worker; without
+    it this worker's list is dropped.
+    """
 
+    if vps_id is None:
+        with _vps_index_lock:
+            _vps_cache["index"] = None
+            _vps_cache["time"] = 0
+            _vps_cache["generation"] += 1
+    else:
+        record_vps_change(vps_id)
+    invalidate_site_cache("stats", "vps_filters")
 
-def get_vps_data():
-    now = time.time()
-    if _vps_cache["data"] is not None and now - _vps_cache["time"] < 60:
-        return _vps_cache["data"]
-    with Session(engine) as db:
-        vps_list = db.query(VPS).all()
-        vps_data = []
-        for vps in vps_list:
-            data = calculate_remaining(vps)
-            specs = parse_instance_config(vps.instance_config)
-            ip_info = {
-                "ip_display": mask_ip(vps.ip_address) if vps.ip_address else "-",
-                "ping_status": ping_ip(vps.ip_address) if vps.ip_address else "",
-                "flag": ip_to_flag(vps.ip_address) if vps.ip_address else "",
-                "isp": ip_to_isp(vps.ip_address) if vps.ip_address else "-",
-            }
-            vps_data.append((vps, data, specs, ip_info))
-        status_order = {"active": 0, "forsale": 1, "sold": 2, "inactive": 3}
-        vps_data.sort(
-            key=lambda item: (
-                status_order.get(item[0].status, 3),
-                -item[1]["remaining_value"],
-            )
-        )
-    _vps_cache["data"] = vps_data
-    _vps_cache["time"] = now
+
+def _vps_rows(db, vps_list, network: bool = True):
+    """Return ``(vps, data, specs, ip_info)`` rows for ``vps_list`` in order.
+
+    With ``network=False`` no probes or geo API requests are made; servers
+    without a cached status show an empty one.
+    """
+    valuations = get_valuations(db, vps_list)
+    # Resolve every uncached address in one batch and probe the whole
+    # fleet concurrently before the loop
+    ips = [vps.ip_address for vps in vps_list if vps.ip_address]
+    geos = lookup_geo_many(ips, network=network)
+    statuses = probe_fleet(ips) if network else cached_statuses(ips)
+    vps_data = []
+    for vps in vps_list:
+        data = valuations[vps.id]
+        specs = parse_instance_config(vps.instance_config)
+        geo = geos.get(vps.ip_address)
+        ip_info = {
+            "ip_display": mask_ip(vps.ip_address) if vps.ip_address else "-",
+            "ping_status": statuses.get(vps.ip_address, ""),
+            "flag": country_flag(geo["country_code"]) if geo else "",
+            "isp": (geo["isp"] or geo["org"] or "-") if geo else "-",
+        }
+        vps_data.append((vps, data, specs, ip_info))
+    return vps_data
+
+
+def _build_vps_data(network: bool = True, ids=None):
+    """Build the sorted ``(vps, data, specs, ip_info)`` list.
+
+    ``ids`` limits the build to those servers; see ``_vps_rows`` for
+    ``network``.
+    """
+    with Session(read_engine) as db:
+        query = db.query(VPS)
+        if ids is not None:
+            query = query.filter(VPS.id.in_(ids))
+        vps_data = _vps_rows(db, query.all(), network=network)
+    vps_data.sort(key=lambda item: sort_key(item[0], item[1]))
     return vps_data
 
 
+def _apply_vps_changes() -> None:
+    """Reload the servers changed since this worker's cursor.
+
+    Called with ``_vps_index_lock`` held.  Drops the index when the log no
+    longer covers the cursor.
+    """
+    index = _vps_cache["index"]
+    cursor, ids, complete = vps_changes_since(_vps_cache["cursor"])
+    if not ids:
+        return
+    if not complete:
+        _vps_cache["index"] = None
+        return
+    rows = {row[0].id: row for row in _build_vps_data(network=False, ids=ids)}
+    for vps_id in ids:
+        if vps_id in rows:
+            index.upsert(rows[vps_id])
+        else:
+            index.remove(vps_id)
+    _vps_cache["cursor"] = cursor
+
+
+def _refresh_vps_data() -> None:
+    try:
+        while True:
+            generation = _vps_cache["generation"]
+            # Changes logged during the rebuild are applied on the next read
+            cursor = latest_vps_change()
+            index = VPSIndex(_build_vps_data())
+            with _vps_index_lock:
+                # A local reset during the rebuild may not be reflected; start over
+                if _vps_cache["generation"] == generation:
+                    _vps_cache["index"] = index
+                    _vps_cache["cursor"] = cursor
+                    _vps_cache["time"] = time.time()
+                    break
+    except Exception:
+        logger.exception("Background VPS list refresh failed")
+    finally:
+        with _vps_cache_lock:
+            _vps_cache["refreshing"] = False
+
+
+def _start_vps_refresh() -> None:
+    """Rebuild the VPS list in the background unless a rebuild is running."""
+    with _vps_cache_lock:
+        if _vps_cache["refreshing"]:
+            return
+        _vps_cache["refreshing"] = True
+    threading.Thread(target=_refresh_vps_data, daemon=True).start()
+
+
+def get_vps_data():
+    with _vps_index_lock:
+        if _vps_cache["index"] is not None:
+            _apply_vps_changes()
+        index = _vps_cache["index"]
+        age = time.time() - _vps_cache["time"]
+        if index is not None and age < VPS_CACHE_TTL:
+            return index.rows()
+        if index is not None and age < VPS_CACHE_MAX_AGE:
+            rows = index.rows()
+        else:
+            cursor = latest_vps_change()
+            index = VPSIndex(_build_vps_data(network=False))
+            _vps_cache["index"] = index
+            _vps_cache["cursor"] = cursor
+            _vps_cache["time"] = time.time()
+            rows = index.rows()
+    # Refresh stale data, or fill in statuses and geo data the local build
+    # could not provide
+    _start_vps_refresh()
+    return rows
+
+
 def login_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         if not session.get("user_id"):
-            return redirect(url_for("login"))
+            return redirect(url_for("main.login"))
         return f(*args, **kwargs)
 
     return decorated
@@ -269,18 +483,17 @@ def validate_vps_name(name: str) -> str:
     return safe_name
 
 
-@app.context_processor
+@bp.app_context_processor
 def inject_globals():
     return {
         "current_user": get_current_user(),
         "config": get_site_config(),
         "site_stats": get_site_stats(),
         "current_year": datetime.now().year,
-        "asset_version": ASSET_VERSION,
+        "asset_version": get_asset_version(),
     }
 
 
-
 def build_vps_form_data(vps=None):
     """Return JSON/template-safe VPS form values with no nullable input values."""
 
@@ -328,7 +541,9 @@ def build_vps_form_data(vps=None):
     defaults["push_fee_currency"] = defaults["push_fee_currency"] or "CNY"
     return defaults
 
+
 def init_sample():
+    """Add a demo VPS to an empty database."""
     with Session(engine) as db:
         if db.query(VPS).count() == 0:
             sample = VPS(
@@ -340,55 +555,88 @@ def init_sample():
                 exchange_rate=1.0,
             )
             db.add(sample)
-        if db.query(InviteCode).count() == 0:
-            db.add(InviteCode(code="Flanker"))
-        if db.query(SiteConfig).count() == 0:
-            db.add(
-                SiteConfig(
-                    site_url="",
-                    username="@Flanker",
-                    copyright="xxx.com",
-                )
-            )
         db.commit()
 
 
-init_sample()
+def _refresh_card(vps, data, config, safe_name, today) -> str:
+    ip_info = build_ip_info(vps)
+    if svg_is_current(safe_name, svg_cache_key(vps, data, config, ip_info, today)):
+        return "skipped"
+    generate_svg(vps, data, config, safe_name=safe_name, ip_info=ip_info)
+    return "rendered"
 
 
-def refresh_images():
+def refresh_images(workers=None) -> dict:
+    """Re-render the dynamic cards whose inputs changed since the last run.
+
+    Cards are checked on a bounded thread pool, since most of the time is
+    spent waiting on ping and geo lookups.  Returns a report with the
+    number of cards rendered, skipped and failed and the wall time.
+    """
+    started = time.monotonic()
+    report = {"rendered": 0, "skipped": 0, "failed": 0}
+    today = date.today()
     with Session(engine) as db:
         config = db.query(SiteConfig).first()
         vps_list = db.query(VPS).all()
-        for vps in vps_list:
-            if not vps.dynamic_svg or vps.status in ["sold", "inactive"]:
-                continue
-            data = calculate_remaining(vps)
-            try:
-                safe_name = validate_vps_name(vps.name)
-            except ValueError:
-                continue
-            generate_svg(vps, data, config, safe_name=safe_name)
+        valuations = refresh_valuations(vps_list)
+        with ThreadPoolExecutor(max_workers=workers or SVG_REFRESH_WORKERS) as pool:
+            futures = {}
+            for vps in vps_list:
+                if not vps.dynamic_svg or vps.status in ["sold", "inactive"]:
+                    continue
+                try:
+                    safe_name = validate_vps_name(vps.name)
+                except ValueError:
+                    continue
+                future = pool.submit(
+                    _refresh_card, vps, valuations[vps.id], config, safe_name, today
+                )
+                futures[future] = vps.name
+            for future in as_completed(futures):
+                try:
+                    report[future.result()] += 1
+                except Exception:
+                    logger.exception("Failed to refresh card %s", futures[future])
+                    report["failed"] += 1
+    report["seconds"] = round(time.monotonic() - started, 3)
+    logger.info(
+        "Card refresh: %(rendered)d rendered, %(skipped)d skipped, "
+        "%(failed)d failed in %(seconds).3fs",
+        report,
+    )
+    return report
 
 
 def refresh_ip_info():
     with Session(engine) as db:
         vps_list = db.query(VPS).filter(VPS.ip_address != None).all()
-        for vps in vps_list:
-            ip = vps.ip_address
-            if ip:
-                ping_ip(ip)
-                ip_to_flag(ip)
-                ip_to_isp(ip)
+        ips = [vps.ip_address for vps in vps_list if vps.ip_address]
+        lookup_geo_many(ips, block=True)
+        probe_fleet(ips, force=True)
+
+
+scheduler = None
 
 
-scheduler = BackgroundScheduler(timezone="Asia/Shanghai")
-scheduler.add_job(refresh_images, "cron", hour=0, minute=0)
-scheduler.add_job(refresh_ip_info, "interval", minutes=10)
-scheduler.start()
+def start_scheduler():
+    """Start the background jobs once per process."""
+    global scheduler
+    if scheduler is not None:
+        return scheduler
+    from apscheduler.schedulers.background import BackgroundScheduler
 
+    scheduler = BackgroundScheduler(timezone="Asia/Shanghai")
+    scheduler.add_job(refresh_images, "cron", hour=0, minute=0)
+    scheduler.add_job(refresh_ip_info, "interval", minutes=10)
+    scheduler.add_job(refresh_valuations, "interval", minutes=VALUATION_REFRESH_MINUTES)
+    scheduler.add_job(flush_visits, "interval", seconds=VISIT_FLUSH_SECONDS)
+    scheduler.add_job(flush_latency, "interval", seconds=LATENCY_FLUSH_SECONDS)
+    scheduler.start()
+    return scheduler
 
-@app.route("/robots.txt")
+
+@bp.route("/robots.txt")
 def robots_txt():
     lines = [
         "User-agent: *",
@@ -399,7 +647,7 @@ def robots_txt():
     return Response("\n".join(lines), mimetype="text/plain")
 
 
-@app.route("/register", methods=["GET", "POST"])
+@bp.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
         username = request.form["username"]
@@ -423,11 +671,11 @@ def register():
             db.add(user)
             db.commit()
             session["user_id"] = user.id
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
     return render_template("register.html")
 
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         username = request.form["username"]
@@ -437,17 +685,17 @@ def login():
             if not user or not check_password_hash(user.password_hash, password):
                 return "Invalid credentials", 400
             session["user_id"] = user.id
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
     return render_template("login.html")
 
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     session.clear()
-    return redirect(url_for("index"))
+    return redirect(url_for("main.index"))
 
 
-@app.route("/admin/users", methods=["GET", "POST"])
+@bp.route("/admin/users", methods=["GET", "POST"])
 @admin_required
 def manage_users():
     with Session(engine) as db:
@@ -479,6 +727,7 @@ def manage_users():
                         )
                     )
                 db.commit()
+                invalidate_site_cache("config")
             else:
                 user_id = int(request.form.get("user_id"))
                 user = db.get(User, user_id)
@@ -488,6 +737,7 @@ def manage_users():
                     elif action == "toggle_admin":
                         user.is_admin = not user.is_admin
                     db.commit()
+                    g.pop("current_user", None)
         users = db.query(User).all()
         invite_obj = db.query(InviteCode).first()
         invite_code = invite_obj.code if invite_obj else ""
@@ -497,7 +747,7 @@ def manage_users():
     )
 
 
-@app.route("/vps/new", methods=["GET", "POST"])
+@bp.route("/vps/new", methods=["GET", "POST"])
 @login_required
 def add_vps():
     if request.method == "POST":
@@ -534,15 +784,15 @@ def add_vps():
             )
             db.add(vps)
             db.commit()
-            invalidate_vps_cache()
             config = db.query(SiteConfig).first()
-            data = calculate_remaining(vps)
+            data = refresh_valuations([vps])[vps.id]
+            invalidate_vps_cache(vps.id)
             generate_svg(vps, data, config, safe_name=safe_name)
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
     return render_template("add_vps.html", vps_data=build_vps_form_data())
 
 
-@app.route("/manage")
+@bp.route("/manage")
 @login_required
 def manage_vps():
     with Session(engine) as db:
@@ -553,11 +803,11 @@ def manage_vps():
             if config and config.site_url:
                 vps.abs_url = f"{config.site_url.rstrip('/')}/{quote(vps.name)}.svg"
             else:
-                vps.abs_url = url_for("get_vps_image", name=vps.name, _external=True)
+                vps.abs_url = url_for("main.get_vps_image", name=vps.name, _external=True)
     return render_template("manage_vps.html", vps_list=vps_list)
 
 
-@app.route("/vps/<int:vps_id>/edit", methods=["GET", "POST"])
+@bp.route("/vps/<int:vps_id>/edit", methods=["GET", "POST"])
 @login_required
 def edit_vps(vps_id: int):
     with Session(engine) as db:
@@ -594,74 +844,294 @@ def edit_vps(vps_id: int):
             vps.push_fee = float(form.get("push_fee") or 0.0)
             vps.push_fee_currency = form.get("push_fee_currency")
             db.commit()
-            invalidate_vps_cache()
             config = db.query(SiteConfig).first()
-            data = calculate_remaining(vps)
+            data = refresh_valuations([vps])[vps.id]
+            invalidate_vps_cache(vps.id)
             generate_svg(vps, data, config, safe_name=safe_name)
-            return redirect(url_for("manage_vps"))
+            return redirect(url_for("main.manage_vps"))
         return render_template("add_vps.html", vps_data=build_vps_form_data(vps))
 
 
-@app.route("/vps/<int:vps_id>/delete", methods=["POST"])
+@bp.route("/vps/<int:vps_id>/delete", methods=["POST"])
 @login_required
 def delete_vps(vps_id: int):
     with Session(engine) as db:
         vps = db.get(VPS, vps_id)
         if vps:
+            delete_valuation(db, vps.id)
             db.delete(vps)
             db.commit()
-            invalidate_vps_cache()
-    return redirect(url_for("manage_vps"))
+            invalidate_vps_cache(vps_id)
+    return redirect(url_for("main.manage_vps"))
 
 
-@app.route("/")
-@app.route("/probe")
+@bp.route("/")
+@bp.route("/probe")
 def index():
     """Initial probe page that runs network diagnostics before showing the VPS list."""
     return render_template("probe.html")
 
 
-@app.route("/vps")
+def _load_vps_filters():
+    with Session(read_engine) as db:
+        return filter_options(db)
+
+
+# Rows valued per query when a filtered page is built
+VPS_STREAM_CHUNK = int(os.environ.get("VPS_STREAM_CHUNK", "20"))
+
+
+def iter_vps_page(page, filters=None, sort=DEFAULT_SORT, after=None, limit=VPS_PAGE_SIZE):
+    """Yield one page of list rows; ``page["next"]`` is set once they run out.
+
+    The default, unfiltered order is paged from the cached list.  Other
+    views are filtered, sorted and paged in SQL, ``VPS_STREAM_CHUNK`` rows
+    per query, and no session is held while rows are consumed.
+    """
+    page["next"] = None
+    if not filters and sort == DEFAULT_SORT:
+        rows, key = page_rows(get_vps_data(), after, limit)
+        page["next"] = encode_cursor(key) if key else None
+        yield from rows
+        return
+    # SQL orders by the stored valuations; bring them up to today first
+    refresh_stale_valuations()
+    remaining = limit
+    while remaining:
+        with Session(read_engine) as db:
+            vps_list, key = query_page(db, filters, sort, after, min(VPS_STREAM_CHUNK, remaining))
+            rows = _vps_rows(db, vps_list, network=False)
+        yield from rows
+        if key is None:
+            return
+        remaining -= len(rows)
+        after = key
+    page["next"] = encode_cursor(after)
+
+
+def get_vps_page(**params):
+    """Return one page of list rows and the cursor of the next page."""
+    page = {}
+    rows = list(iter_vps_page(page, **params))
+    return rows, page["next"]
+
+
+@bp.route("/vps")
 def vps_list():
-    vps_data = get_vps_data()
-    return render_template("vps.html", vps_data=vps_data)
+    try:
+        params = parse_list_args(request.args)
+    except ValueError as exc:
+        abort(400, description=str(exc))
+    args = request.args.to_dict(flat=False)
+    args.pop("after", None)
+    page = {}
+    vps_data = iter_vps_page(page, **params)
+    # Streaming flushes the head and the first cards before the rest of
+    # the page is valued; the pager is rendered once the rows run out
+    if current_app.config["STREAM_VPS_LIST"]:
+        render = stream_template
+    else:
+        render = render_template
+        vps_data = list(vps_data)
+    return render(
+        "vps.html",
+        vps_data=vps_data,
+        page=page,
+        page_args=args,
+        params=params,
+        sorts=SORTS,
+        filter_options=cached_site_value("vps_filters", _load_vps_filters),
+    )
 
 
-@app.route("/ping/<path:ip>")
+@bp.route("/ping/<path:ip>")
 def ping_status(ip: str):
     return ping_ip(ip)
 
 
-@app.route("/traceroute/<path:ip>")
+def _start_traceroute_job(target: str):
+    try:
+        return start_traceroute(target)
+    except ValueError:
+        abort(400, description="target must be an IP address")
+    except TracerouteBusy:
+        abort(429, description="too many traceroutes are running")
+
+
+@bp.route("/traceroute/<path:ip>")
 def traceroute_status(ip: str):
-    """Return traceroute output for ``ip``."""
-    return traceroute_ip(ip)
+    """Return traceroute output for ``ip`` once its job has finished.
 
+    Kept for old clients; new ones start a job and follow its events.
+    """
+    job = _start_traceroute_job(ip)
+    job.wait(TRACEROUTE_TIMEOUT + 5)
+    return Response("\n".join(job.lines), mimetype="text/plain")
+
+
+@bp.route("/traceroute/jobs", methods=["POST"])
+def traceroute_start():
+    """Start or reuse a traceroute job for the form or JSON ``target``."""
+    target = request.form.get("target") or (request.get_json(silent=True) or {}).get("target")
+    job = _start_traceroute_job(str(target or ""))
+    body = job.to_dict()
+    body["events"] = url_for("main.traceroute_events", job_id=job.id)
+    return jsonify(body), 202
 
-@app.route("/speedtest")
+
+@bp.route("/traceroute/jobs/<job_id>")
+def traceroute_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
+
+
+@bp.route("/traceroute/jobs/<job_id>/events")
+def traceroute_events(job_id: str):
+    """Stream a job's output as Server-Sent Events, one ``hop`` per line.
+
+    A ``done`` event carries the final status.  Reconnecting clients
+    resume after ``Last-Event-ID``.
+    """
+    job = get_job(job_id)
+    if job is None:
+        abort(404)
+    last = request.headers.get("Last-Event-ID", "")
+    start = int(last) + 1 if last.isdigit() else 0
+
+    def events():
+        for item in job.follow(start):
+            if item is None:
+                yield ": keepalive\n\n"
+                continue
+            index, line = item
+            data = json.dumps({"hop": parse_hop(line), "line": line}, ensure_ascii=False)
+            yield f"id: {index}\nevent: hop\ndata: {data}\n\n"
+        yield f"event: done\ndata: {json.dumps({'status': job.status})}\n\n"
+
+    response = Response(events(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Keep reverse proxies from buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@bp.route("/speedtest")
 def speedtest_view():
     """Run a network speed test and return simplified results."""
     return jsonify(run_speedtest())
 
 
-@app.route("/ipinfo/<path:ip>")
+@bp.route("/ipinfo/<path:ip>")
 def ip_info(ip: str):
     """Return flag emoji and ISP name for ``ip``."""
     return jsonify({"flag": ip_to_flag(ip), "isp": ip_to_isp(ip)})
 
 
-@app.route("/vps/<string:name>")
+@bp.route("/api/latency/<int:vps_id>")
+def latency_api(vps_id: int):
+    """Return hourly RTT stats, uptime and recent samples for a VPS."""
+    hours = min(max(request.args.get("hours", 24, type=int), 1), 24 * LATENCY_RETENTION_DAYS)
+    with Session(read_engine) as db:
+        vps = db.get(VPS, vps_id)
+        if not vps or not vps.dynamic_svg:
+            abort(404)
+        ip = vps.ip_address
+    series = latency_series(ip, hours) if ip else {"hourly": [], "uptime": None}
+    return jsonify({
+        "vps_id": vps_id,
+        "hours": hours,
+        "uptime": series["uptime"],
+        "hourly": [
+            dict(bucket, hour=bucket["hour"].isoformat() + "Z")
+            for bucket in series["hourly"]
+        ],
+        "recent": [
+            {"time": stamp, "rtt_ms": rtt} for stamp, rtt in recent_samples(ip)
+        ] if ip else [],
+    })
+
+
+# Rows fetched per round trip when streaming the fleet as NDJSON
+API_STREAM_CHUNK = int(os.environ.get("API_STREAM_CHUNK", "200"))
+
+
+def _api_response(payload, db, vps_list):
+    """Return ``payload`` as JSON, or 304 if the client's copy is current."""
+    response = jsonify(payload)
+    response.add_etag()
+    response.last_modified = last_modified(db, vps_list)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def _stream_records(params, fields):
+    """Yield NDJSON lines for every matching VPS after ``params["after"]``.
+
+    Rows are read from the cursor ``API_STREAM_CHUNK`` at a time and
+    released after each chunk, so memory does not grow with the fleet.
+    """
+    # As in iter_vps_page, the order comes from the stored valuations
+    refresh_stale_valuations()
+    with Session(read_engine) as db:
+        query = list_query(db, params["filters"], params["sort"], params["after"])
+        result = db.execute(query.statement, execution_options={"yield_per": API_STREAM_CHUNK})
+        for chunk in result.partitions():
+            for row in _vps_rows(db, [row[0] for row in chunk], network=False):
+                record = project(vps_record(*row), fields)
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+            db.expunge_all()
+
+
+@bp.route("/api/vps")
+def vps_api_list():
+    """Return a page of VPS records; ``format=ndjson`` streams all of them.
+
+    Takes the ``/vps`` filter, sort and paging parameters plus ``fields``.
+    NDJSON exports ignore ``limit``.
+    """
+    try:
+        params = parse_list_args(request.args)
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as exc:
+        abort(400, description=str(exc))
+    ndjson = "application/x-ndjson"
+    wanted = request.accept_mimetypes.best_match(["application/json", ndjson])
+    if request.args.get("format") == "ndjson" or wanted == ndjson:
+        return Response(stream_with_context(_stream_records(params, fields)), mimetype=ndjson)
+    rows, cursor = get_vps_page(**params)
+    payload = {"items": [project(vps_record(*row), fields) for row in rows], "next": cursor}
+    with Session(read_engine) as db:
+        return _api_response(payload, db, [row[0] for row in rows])
+
+
+@bp.route("/api/vps/<int:vps_id>")
+def vps_api_detail(vps_id: int):
+    try:
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as exc:
+        abort(400, description=str(exc))
+    with Session(read_engine) as db:
+        vps = db.get(VPS, vps_id)
+        if not vps:
+            abort(404)
+        row = _vps_rows(db, [vps], network=False)[0]
+        return _api_response(project(vps_record(*row), fields), db, [vps])
+
+
+@bp.route("/vps/<string:name>")
 def view_vps(name: str):
     try:
         validate_vps_name(name)
     except ValueError:
         abort(404)
-    with Session(engine) as db:
+    with Session(read_engine) as db:
         vps = db.query(VPS).filter(VPS.name == name).first()
         if not vps or not vps.dynamic_svg:
             abort(404)
         config = db.query(SiteConfig).first()
-        data = calculate_remaining(vps)
+        data = get_valuations(db, [vps])[vps.id]
         specs = parse_instance_config(vps.instance_config)
         ip_info = {
             "ip_display": mask_ip(vps.ip_address) if vps.ip_address else "-",
@@ -680,7 +1150,7 @@ def view_vps(name: str):
     if config and config.site_url:
         svg_abs_url = f"{config.site_url.rstrip('/')}/{quote(name)}.svg"
     else:
-        svg_abs_url = url_for("get_vps_image", name=name, _external=True)
+        svg_abs_url = url_for("main.get_vps_image", name=name, _external=True)
     return render_template(
         "view_svg.html",
         name=name,
@@ -696,33 +1166,82 @@ def view_vps(name: str):
     )
 
 
-@app.route("/vps/<string:name>.svg")
+@bp.route("/vps/<string:name>.svg")
 def get_vps_image(name: str):
     try:
         validate_vps_name(name)
     except ValueError:
         abort(404)
-    with Session(engine) as db:
+    with Session(read_engine) as db:
         vps = db.query(VPS).filter(VPS.name == name).first()
         if not vps or not vps.dynamic_svg:
             abort(404)
         config = db.query(SiteConfig).first()
-        data = calculate_remaining(vps)
+        data = get_valuations(db, [vps])[vps.id]
         try:
             safe_name = validate_vps_name(vps.name)
         except ValueError:
             abort(404)
-        svg_path = generate_svg(vps, data, config, safe_name=safe_name)
-        directory = svg_path.parent
-        # Dynamic SVGs change frequently; disable caching
-        return send_from_directory(
-            directory,
-            svg_path.name,
-            mimetype="image/svg+xml",
-            max_age=0,
-        )
+        ip_info = build_ip_info(vps)
+        today = date.today()
+        etag = svg_cache_key(vps, data, config, ip_info, today)
+        if any(tag.split(":")[0] == etag for tag in request.if_none_match):
+            response = Response(status=304)
+        else:
+            _, content = render_svg(vps, data, config, ip_info, today)
+            response = Response(content, mimetype="image/svg+xml")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = svg_max_age()
+    return response
+
+
+def svg_max_age() -> int:
+    """Seconds a card may be cached: ``SVG_MAX_AGE`` capped at midnight.
+
+    Cards show today's date and remaining days, so they always change at
+    midnight; online status and rates change within ``SVG_MAX_AGE``.
+    """
+    now = datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(min(SVG_MAX_AGE, int((midnight - now).total_seconds())), 0)
+
+
+def create_app(config=None):
+    """Build the Flask app and run the startup stages enabled in ``config``.
+
+    ``config`` overrides ``DEFAULT_CONFIG``.  Stages: ``RUN_MIGRATIONS``
+    brings the schema up to date and loads the last rate snapshot,
+    ``LOAD_EMOJI`` encodes the bundled Twemoji assets, ``SEED_SAMPLE`` adds the demo VPS, ``HASH_ASSETS`` computes the asset
+    version eagerly (otherwise on first render) and ``START_SCHEDULER``
+    starts the background jobs.
+    """
+    flask_app = Flask(__name__)
+    flask_app.config.update(DEFAULT_CONFIG)
+    flask_app.config.update(config or {})
+    Compress(flask_app)
+    flask_app.register_blueprint(bp)
+
+    if flask_app.config["RUN_MIGRATIONS"]:
+        run_migrations()
+        load_rate_snapshot()
+    if flask_app.config["LOAD_EMOJI"]:
+        load_emoji_assets()
+    if flask_app.config["SEED_SAMPLE"]:
+        init_sample()
+    if flask_app.config["HASH_ASSETS"] and not flask_app.config["ASSET_VERSION"]:
+        flask_app.config["ASSET_VERSION"] = compute_asset_version(flask_app.root_path)
+    if flask_app.config["START_SCHEDULER"]:
+        start_scheduler()
+    return flask_app
+
+
+app = create_app()
 
 
 if __name__ == "__main__":
+    app = create_app(
+        {"SEED_SAMPLE": True, "HASH_ASSETS": True, "START_SCHEDULER": True}
+    )
     refresh_images()
     app.run(host="0.0.0.0", port=8280)
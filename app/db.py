@@ -1,47 +1,113 @@
-from sqlalchemy import create_engine, inspect, text
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
 from pathlib import Path
+import os
 
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 DATA_DIR.mkdir(exist_ok=True)
 DATABASE_URL = f"sqlite:///{DATA_DIR / 'vps.db'}"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Storage profile applied to every new SQLite connection.  WAL lets readers
+# proceed while a writer commits, and busy_timeout makes a writer wait for
+# the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", "5000")),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Negative values are KiB, so -20000 is roughly 20 MB per connection
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", "-20000")),
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+}
+# Connections kept per engine; size this to the number of worker threads.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+
+
+def create_sqlite_engine(url: str, read_only: bool = False):
+    """Create a pooled engine that applies ``SQLITE_PRAGMAS`` on connect.
+
+    ``read_only`` engines set ``query_only`` so public pages can never
+    write through them.
+    """
+    new_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+    )
+
+    @event.listens_for(new_engine, "connect")
+    def _apply_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        try:
+            for name, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            if read_only:
+                cursor.execute("PRAGMA query_only=ON")
+        finally:
+            cursor.close()
+
+    return new_engine
+
+
+engine = create_sqlite_engine(DATABASE_URL)
+# Separate pool for the public read paths, so page views never queue
+# behind writers for a connection.
+read_engine = create_sqlite_engine(DATABASE_URL, read_only=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False)
 Base = declarative_base()
 
 
-def _run_migrations():
-    """Minimal schema migrations for existing databases."""
-    inspector = inspect(engine)
-    if "vps" in inspector.get_table_names():
+# Ordered schema migrations: ``(version, function(conn))``.  A database
+# records the last applied version in ``schema_version``; pending steps
+# run in a single transaction.  Append new steps with the next version.
+MIGRATIONS = []
+
+
+def migration(version: int):
+    def register(func):
+        MIGRATIONS.append((version, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+
+    return register
+
+
+@migration(1)
+def _baseline(conn):
+    """Create missing tables and upgrade databases from before versioning."""
+    inspector = inspect(conn)
+    tables = inspector.get_table_names()
+    if "vps" in tables:
         columns = [col["name"] for col in inspector.get_columns("vps")]
         if "transaction_date" not in columns:
-            with engine.begin() as conn:
-                conn.execute(text("ALTER TABLE vps ADD COLUMN transaction_date DATE"))
-                # Infer the transaction date from expiry_date and renewal_days
-                conn.execute(
-                    text(
-                        """
-                        UPDATE vps
-                        SET transaction_date = DATE(expiry_date, '-' || renewal_days || ' day')
-                        WHERE expiry_date IS NOT NULL AND renewal_days IS NOT NULL
-                        """
-                    )
+            conn.execute(text("ALTER TABLE vps ADD COLUMN transaction_date DATE"))
+            # Infer the transaction date from expiry_date and renewal_days
+            conn.execute(
+                text(
+                    """
+                    UPDATE vps
+                    SET transaction_date = DATE(expiry_date, '-' || renewal_days || ' day')
+                    WHERE expiry_date IS NOT NULL AND renewal_days IS NOT NULL
+                    """
                 )
+            )
         if "expiry_date" not in columns:
-            with engine.begin() as conn:
-                conn.execute(text("ALTER TABLE vps ADD COLUMN expiry_date DATE"))
-                # Infer the expiry date from transaction_date and renewal_days
-                conn.execute(
-                    text(
-                        """
-                        UPDATE vps
-                        SET expiry_date = DATE(transaction_date, '+' || renewal_days || ' day')
-                        WHERE expiry_date IS NULL AND transaction_date IS NOT NULL AND renewal_days IS NOT NULL
-                        """
-                    )
+            conn.execute(text("ALTER TABLE vps ADD COLUMN expiry_date DATE"))
+            # Infer the expiry date from transaction_date and renewal_days
+            conn.execute(
+                text(
+                    """
+                    UPDATE vps
+                    SET expiry_date = DATE(transaction_date, '+' || renewal_days || ' day')
+                    WHERE expiry_date IS NULL AND transaction_date IS NOT NULL AND renewal_days IS NOT NULL
+                    """
                 )
+            )
 
         # Add any new optional columns introduced after initial release
         optional_columns = {
@@ -66,44 +132,129 @@ def _run_migrations():
         }
         for column, definition in optional_columns.items():
             if column not in columns:
-                with engine.begin() as conn:
-                    conn.execute(text(f"ALTER TABLE vps ADD COLUMN {column} {definition}"))
+                conn.execute(text(f"ALTER TABLE vps ADD COLUMN {column} {definition}"))
 
     # Ensure created_at exists in users table
-    if "users" in inspector.get_table_names():
+    if "users" in tables:
         columns = [col["name"] for col in inspector.get_columns("users")]
         if "created_at" not in columns:
-            with engine.begin() as conn:
-                conn.execute(text("ALTER TABLE users ADD COLUMN created_at DATETIME"))
-                conn.execute(
-                    text(
-                        "UPDATE users SET created_at = DATETIME('now','start of hour') WHERE created_at IS NULL"
-                    )
+            conn.execute(text("ALTER TABLE users ADD COLUMN created_at DATETIME"))
+            conn.execute(
+                text(
+                    "UPDATE users SET created_at = DATETIME('now','start of hour') WHERE created_at IS NULL"
                 )
+            )
 
     # Ensure new fields in site_config table are present
-    if "site_config" in inspector.get_table_names():
+    if "site_config" in tables:
         columns = [col["name"] for col in inspector.get_columns("site_config")]
         if "copyright" not in columns:
-            with engine.begin() as conn:
-                conn.execute(text("ALTER TABLE site_config ADD COLUMN copyright TEXT"))
+            conn.execute(text("ALTER TABLE site_config ADD COLUMN copyright TEXT"))
         if "site_url" not in columns:
-            with engine.begin() as conn:
-                conn.execute(text("ALTER TABLE site_config ADD COLUMN site_url TEXT"))
-                if "image_base_url" in columns:
-                    conn.execute(
-                        text("UPDATE site_config SET site_url = image_base_url"),
-                    )
+            conn.execute(text("ALTER TABLE site_config ADD COLUMN site_url TEXT"))
+            if "image_base_url" in columns:
+                conn.execute(
+                    text("UPDATE site_config SET site_url = image_base_url"),
+                )
         if "username" not in columns:
-            with engine.begin() as conn:
-                conn.execute(text("ALTER TABLE site_config ADD COLUMN username TEXT"))
-                if "noodseek_id" in columns:
-                    conn.execute(
-                        text("UPDATE site_config SET username = noodseek_id"),
-                    )
+            conn.execute(text("ALTER TABLE site_config ADD COLUMN username TEXT"))
+            if "noodseek_id" in columns:
+                conn.execute(
+                    text("UPDATE site_config SET username = noodseek_id"),
+                )
 
+    Base.metadata.create_all(bind=conn)
 
-_run_migrations()
+
+@migration(2)
+def _default_rows(conn):
+    """Insert the default invite code and site config rows."""
+    conn.execute(
+        text(
+            "INSERT INTO invite_code (code) SELECT 'Flanker' "
+            "WHERE NOT EXISTS (SELECT 1 FROM invite_code)"
+        )
+    )
+    conn.execute(
+        text(
+            "INSERT INTO site_config (site_url, username, copyright) "
+            "SELECT '', '@Flanker', 'xxx.com' "
+            "WHERE NOT EXISTS (SELECT 1 FROM site_config)"
+        )
+    )
+
+
+@migration(3)
+def _ip_metadata(conn):
+    """Add the persistent IP metadata cache."""
+    Base.metadata.tables["ip_metadata"].create(conn, checkfirst=True)
+
+
+@migration(4)
+def _latency(conn):
+    """Add the latency sample and hourly rollup tables."""
+    Base.metadata.tables["latency_samples"].create(conn, checkfirst=True)
+    Base.metadata.tables["latency_hourly"].create(conn, checkfirst=True)
+
+
+@migration(5)
+def _vps_changes(conn):
+    """Add the VPS change log used to update cached lists."""
+    Base.metadata.tables["vps_changes"].create(conn, checkfirst=True)
+
+
+@migration(6)
+def _vps_list_indexes(conn):
+    """Index the columns the public list filters on."""
+    for index in Base.metadata.tables["vps"].indexes:
+        index.create(conn, checkfirst=True)
+
+
+def schema_version(conn) -> int:
+    """Return the applied schema version, ``0`` for an unversioned database."""
+    try:
+        return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    except OperationalError:
+        return 0
+
+
+def run_migrations(bind=None) -> int:
+    """Bring the database schema up to date and return its version.
+
+    When the schema is current this costs a single read.  Otherwise the
+    write lock is taken up front (``BEGIN IMMEDIATE``) so concurrent
+    workers wait for each other instead of racing on DDL, and every
+    pending step is applied in one transaction.
+    """
+    from . import models  # noqa: F401  register tables on Base.metadata
+
+    bind = bind or engine
+    latest = MIGRATIONS[-1][0]
+    with bind.connect() as conn:
+        current = schema_version(conn)
+        conn.rollback()
+        if current >= latest:
+            return current
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            conn.exec_driver_sql(
+                "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"
+            )
+            current = schema_version(conn)
+            for version, step in MIGRATIONS:
+                if version > current:
+                    step(conn)
+            if current < latest:
+                conn.exec_driver_sql("DELETE FROM schema_version")
+                conn.execute(
+                    text("INSERT INTO schema_version (version) VALUES (:v)"),
+                    {"v": latest},
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return max(current, latest)
 
 
 def get_db():
@@ -0,0 +1,115 @@
+"""Local Twemoji store for the emoji shown on VPS cards.
+
+Emoji SVGs live in ``static/twemoji`` as ``<code points>.svg`` and are
+encoded to base64 ``data:`` URIs once, when the store is loaded.  SVG
+rendering only reads from memory and never touches the network; missing
+emoji render blank until they are added with ``python cli.py emoji``.
+"""
+
+from pathlib import Path
+import base64
+import string
+import threading
+
+import requests
+
+EMOJI_DIR = Path(__file__).resolve().parent.parent / "static" / "twemoji"
+TWEMOJI_BASE = "https://cdnjs.cloudflare.com/ajax/libs/twemoji/14.0.2/svg"
+# Emoji the app itself emits besides country flags: status dots and the
+# fallback flag for unknown IPs
+STATUS_EMOJI = ("🟢", "🔴", "🏳\ufe0f")
+
+_data_uris = {}
+_loaded = False
+_lock = threading.Lock()
+
+
+def emoji_code(emoji: str) -> str:
+    """Return the Twemoji file name (without ``.svg``) for ``emoji``.
+
+    Twemoji drops the U+FE0F variation selector except in ZWJ sequences.
+    """
+    if "\u200d" not in emoji:
+        emoji = emoji.replace("\ufe0f", "")
+    return "-".join(f"{ord(c):x}" for c in emoji)
+
+
+def _encode(svg: bytes) -> str:
+    return "data:image/svg+xml;base64," + base64.b64encode(svg).decode("ascii")
+
+
+def load_emoji_assets(directory: Path = None) -> int:
+    """Load and encode every emoji SVG in ``directory``; return the count."""
+    global _loaded
+    directory = Path(directory or EMOJI_DIR)
+    uris = {}
+    if directory.is_dir():
+        for path in directory.glob("*.svg"):
+            uris[path.stem] = _encode(path.read_bytes())
+    with _lock:
+        _data_uris.clear()
+        _data_uris.update(uris)
+        _loaded = True
+    return len(uris)
+
+
+def has_emoji(emoji: str) -> bool:
+    if not _loaded:
+        load_emoji_assets()
+    return emoji_code(emoji) in _data_uris
+
+
+def twemoji_url(emoji: str) -> str:
+    """Return a data URI embedding the Twemoji SVG for ``emoji``.
+
+    Some forums block external image loads inside pasted SVGs. By
+    inlining the emoji as a base64 ``data:`` URI, the generated SVG is
+    self-contained and renders correctly when copied elsewhere.
+    """
+    if not emoji:
+        return ""
+    if not _loaded:
+        load_emoji_assets()
+    return _data_uris.get(emoji_code(emoji), "")
+
+
+def flag_emoji():
+    """Return the flag emoji for every two-letter region code.
+
+    Not every pair is an assigned region; ``build_emoji_assets`` skips the
+    ones Twemoji has no image for.
+    """
+    letters = string.ascii_uppercase
+    return [
+        chr(0x1F1E6 + letters.index(a)) + chr(0x1F1E6 + letters.index(b))
+        for a in letters
+        for b in letters
+    ]
+
+
+def build_emoji_assets(directory: Path = None, emojis=None, base: str = TWEMOJI_BASE):
+    """Download emoji SVGs into ``directory`` and reload the store.
+
+    Already present files are kept.  Returns ``(written, missing)`` lists
+    of emoji; ``missing`` are those the CDN has no image for.
+    """
+    directory = Path(directory or EMOJI_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    if emojis is None:
+        emojis = list(STATUS_EMOJI) + flag_emoji()
+    written, missing = [], []
+    with requests.Session() as http:
+        for emoji in emojis:
+            code = emoji_code(emoji)
+            path = directory / f"{code}.svg"
+            if path.exists():
+                continue
+            resp = http.get(f"{base}/{code}.svg", timeout=10)
+            if resp.status_code == 404:
+                missing.append(emoji)
+                continue
+            resp.raise_for_status()
+            path.write_bytes(resp.content)
+            written.append(emoji)
+    load_emoji_assets(directory)
+    return written, missing
@@ -0,0 +1,208 @@
+"""Country and network lookups for VPS addresses.
+
+Addresses are resolved from the local range database (``app.ipdb``)
+first.  Anything it does not cover, or covers without a country or a
+network name, falls back to ip-api.com unless ``GEO_HTTP_FALLBACK=0``:
+one request returns the country code, ISP, organisation and AS number
+of an IP, cache misses are grouped into ``/batch`` requests of up to 100
+addresses, and requests pause when ip-api reports the rate limit is used
+up (``X-Rl``/``X-Ttl`` headers) instead of failing every lookup.
+"""
+
+import ipaddress
+import os
+import re
+import time
+from datetime import timezone
+
+import requests
+
+from .ipdb import lookup_offline
+from .ipmeta import IP_CACHE_SIZE, LRUCache, load_geo, store_geo
+
+GEO_API = "http://ip-api.com"
+GEO_FIELDS = "status,countryCode,isp,org,as,query"
+# Seconds a lookup result is reused, and before a failed lookup is retried.
+# Results are persisted in ip_metadata, so they survive restarts.
+GEO_TTL = int(os.environ.get("GEO_TTL", "86400"))
+GEO_RETRY = int(os.environ.get("GEO_RETRY", "60"))
+# ip-api accepts at most 100 addresses per batch request
+GEO_BATCH_SIZE = 100
+# Query ip-api for addresses the local database does not cover
+GEO_HTTP_FALLBACK = os.environ.get("GEO_HTTP_FALLBACK", "1").lower() not in ("0", "false", "no")
+
+EMPTY_GEO = {"country_code": "", "isp": "", "org": "", "as": ""}
+
+_geo_cache = LRUCache(IP_CACHE_SIZE)
+# time.time() before which ip-api should not be called
+_paused_until = 0.0
+
+_IPV4 = re.compile(r"(?:\d{1,3}\.){3}\d{1,3}")
+_IPV6 = re.compile(r"[0-9A-Fa-f:.]*:[0-9A-Fa-f:.]*")
+
+
+def extract_ip(value: str):
+    """Return the first IP address in ``value`` or ``None``.
+
+    Stored addresses may carry emoji, comments or a port, e.g.
+    "🏳️ 160.1.2.3:22" or "[2001:db8::1]:22".  IPv4 is preferred.
+    """
+    match = _IPV4.search(value or "")
+    if match:
+        return match.group(0)
+    for token in _IPV6.findall(value or ""):
+        try:
+            return str(ipaddress.IPv6Address(token))
+        except ValueError:
+            continue
+    return None
+
+
+def country_flag(code: str) -> str:
+    """Return the regional-indicator flag for a two-letter country code."""
+    if code and len(code) == 2 and code.isalpha():
+        code = code.upper()
+        return chr(ord(code[0]) + 127397) + chr(ord(code[1]) + 127397)
+    return "🏳️"
+
+
+def _parse(data: dict) -> dict:
+    code = data.get("countryCode") or data.get("country_code") or ""
+    return {
+        "country_code": code if len(code) == 2 and code.isalpha() else "",
+        "isp": data.get("isp") or "",
+        "org": data.get("org") or "",
+        "as": data.get("as") or "",
+    }
+
+
+def _note_rate_limit(resp) -> None:
+    """Pause lookups when ip-api says the current window is used up."""
+    global _paused_until
+    headers = getattr(resp, "headers", None) or {}
+    status = getattr(resp, "status_code", 200)
+    remaining = headers.get("X-Rl")
+    reset = headers.get("X-Ttl")
+    if status == 429 or remaining == "0":
+        wait = int(reset) if reset and reset.isdigit() else GEO_RETRY
+        _paused_until = max(_paused_until, time.time() + wait)
+
+
+def _wait_for_quota(block: bool) -> bool:
+    """Return True once ip-api may be called; sleep only when ``block``."""
+    delay = _paused_until - time.time()
+    if delay <= 0:
+        return True
+    if not block:
+        return False
+    time.sleep(delay)
+    return True
+
+
+def _fetch_one(ip: str) -> dict:
+    resp = requests.get(f"{GEO_API}/json/{ip}?fields={GEO_FIELDS}", timeout=5)
+    _note_rate_limit(resp)
+    return _parse(resp.json())
+
+
+def _fetch_batch(ips) -> dict:
+    resp = requests.post(
+        f"{GEO_API}/batch?fields={GEO_FIELDS}",
+        json=list(ips),
+        timeout=10,
+    )
+    _note_rate_limit(resp)
+    resp.raise_for_status()
+    return {item.get("query"): _parse(item) for item in resp.json()}
+
+
+def _cached(ip: str, now: float):
+    hit = _geo_cache.get(ip)
+    if hit and now < hit[0]:
+        return hit[1]
+    return None
+
+
+def reset_geo_cache() -> None:
+    """Forget lookups cached in this process; ``ip_metadata`` is kept."""
+    _geo_cache.clear()
+
+
+def _incomplete(geo: dict) -> bool:
+    return not geo["country_code"] or not (geo["isp"] or geo["org"])
+
+
+def _merge(offline: dict, fetched: dict) -> dict:
+    """Fill the empty fields of an offline record from an ip-api result."""
+    return {key: offline.get(key) or fetched.get(key, "") for key in EMPTY_GEO}
+
+
+def lookup_geo_many(values, block: bool = False, network: bool = True) -> dict:
+    """Return ``{value: geo}`` for addresses in ``values``.
+
+    Each ``geo`` dict has ``country_code``, ``isp``, ``org`` and ``as``
+    (empty strings when unknown).  Addresses missing from the in-process
+    cache are read from ``ip_metadata``; those also missing there and
+    from the local range database are fetched in one request when there is a single
+    miss, otherwise through ``/batch``.  Local records without a country
+    or ISP/organisation are fetched too, and the result fills their
+    empty fields.
+    When ip-api is rate limited, misses return empty results unless
+    ``block`` is set, in which case the call waits for the next window.
+    With ``network=False`` only local sources are used.
+    """
+    now = time.time()
+    ips = {value: extract_ip(value) for value in values}
+    found = {ip: _cached(ip, now) for ip in set(ips.values()) if ip}
+    stored = load_geo([ip for ip, geo in found.items() if geo is None])
+    for ip, (checked_at, ok, geo) in stored.items():
+        expires = checked_at.replace(tzinfo=timezone.utc).timestamp()
+        expires += GEO_TTL if ok else GEO_RETRY
+        if now < expires:
+            _geo_cache[ip] = (expires, geo)
+            found[ip] = geo
+    fallback = network and GEO_HTTP_FALLBACK
+    missing = []
+    # Offline records lacking a country or a network name, e.g. from a
+    # country-only or ASN-only dataset; ip-api fills in the gaps
+    partial = {}
+    for ip in sorted(ip for ip, geo in found.items() if geo is None):
+        found[ip] = lookup_offline(ip)
+        if found[ip] is None:
+            missing.append(ip)
+        elif fallback and _incomplete(found[ip]):
+            partial[ip] = found[ip]
+            missing.append(ip)
+    if not fallback:
+        missing = []
+
+    for start in range(0, len(missing), GEO_BATCH_SIZE):
+        chunk = missing[start:start + GEO_BATCH_SIZE]
+        if not _wait_for_quota(block):
+            break
+        try:
+            if len(chunk) == 1:
+                fetched = {chunk[0]: _fetch_one(chunk[0])}
+            else:
+                fetched = _fetch_batch(chunk)
+        except Exception:
+            fetched = {}
+        now = time.time()
+        for ip in chunk:
+            if ip in fetched:
+                if ip in partial:
+                    fetched[ip] = _merge(partial[ip], fetched[ip])
+                _geo_cache[ip] = (now + GEO_TTL, fetched[ip])
+            else:
+                _geo_cache[ip] = (now + GEO_RETRY, partial.get(ip, EMPTY_GEO))
+            found[ip] = _geo_cache[ip][1]
+        # A failed lookup of a partial record is retried from the offline
+        # record rather than stored as empty
+        store_geo({ip: fetched.get(ip) for ip in chunk if ip in fetched or ip not in partial})
+
+    return {value: found.get(ip) or EMPTY_GEO for value, ip in ips.items()}
+
+
+def lookup_geo(value: str) -> dict:
+    """Return the geo dict for a single address; see ``lookup_geo_many``."""
+    return lookup_geo_many([value])[value]
@@ -0,0 +1,227 @@
+"""Offline IP-range database for country and ASN lookups.
+
+A range dataset is compiled once into a flat binary file of fixed-size
+records sorted by range start, and looked up with ``bisect`` over a
+memory map.  The file is never copied onto the heap, so every worker
+process shares the same pages from the OS cache.
+
+Supported sources for ``compile_ipdb``:
+
+* ip2asn TSV (``start, end, asn, country, description``)
+* DB-IP lite CSV, country (``start, end, country``) or ASN
+  (``start, end, asn, organisation``)
+
+MaxMind-format ``.mmdb`` files are read directly when the optional
+``maxminddb`` package is installed.
+
+IPv4 addresses are stored as IPv4-mapped IPv6 so both families share one
+sorted table.  Keys are 16-byte big-endian strings, so comparing bytes
+orders addresses numerically.
+"""
+
+from bisect import bisect_right
+from pathlib import Path
+import csv
+import ipaddress
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from .db import DATA_DIR
+
+IPDB_PATH = Path(os.environ.get("IPDB_PATH", DATA_DIR / "ipdb.bin"))
+
+_MAGIC = b"IPDB"
+_VERSION = 1
+_HEADER = struct.Struct(">4sHI")  # magic, version, record count
+# start, end, asn, country, name offset, name length
+_RECORD = struct.Struct(">16s16sI2sIH")
+_V4_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+
+def _key(ip) -> bytes:
+    """Return the 16-byte sort key for an address object."""
+    if ip.version == 4:
+        return _V4_PREFIX + ip.packed
+    return ip.packed
+
+
+def _rows(path: Path):
+    """Yield ``(start, end, asn, country, name)`` from a CSV/TSV dataset."""
+    with open(path, newline="", encoding="utf-8") as fh:
+        sample = fh.read(4096)
+        fh.seek(0)
+        delimiter = "\t" if "\t" in sample else ","
+        for row in csv.reader(fh, delimiter=delimiter):
+            if len(row) < 3 or row[0].startswith("#"):
+                continue
+            try:
+                start = ipaddress.ip_address(row[0].strip())
+                end = ipaddress.ip_address(row[1].strip())
+            except ValueError:
+                continue  # header line
+            asn, country, name = 0, "", ""
+            if len(row) >= 5:  # ip2asn
+                asn, country, name = int(row[2] or 0), row[3], row[4]
+            elif len(row) == 4:  # DB-IP ASN
+                asn, name = int(row[2] or 0), row[3]
+            else:  # DB-IP country
+                country = row[2]
+            country = country.strip().upper()
+            if len(country) != 2 or not country.isalpha():
+                country = ""
+            if not asn and not country:
+                continue  # ip2asn marks unrouted space with AS 0 / "None"
+            yield _key(start), _key(end), asn, country, name.strip()
+
+
+def compile_ipdb(source: Path, out_path: Path = None) -> int:
+    """Compile a CSV/TSV range dataset into ``out_path``; return the row count."""
+    out_path = Path(out_path or IPDB_PATH)
+    rows = sorted(_rows(Path(source)))
+    names = {}
+    blob = bytearray()
+    records = bytearray()
+    for start, end, asn, country, name in rows:
+        if name not in names:
+            names[name] = (len(blob), len(name.encode("utf-8")))
+            blob += name.encode("utf-8")
+        offset, length = names[name]
+        records += _RECORD.pack(start, end, asn, country.encode("ascii") or b"  ", offset, length)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=out_path.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(_HEADER.pack(_MAGIC, _VERSION, len(rows)))
+        fh.write(records)
+        fh.write(blob)
+    os.replace(tmp, out_path)
+    if out_path == IPDB_PATH:
+        reset_ipdb()
+    return len(rows)
+
+
+class _Starts:
+    """Sequence view of the range starts, for ``bisect``."""
+
+    def __init__(self, mm, count):
+        self._mm = mm
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        offset = _HEADER.size + index * _RECORD.size
+        return self._mm[offset:offset + 16]
+
+
+class IPDatabase:
+    """Read-only, memory-mapped view of a compiled range file."""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a compiled IP database")
+        self._count = count
+        self._starts = _Starts(self._mm, count)
+        self._names = _HEADER.size + count * _RECORD.size
+
+    def __len__(self):
+        return self._count
+
+    def lookup(self, ip: str):
+        """Return the geo dict for ``ip`` or ``None`` when not covered."""
+        key = _key(ipaddress.ip_address(ip))
+        index = bisect_right(self._starts, key) - 1
+        if index < 0:
+            return None
+        _, end, asn, country, offset, length = _RECORD.unpack_from(
+            self._mm, _HEADER.size + index * _RECORD.size
+        )
+        if key > end:
+            return None
+        name = self._mm[self._names + offset:self._names + offset + length].decode("utf-8")
+        return {
+            "country_code": country.decode("ascii").strip(),
+            "isp": name,
+            "org": name,
+            "as": f"AS{asn} {name}".strip() if asn else "",
+        }
+
+    def close(self):
+        self._mm.close()
+
+
+class MMDBDatabase:
+    """Adapter for MaxMind-format files via the optional ``maxminddb``."""
+
+    def __init__(self, path: Path):
+        import maxminddb
+
+        self._reader = maxminddb.open_database(str(path), maxminddb.MODE_MMAP)
+
+    def lookup(self, ip: str):
+        record = self._reader.get(ip)
+        if not record:
+            return None
+        country = (record.get("country") or {}).get("iso_code") or record.get("country_code") or ""
+        asn = record.get("autonomous_system_number") or 0
+        name = record.get("autonomous_system_organization") or record.get("isp") or ""
+        return {
+            "country_code": country.upper(),
+            "isp": record.get("isp") or name,
+            "org": record.get("organization") or name,
+            "as": f"AS{asn} {name}".strip() if asn else "",
+        }
+
+    def close(self):
+        self._reader.close()
+
+
+_db = None
+_db_loaded = False
+_db_lock = threading.Lock()
+
+
+def open_ipdb(path: Path):
+    path = Path(path)
+    if path.suffix == ".mmdb":
+        return MMDBDatabase(path)
+    return IPDatabase(path)
+
+
+def get_ipdb():
+    """Return the database at ``IPDB_PATH``, or ``None`` if there is none."""
+    global _db, _db_loaded
+    if not _db_loaded:
+        with _db_lock:
+            if not _db_loaded:
+                try:
+                    _db = open_ipdb(IPDB_PATH) if IPDB_PATH.exists() else None
+                except (ImportError, OSError, ValueError):
+                    _db = None
+                _db_loaded = True
+    return _db
+
+
+def reset_ipdb() -> None:
+    """Reopen ``IPDB_PATH`` on the next lookup."""
+    global _db, _db_loaded
+    with _db_lock:
+        _db, _db_loaded = None, False
+
+
+def lookup_offline(ip: str):
+    """Return the geo dict for ``ip`` from the local database, if covered."""
+    db = get_ipdb()
+    if db is None:
+        return None
+    try:
+        return db.lookup(ip)
+    except ValueError:
+        return None
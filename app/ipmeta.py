@@ -0,0 +1,195 @@
+"""Persistent IP metadata cache.
+
+Geo lookups and ping statuses are stored in ``ip_metadata`` so every
+worker process, and a freshly restarted one, can serve enriched cards
+without querying anything again.  Each process keeps a small LRU
+(``IP_CACHE_SIZE`` entries) in front of the table.  The table keeps at
+most ``IP_METADATA_MAX_ROWS`` rows; the least recently updated ones are
+pruned first.  The row count is checked every ``IP_METADATA_PRUNE_EVERY``
+writes, so the table can briefly exceed the cap by that many rows.
+
+Persistence is best effort: if the database is unavailable, lookups
+behave like the in-memory cache alone.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+import os
+import threading
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from .db import engine
+from .models import IPMetadata
+
+IP_CACHE_SIZE = int(os.environ.get("IP_CACHE_SIZE", "1024"))
+IP_METADATA_MAX_ROWS = int(os.environ.get("IP_METADATA_MAX_ROWS", "10000"))
+# Writes between checks of the row count against IP_METADATA_MAX_ROWS
+IP_METADATA_PRUNE_EVERY = int(os.environ.get("IP_METADATA_PRUNE_EVERY", "100"))
+
+_MISSING = object()
+_writes = 0
+_writes_lock = threading.Lock()
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts the least recently used entry."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def _upsert(values: list, columns) -> None:
+    stmt = insert(IPMetadata).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[IPMetadata.ip],
+        set_={col: stmt.excluded[col] for col in columns},
+    )
+    global _writes
+    with _writes_lock:
+        check = _writes % IP_METADATA_PRUNE_EVERY == 0
+        _writes += 1
+    with engine.begin() as conn:
+        conn.execute(stmt)
+        if check:
+            _prune(conn)
+
+
+def _prune(conn) -> None:
+    """Delete the least recently updated rows beyond ``IP_METADATA_MAX_ROWS``."""
+    count = conn.execute(select(func.count()).select_from(IPMetadata)).scalar()
+    if count <= IP_METADATA_MAX_ROWS:
+        return
+    keep = (
+        select(IPMetadata.ip)
+        .order_by(IPMetadata.updated_at.desc())
+        .limit(IP_METADATA_MAX_ROWS)
+    )
+    conn.execute(delete(IPMetadata).where(IPMetadata.ip.not_in(keep)))
+
+
+def load_geo(ips) -> dict:
+    """Return ``{ip: (checked_at, ok, geo)}`` for stored geo lookups."""
+    if not ips:
+        return {}
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(IPMetadata).where(
+                    IPMetadata.ip.in_(list(ips)),
+                    IPMetadata.geo_checked_at.is_not(None),
+                )
+            ).all()
+    except SQLAlchemyError:
+        return {}
+    return {
+        row.ip: (
+            row.geo_checked_at,
+            bool(row.geo_ok),
+            {"country_code": row.country_code, "isp": row.isp, "org": row.org, "as": row.asn},
+        )
+        for row in rows
+    }
+
+
+def store_geo(results: dict) -> None:
+    """Persist ``{ip: geo or None}``; ``None`` records a failed lookup."""
+    if not results:
+        return
+    now = datetime.utcnow()
+    values = []
+    for ip, geo in results.items():
+        geo = geo or {}
+        values.append({
+            "ip": ip,
+            "country_code": geo.get("country_code", ""),
+            "isp": geo.get("isp", ""),
+            "org": geo.get("org", ""),
+            "asn": geo.get("as", ""),
+            "geo_ok": bool(geo),
+            "geo_checked_at": now,
+            "updated_at": now,
+        })
+    try:
+        _upsert(
+            values,
+            ["country_code", "isp", "org", "asn", "geo_ok", "geo_checked_at", "updated_at"],
+        )
+    except SQLAlchemyError:
+        pass
+
+
+def load_ping(ip: str):
+    """Return ``(checked_at, status)`` for the stored ping of ``ip`` or ``None``."""
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(
+                select(IPMetadata.ping_checked_at, IPMetadata.ping_status).where(
+                    IPMetadata.ip == ip,
+                    IPMetadata.ping_checked_at.is_not(None),
+                )
+            ).first()
+    except SQLAlchemyError:
+        return None
+    return tuple(row) if row else None
+
+
+def store_pings(statuses: dict) -> None:
+    """Persist ``{ip: status}`` in one transaction."""
+    if not statuses:
+        return
+    now = datetime.utcnow()
+    try:
+        _upsert(
+            [
+                {"ip": ip, "ping_status": status, "ping_checked_at": now, "updated_at": now}
+                for ip, status in statuses.items()
+            ],
+            ["ping_status", "ping_checked_at", "updated_at"],
+        )
+    except SQLAlchemyError:
+        pass
+
+
+def store_ping(ip: str, status: str) -> None:
+    store_pings({ip: status})
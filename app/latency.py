@@ -0,0 +1,226 @@
+"""Round-trip time history for probed addresses.
+
+Every probe result is appended to a per-address ring buffer in memory
+(the newest ``LATENCY_RING_SIZE`` samples) and queued for the
+``latency_samples`` table.  ``flush_latency`` writes the queue and folds
+samples from finished hours into ``latency_hourly`` (count, failures and
+min/avg/max RTT), deleting the raw rows.  Hourly rows older than
+``LATENCY_RETENTION_DAYS`` are dropped, so storage stays bounded at
+about one hour of raw samples plus 24 rows per address and day.
+"""
+
+import atexit
+from collections import deque
+from datetime import datetime, timedelta, timezone
+import os
+import threading
+import time
+
+from sqlalchemy import delete, insert, select, text
+
+from .db import engine, read_engine
+from .ipmeta import IP_CACHE_SIZE, LRUCache
+from .models import LatencyHourly, LatencySample
+
+LATENCY_RING_SIZE = int(os.environ.get("LATENCY_RING_SIZE", "120"))
+LATENCY_RETENTION_DAYS = int(os.environ.get("LATENCY_RETENTION_DAYS", "30"))
+# Seconds between scheduled writes of queued samples
+LATENCY_FLUSH_SECONDS = int(os.environ.get("LATENCY_FLUSH_SECONDS", "300"))
+# Seconds a card's sparkline summary is reused before it is re-read
+LATENCY_SUMMARY_TTL = int(os.environ.get("LATENCY_SUMMARY_TTL", "60"))
+
+_rings = LRUCache(IP_CACHE_SIZE)
+_pending = []
+_pending_lock = threading.Lock()
+_summaries = LRUCache(IP_CACHE_SIZE)
+
+_HOUR = "%Y-%m-%d %H:00:00.000000"
+_ROLLUP = text(
+    f"""
+    INSERT INTO latency_hourly (ip, hour, samples, failures, rtt_min, rtt_avg, rtt_max)
+    SELECT ip, strftime('{_HOUR}', sampled_at), COUNT(*), SUM(rtt_ms IS NULL),
+           MIN(rtt_ms), AVG(rtt_ms), MAX(rtt_ms)
+    FROM latency_samples
+    WHERE sampled_at < :cutoff
+    GROUP BY ip, strftime('{_HOUR}', sampled_at)
+    ON CONFLICT (ip, hour) DO UPDATE SET
+        rtt_avg = CASE
+            WHEN excluded.rtt_avg IS NULL THEN rtt_avg
+            WHEN rtt_avg IS NULL THEN excluded.rtt_avg
+            ELSE (rtt_avg * (samples - failures)
+                  + excluded.rtt_avg * (excluded.samples - excluded.failures))
+                 / (samples - failures + excluded.samples - excluded.failures)
+        END,
+        rtt_min = MIN(COALESCE(rtt_min, excluded.rtt_min), COALESCE(excluded.rtt_min, rtt_min)),
+        rtt_max = MAX(COALESCE(rtt_max, excluded.rtt_max), COALESCE(excluded.rtt_max, rtt_max)),
+        samples = samples + excluded.samples,
+        failures = failures + excluded.failures
+    """
+)
+
+
+def record_samples(samples: dict, when: datetime = None) -> None:
+    """Record ``{ip: rtt_ms or None}``; ``None`` is a failed probe."""
+    when = when or datetime.utcnow()
+    stamp = when.replace(tzinfo=timezone.utc).timestamp()
+    rows = []
+    for ip, rtt in samples.items():
+        ring = _rings.get(ip)
+        if ring is None:
+            ring = deque(maxlen=LATENCY_RING_SIZE)
+            _rings[ip] = ring
+        ring.append((stamp, rtt))
+        rows.append({"ip": ip, "sampled_at": when, "rtt_ms": rtt})
+    with _pending_lock:
+        _pending.extend(rows)
+
+
+def recent_samples(ip: str) -> list:
+    """Return the ``(unix time, rtt_ms)`` samples buffered for ``ip``."""
+    return list(_rings.get(ip) or ())
+
+
+def flush_latency(now: datetime = None) -> bool:
+    """Write queued samples and roll finished hours up; False on failure."""
+    now = now or datetime.utcnow()
+    with _pending_lock:
+        rows = list(_pending)
+        _pending.clear()
+    cutoff = now.replace(minute=0, second=0, microsecond=0)
+    try:
+        with engine.begin() as conn:
+            if rows:
+                conn.execute(insert(LatencySample), rows)
+            params = {"cutoff": cutoff.strftime("%Y-%m-%d %H:%M:%S.%f")}
+            conn.execute(_ROLLUP, params)
+            conn.execute(
+                delete(LatencySample).where(LatencySample.sampled_at < cutoff)
+            )
+            conn.execute(
+                delete(LatencyHourly).where(
+                    LatencyHourly.hour < cutoff - timedelta(days=LATENCY_RETENTION_DAYS)
+                )
+            )
+    except Exception:
+        with _pending_lock:
+            _pending[:0] = rows
+        return False
+    return True
+
+
+atexit.register(flush_latency)
+
+
+def latency_series(ip: str, hours: int = 24) -> dict:
+    """Return hourly RTT stats and uptime for ``ip`` over the last ``hours``.
+
+    The current, not yet rolled up hour is aggregated from raw samples.
+    """
+    since = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    since -= timedelta(hours=hours - 1)
+    with read_engine.connect() as conn:
+        hourly = conn.execute(
+            select(LatencyHourly)
+            .where(LatencyHourly.ip == ip, LatencyHourly.hour >= since)
+            .order_by(LatencyHourly.hour)
+        ).all()
+        raw = conn.execute(
+            select(LatencySample.sampled_at, LatencySample.rtt_ms)
+            .where(LatencySample.ip == ip, LatencySample.sampled_at >= since)
+        ).all()
+    buckets = {
+        row.hour: {
+            "hour": row.hour,
+            "samples": row.samples,
+            "failures": row.failures,
+            "min": row.rtt_min,
+            "avg": row.rtt_avg,
+            "max": row.rtt_max,
+        }
+        for row in hourly
+    }
+    current = {}
+    for sampled_at, rtt in raw:
+        current.setdefault(sampled_at.replace(minute=0, second=0, microsecond=0), []).append(rtt)
+    for hour, values in current.items():
+        ok = [v for v in values if v is not None]
+        merged = _merge(buckets.get(hour), {
+            "hour": hour,
+            "samples": len(values),
+            "failures": len(values) - len(ok),
+            "min": min(ok) if ok else None,
+            "avg": sum(ok) / len(ok) if ok else None,
+            "max": max(ok) if ok else None,
+        })
+        buckets[hour] = merged
+    series = [buckets[hour] for hour in sorted(buckets)]
+    samples = sum(b["samples"] for b in series)
+    failures = sum(b["failures"] for b in series)
+    return {
+        "hourly": series,
+        "uptime": round(100.0 * (samples - failures) / samples, 2) if samples else None,
+    }
+
+
+def _merge(a, b):
+    if a is None:
+        return b
+    ok_a, ok_b = a["samples"] - a["failures"], b["samples"] - b["failures"]
+    avg = None
+    if ok_a + ok_b:
+        avg = ((a["avg"] or 0) * ok_a + (b["avg"] or 0) * ok_b) / (ok_a + ok_b)
+    mins = [v for v in (a["min"], b["min"]) if v is not None]
+    maxs = [v for v in (a["max"], b["max"]) if v is not None]
+    return {
+        "hour": a["hour"],
+        "samples": a["samples"] + b["samples"],
+        "failures": a["failures"] + b["failures"],
+        "min": min(mins) if mins else None,
+        "avg": avg,
+        "max": max(maxs) if maxs else None,
+    }
+
+
+def sparkline_points(values, width: float, height: float) -> str:
+    """Return SVG polyline points for ``values`` scaled into the box.
+
+    ``None`` values (hours with only failed probes) are drawn at the top.
+    """
+    known = [v for v in values if v is not None]
+    if len(values) < 2 or not known:
+        return ""
+    low, high = min(known), max(known)
+    span = (high - low) or 1.0
+    step = width / (len(values) - 1)
+    points = []
+    for i, value in enumerate(values):
+        y = 0.0 if value is None else height - (value - low) / span * height
+        points.append(f"{i * step:.1f},{y:.1f}")
+    return " ".join(points)
+
+
+def latency_summary(ip: str, width: float = 120, height: float = 16):
+    """Return ``{"points", "uptime", "avg"}`` for a card, or ``None``.
+
+    Summaries are memoised for ``LATENCY_SUMMARY_TTL`` seconds so card
+    cache keys stay stable between probes.
+    """
+    now = time.time()
+    hit = _summaries.get(ip)
+    if hit and now - hit[0] < LATENCY_SUMMARY_TTL:
+        return hit[1]
+    try:
+        series = latency_series(ip)
+    except Exception:
+        return None
+    summary = None
+    if series["uptime"] is not None:
+        averages = [b["avg"] for b in series["hourly"]]
+        known = [v for v in averages if v is not None]
+        summary = {
+            "points": sparkline_points(averages, width, height),
+            "uptime": series["uptime"],
+            "avg": round(sum(known) / len(known), 1) if known else None,
+        }
+    _summaries[ip] = (now, summary)
+    return summary
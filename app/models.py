@@ -1,4 +1,14 @@
-from sqlalchemy import Column, Integer, String, Float, Date, Boolean, DateTime
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Float,
+    Date,
+    Boolean,
+    DateTime,
+    Text,
+    ForeignKey,
+)
 from datetime import datetime
 from .db import Base
 
@@ -16,9 +26,9 @@ class VPS(Base):
     renewal_price = Column(Float)
     currency = Column(String, default="USD")
     exchange_rate = Column(Float, default=1.0)
-    vendor_name = Column(String)
+    vendor_name = Column(String, index=True)
     instance_config = Column(String)
-    location = Column(String)
+    location = Column(String, index=True)
     description = Column(String)
     traffic_limit = Column(String)
     ip_address = Column(String)
@@ -27,7 +37,7 @@ class VPS(Base):
     exchange_rate_source = Column(String, default="system")
     update_cycle = Column(Integer, default=7)
     dynamic_svg = Column(Boolean, default=True)
-    status = Column(String, default="active")
+    status = Column(String, default="active", index=True)
     sale_percent = Column(Float, default=0.0)
     sale_fixed = Column(Float, default=0.0)
     sale_method = Column(String)
@@ -70,3 +80,87 @@ class VisitStats(Base):
     id = Column(Integer, primary_key=True)
     visitors = Column(Integer, default=0, nullable=False)
     crawlers = Column(Integer, default=0, nullable=False)
+
+
+class VisitDaily(Base):
+    __tablename__ = "visit_stats_daily"
+
+    day = Column(Date, primary_key=True)
+    visitors = Column(Integer, default=0, nullable=False)
+    crawlers = Column(Integer, default=0, nullable=False)
+
+
+class ExchangeRate(Base):
+    __tablename__ = "exchange_rates"
+
+    id = Column(Integer, primary_key=True)
+    base = Column(String, nullable=False, default="USD")
+    # JSON encoded ``{currency: rate}`` table relative to ``base``
+    rates = Column(Text, nullable=False)
+    fetched_at = Column(DateTime, nullable=False, index=True, default=datetime.utcnow)
+
+
+class VPSValuation(Base):
+    # Materialized output of calculate_remaining, rewritten by the scheduler
+    __tablename__ = "vps_valuation"
+
+    vps_id = Column(Integer, ForeignKey("vps.id", ondelete="CASCADE"), primary_key=True)
+    # Day the valuation was computed for; rows from earlier days are stale
+    valued_on = Column(Date, nullable=False, index=True)
+    remaining_days = Column(Integer, default=0, nullable=False)
+    remaining_value = Column(Float, default=0.0, nullable=False)
+    total_value = Column(Float, default=0.0, nullable=False)
+    final_price = Column(Float, default=0.0, nullable=False)
+    push_fee_cny = Column(Float, default=0.0, nullable=False)
+    cycle_start = Column(Date)
+    cycle_end = Column(Date)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class IPMetadata(Base):
+    # Geo lookup and ping results shared by every worker; see app.ipmeta
+    __tablename__ = "ip_metadata"
+
+    ip = Column(String, primary_key=True)
+    country_code = Column(String, default="", nullable=False)
+    isp = Column(String, default="", nullable=False)
+    org = Column(String, default="", nullable=False)
+    asn = Column(String, default="", nullable=False)
+    # False when the last geo lookup failed; such rows expire sooner
+    geo_ok = Column(Boolean)
+    geo_checked_at = Column(DateTime)
+    ping_status = Column(String)
+    ping_checked_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class LatencySample(Base):
+    # Raw probe results, folded into latency_hourly once their hour is over
+    __tablename__ = "latency_samples"
+
+    id = Column(Integer, primary_key=True)
+    ip = Column(String, nullable=False, index=True)
+    sampled_at = Column(DateTime, nullable=False, index=True)
+    # Round-trip time in milliseconds; NULL when the probe failed
+    rtt_ms = Column(Float)
+
+
+class LatencyHourly(Base):
+    __tablename__ = "latency_hourly"
+
+    ip = Column(String, primary_key=True)
+    hour = Column(DateTime, primary_key=True)
+    samples = Column(Integer, default=0, nullable=False)
+    failures = Column(Integer, default=0, nullable=False)
+    rtt_min = Column(Float)
+    rtt_avg = Column(Float)
+    rtt_max = Column(Float)
+
+
+class VPSChange(Base):
+    # Append-only log of VPS writes; workers apply entries after their cursor
+    __tablename__ = "vps_changes"
+
+    id = Column(Integer, primary_key=True)
+    vps_id = Column(Integer, nullable=False)
+    changed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,136 @@
+"""Concurrent reachability probes for the whole fleet.
+
+``probe_fleet`` checks every address on one asyncio event loop, so the
+fleet's status map is ready in about one timeout window instead of one
+timeout per unreachable server.  Round-trip times are recorded in
+``app.latency``.  The checks match ``ping_ip``: a TCP
+connect when a port is given, otherwise an ICMP ping with a TCP port 80
+fallback.  At most ``PROBE_CONCURRENCY`` probes run at once.
+"""
+
+import asyncio
+import os
+import platform
+import re
+import shutil
+import time
+from typing import Optional
+
+from .latency import flush_latency, record_samples
+from .utils import ONLINE, OFFLINE, cached_ping, parse_host_port, record_pings
+
+PROBE_CONCURRENCY = int(os.environ.get("PROBE_CONCURRENCY", "64"))
+# Seconds before a single connect or ping counts as failed
+PROBE_TIMEOUT = float(os.environ.get("PROBE_TIMEOUT", "1"))
+
+
+_PING_TIME = re.compile(rb"[=<]\s*([\d.]+)\s*ms")
+
+
+async def _tcp(host: str, port: int, timeout: float) -> Optional[float]:
+    """Return the TCP connect time in ms, or ``None`` on failure."""
+    started = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    rtt = (time.perf_counter() - started) * 1000
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return rtt
+
+
+async def _icmp(ping_exec: str, host: str, timeout: float) -> Optional[float]:
+    """Return the RTT reported by one ``ping``, or ``None`` on failure."""
+    windows = platform.system().lower().startswith("win")
+    count_arg = "-n" if windows else "-c"
+    timeout_arg = "-w" if windows else "-W"
+    wait = str(max(int(timeout * 1000), 1)) if windows else str(max(int(timeout), 1))
+    started = time.perf_counter()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            ping_exec, count_arg, "1", timeout_arg, wait, host,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+    except OSError:
+        return None
+    try:
+        output, _ = await asyncio.wait_for(proc.communicate(), timeout + 1)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return None
+    if proc.returncode != 0:
+        return None
+    match = _PING_TIME.search(output or b"")
+    if match:
+        return float(match.group(1))
+    return (time.perf_counter() - started) * 1000
+
+
+async def measure(ip: str, timeout: float = None) -> Optional[float]:
+    """Return the RTT in ms for one ``ip`` or ``ip:port``, ``None`` if down."""
+    timeout = PROBE_TIMEOUT if timeout is None else timeout
+    host, port = parse_host_port(ip)
+    target = host or ip
+    if port is not None:
+        return await _tcp(target, port, timeout)
+    ping_exec = shutil.which("ping")
+    rtt = await _icmp(ping_exec, target, timeout) if ping_exec else None
+    if rtt is None:
+        rtt = await _tcp(target, 80, timeout)
+    return rtt
+
+
+async def probe(ip: str, timeout: float = None) -> str:
+    """Return the status string for one ``ip`` or ``ip:port``."""
+    return OFFLINE if await measure(ip, timeout) is None else ONLINE
+
+
+async def probe_many(ips, concurrency: int = None, timeout: float = None) -> dict:
+    """Probe ``ips`` concurrently and return ``{ip: rtt_ms or None}``."""
+    semaphore = asyncio.Semaphore(concurrency or PROBE_CONCURRENCY)
+
+    async def bounded(ip):
+        async with semaphore:
+            return ip, await measure(ip, timeout)
+
+    return dict(await asyncio.gather(*(bounded(ip) for ip in ips)))
+
+
+def cached_statuses(ips) -> dict:
+    """Return ``{ip: status}`` for addresses with a fresh status, without probing."""
+    statuses = {}
+    for ip in dict.fromkeys(ip for ip in ips if ip):
+        cached = cached_ping(ip)
+        if cached:
+            statuses[ip] = cached
+    return statuses
+
+
+def probe_fleet(ips, force: bool = False, concurrency: int = None, timeout: float = None) -> dict:
+    """Return ``{ip: status}`` for every address in ``ips``.
+
+    Statuses younger than ``PING_TTL`` are reused unless ``force`` is set;
+    the rest are probed together and recorded like ``ping_ip`` results.
+    """
+    statuses = {}
+    pending = []
+    for ip in dict.fromkeys(ip for ip in ips if ip):
+        cached = None if force else cached_ping(ip)
+        if cached:
+            statuses[ip] = cached
+        else:
+            pending.append(ip)
+    if pending:
+        rtts = asyncio.run(probe_many(pending, concurrency, timeout))
+        probed = {ip: OFFLINE if rtt is None else ONLINE for ip, rtt in rtts.items()}
+        statuses.update(probed)
+        record_pings(probed)
+        record_samples(rtts)
+        flush_latency()
+    return statuses
@@ -0,0 +1,189 @@
+"""Shared exchange-rate provider.
+
+A single rate table is fetched from open.er-api.com for ``RATE_BASE`` and
+kept in memory for ``RATE_TTL`` seconds.  Every currency pair is derived
+from that one table, so valuing a whole fleet costs at most one HTTP
+request no matter how many currencies are involved.
+
+Each fetched table is also stored in the ``exchange_rates`` table.  The
+newest snapshot is loaded on first use, so a restarted process can value
+the fleet immediately while a fresh table is fetched in the background.
+With ``RATE_OFFLINE=1`` the network is never touched and only stored
+snapshots are used.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+import requests
+from sqlalchemy.orm import Session
+
+from .db import engine
+from .models import ExchangeRate
+
+RATE_API = "https://open.er-api.com/v6/latest/"
+RATE_BASE = os.environ.get("RATE_BASE", "USD").upper()
+# Seconds a fetched table stays fresh.
+RATE_TTL = int(os.environ.get("RATE_TTL", "3600"))
+# Seconds to wait before retrying after a failed fetch, so an unreachable
+# API does not cost one timeout per valuation.
+RATE_RETRY = int(os.environ.get("RATE_RETRY", "60"))
+# Never fetch rates over the network; rely on stored snapshots only.
+RATE_OFFLINE = os.environ.get("RATE_OFFLINE", "").lower() in ("1", "true", "yes")
+# Snapshots older than this many days are pruned when a new one is stored.
+RATE_SNAPSHOT_DAYS = int(os.environ.get("RATE_SNAPSHOT_DAYS", "30"))
+
+_rate_cache = {
+    "base": RATE_BASE,
+    "rates": {},
+    "time": 0.0,
+    "failed": 0.0,
+    "loaded": False,
+}
+_rate_lock = threading.Lock()
+
+
+def fetch_rate_table(base: str = RATE_BASE) -> Dict[str, float]:
+    """Download the rate table for ``base`` and return ``{currency: rate}``."""
+    resp = requests.get(f"{RATE_API}{base}", timeout=10)
+    resp.raise_for_status()
+    data = resp.json()
+    rates = {k.upper(): float(v) for k, v in (data.get("rates") or {}).items()}
+    if not rates:
+        raise ValueError("empty rate table")
+    rates[base.upper()] = 1.0
+    return rates
+
+
+def save_rate_snapshot(base: str, rates: Dict[str, float], fetched_at=None) -> None:
+    """Persist ``rates`` and prune snapshots older than ``RATE_SNAPSHOT_DAYS``."""
+    fetched_at = fetched_at or datetime.utcnow()
+    with Session(engine) as db:
+        db.add(ExchangeRate(base=base, rates=json.dumps(rates), fetched_at=fetched_at))
+        cutoff = fetched_at - timedelta(days=RATE_SNAPSHOT_DAYS)
+        db.query(ExchangeRate).filter(ExchangeRate.fetched_at < cutoff).delete()
+        db.commit()
+
+
+def load_rate_snapshot() -> bool:
+    """Load the newest stored snapshot into the cache.
+
+    Returns ``True`` when a snapshot was found.  The cache keeps the
+    snapshot's own timestamp, so a stale snapshot is still refreshed when
+    the network is available.
+    """
+    _rate_cache["loaded"] = True
+    try:
+        with Session(engine) as db:
+            snap = (
+                db.query(ExchangeRate)
+                .order_by(ExchangeRate.fetched_at.desc())
+                .first()
+            )
+    except Exception:
+        return False
+    if not snap:
+        return False
+    try:
+        rates = json.loads(snap.rates)
+    except ValueError:
+        return False
+    fetched = snap.fetched_at.replace(tzinfo=timezone.utc).timestamp()
+    if _rate_cache["rates"] and _rate_cache["time"] >= fetched:
+        return True
+    _rate_cache["base"] = snap.base
+    _rate_cache["rates"] = rates
+    _rate_cache["time"] = fetched
+    return True
+
+
+def refresh_rates() -> bool:
+    """Fetch a new table, cache and persist it.  Returns ``True`` on success."""
+    if RATE_OFFLINE:
+        return False
+    base = _rate_cache["base"]
+    try:
+        rates = fetch_rate_table(base)
+    except Exception:
+        _rate_cache["failed"] = time.time()
+        return False
+    _rate_cache["rates"] = rates
+    _rate_cache["time"] = time.time()
+    _rate_cache["failed"] = 0.0
+    try:
+        save_rate_snapshot(base, rates)
+    except Exception:
+        pass
+    return True
+
+
+def _refresh_in_background() -> None:
+    try:
+        refresh_rates()
+    finally:
+        _rate_lock.release()
+
+
+def get_rate_table(force: bool = False) -> Dict[str, float]:
+    """Return the cached rate table, refreshing it when it is stale.
+
+    When a (possibly stale) table is already cached the refresh runs in a
+    background thread and the cached table is returned at once; callers
+    only block when there is nothing to serve.  An empty dict is returned
+    if no table is available.
+    """
+    cache = _rate_cache
+    if not cache["loaded"]:
+        load_rate_snapshot()
+    if RATE_OFFLINE:
+        return cache["rates"]
+    now = time.time()
+    fresh = cache["rates"] and now - cache["time"] < RATE_TTL
+    backoff = now - cache["failed"] < RATE_RETRY
+    if not force and (fresh or backoff):
+        return cache["rates"]
+    if cache["rates"] and not force:
+        if _rate_lock.acquire(blocking=False):
+            threading.Thread(target=_refresh_in_background, daemon=True).start()
+        return cache["rates"]
+    with _rate_lock:
+        # Another thread may have refreshed (or failed) while we waited.
+        now = time.time()
+        if not force and (cache["rates"] or now - cache["failed"] < RATE_RETRY):
+            return cache["rates"]
+        refresh_rates()
+    return cache["rates"]
+
+
+def get_rate(
+    from_currency: str, to_currency: str = "CNY", default: Optional[float] = None
+) -> Optional[float]:
+    """Return how many ``to_currency`` units one ``from_currency`` buys.
+
+    Cross rates are derived from the shared base table.  ``default`` is
+    returned when either currency is unknown or no table is available.
+    """
+    src = (from_currency or "").upper()
+    dst = (to_currency or "").upper()
+    if not src or not dst:
+        return default
+    if src == dst:
+        return 1.0
+    rates = get_rate_table()
+    src_rate = rates.get(src)
+    dst_rate = rates.get(dst)
+    if not src_rate or not dst_rate:
+        return default
+    return dst_rate / src_rate
+
+
+def clear_rate_cache() -> None:
+    """Forget the cached table so the next lookup reloads it."""
+    _rate_cache["rates"] = {}
+    _rate_cache["time"] = 0.0
+    _rate_cache["failed"] = 0.0
+    _rate_cache["loaded"] = False
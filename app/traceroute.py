@@ -0,0 +1,218 @@
+"""Background traceroute jobs.
+
+``start_traceroute`` returns a ``TracerouteJob`` for a target.  A running
+job for the same target is shared, and a finished one is reused for
+``TRACEROUTE_CACHE_TTL`` seconds.  Jobs run on a pool of
+``TRACEROUTE_CONCURRENCY`` threads, each owning one ``traceroute``
+process, so no more processes than that run at once.  At most
+``TRACEROUTE_MAX_PENDING`` jobs may be queued or running.
+
+Output lines are appended to the job as the process prints them;
+``TracerouteJob.follow`` yields them as they arrive.  Jobs are kept in
+this process's memory.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import ipaddress
+import os
+import re
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import uuid
+
+TRACEROUTE_CONCURRENCY = int(os.environ.get("TRACEROUTE_CONCURRENCY", "2"))
+TRACEROUTE_CACHE_TTL = int(os.environ.get("TRACEROUTE_CACHE_TTL", "600"))
+TRACEROUTE_TIMEOUT = int(os.environ.get("TRACEROUTE_TIMEOUT", "60"))
+TRACEROUTE_MAX_PENDING = int(os.environ.get("TRACEROUTE_MAX_PENDING", "16"))
+
+_HOP = re.compile(r"^\s*(\d+)\s")
+
+
+class TracerouteBusy(Exception):
+    """Raised when ``TRACEROUTE_MAX_PENDING`` jobs are already pending."""
+
+
+def parse_hop(line: str):
+    """Return the hop number of a traceroute output line, if it has one."""
+    match = _HOP.match(line)
+    return int(match.group(1)) if match else None
+
+
+class TracerouteJob:
+    def __init__(self, target: str):
+        self.id = uuid.uuid4().hex
+        self.target = target
+        self.status = "queued"
+        self.lines = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def _append(self, line: str) -> None:
+        with self._cond:
+            self.lines.append(line)
+            self._cond.notify_all()
+
+    def _set_status(self, status: str) -> None:
+        with self._cond:
+            self.status = status
+            if self.done:
+                self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until the job ends; False if ``timeout`` passed first."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout)
+
+    def follow(self, start: int = 0, heartbeat: float = 15.0):
+        """Yield ``(index, line)`` from ``start`` on until the job ends.
+
+        Yields ``None`` after ``heartbeat`` seconds without output, so a
+        caller streaming to a client can keep the connection alive.
+        """
+        index = start
+        while True:
+            with self._cond:
+                if index >= len(self.lines) and not self.done:
+                    self._cond.wait(heartbeat)
+                new = self.lines[index:]
+                done = self.done
+            for line in new:
+                yield index, line
+                index += 1
+            if not new:
+                if done:
+                    return
+                yield None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "target": self.target,
+            "status": self.status,
+            "hops": [{"hop": parse_hop(line), "line": line} for line in self.lines],
+        }
+
+
+_jobs = {}
+_by_target = {}
+_lock = threading.Lock()
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=TRACEROUTE_CONCURRENCY, thread_name_prefix="traceroute"
+            )
+        return _executor
+
+
+def _kill(proc) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _trace(job: TracerouteJob) -> str:
+    """Run traceroute for ``job``, appending its output; return the final status."""
+    tr_exec = shutil.which("traceroute")
+    if not tr_exec:
+        job._append("traceroute unavailable")
+        return "failed"
+    # ``-n`` avoids DNS lookups, which can slow the command down or even
+    # time it out; ``-w`` and ``-q`` cut per-hop waits and probe counts
+    proc = subprocess.Popen(
+        [tr_exec, "-n", "-w", "1", "-q", "1", job.target],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors="replace",
+        bufsize=1,
+        # Own process group, so a timeout also kills any helpers that
+        # would keep the output pipe open
+        start_new_session=True,
+    )
+    timed_out = threading.Event()
+
+    def expire():
+        timed_out.set()
+        _kill(proc)
+
+    timer = threading.Timer(TRACEROUTE_TIMEOUT, expire)
+    try:
+        timer.start()
+        for line in proc.stdout:
+            line = line.rstrip()
+            if line:
+                job._append(line)
+        proc.wait()
+    finally:
+        timer.cancel()
+        if proc.poll() is None:
+            _kill(proc)
+            proc.wait()
+        proc.stdout.close()
+    if timed_out.is_set():
+        job._append("Traceroute timed out")
+        return "failed"
+    return "done" if proc.returncode == 0 else "failed"
+
+
+def _run(job: TracerouteJob) -> None:
+    job._set_status("running")
+    status = "failed"
+    try:
+        status = _trace(job)
+    except Exception as exc:
+        # The executor would swallow the error and leave the job running
+        job._append(f"Traceroute error: {exc}")
+    finally:
+        job._set_status(status)
+
+
+def _prune(now: float) -> None:
+    for job_id, job in list(_jobs.items()):
+        if job.done and now - job.finished_at >= TRACEROUTE_CACHE_TTL:
+            del _jobs[job_id]
+            if _by_target.get(job.target) is job:
+                del _by_target[job.target]
+
+
+def start_traceroute(target: str) -> TracerouteJob:
+    """Return a running or recent job for ``target``, starting one if needed.
+
+    Raises ``ValueError`` unless ``target`` is an IP address and
+    ``TracerouteBusy`` when too many jobs are pending.
+    """
+    target = str(ipaddress.ip_address(target.strip()))
+    now = time.time()
+    with _lock:
+        _prune(now)
+        job = _by_target.get(target)
+        # Failed runs are retried rather than served from the cache
+        if job is not None and (not job.done or job.status == "done"):
+            return job
+        if sum(not job.done for job in _jobs.values()) >= TRACEROUTE_MAX_PENDING:
+            raise TracerouteBusy(target)
+        job = TracerouteJob(target)
+        _jobs[job.id] = job
+        _by_target[target] = job
+    _get_executor().submit(_run, job)
+    return job
+
+
+def get_job(job_id: str):
+    with _lock:
+        return _jobs.get(job_id)
@@ -1,42 +1,30 @@
-from datetime import date, timedelta
+from datetime import date, timedelta, timezone
 from calendar import monthrange
+from math import gcd
 from jinja2 import Environment, FileSystemLoader
 from pathlib import Path, PurePath
-import base64
-from functools import lru_cache
-from typing import Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import List, Optional, Tuple
 import re
-import requests
 import time
 from werkzeug.utils import secure_filename
 import ipaddress
 
+from .emoji import twemoji_url
+from .geo import country_flag, lookup_geo
+from .ipmeta import IP_CACHE_SIZE, LRUCache, load_ping, store_pings
+from .latency import latency_summary
+from .rates import get_rate
+
 TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "templates"
 STATIC_DIR = Path(__file__).resolve().parent.parent / "static" / "images"
 
 env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
-TWEMOJI_BASE = "https://cdnjs.cloudflare.com/ajax/libs/twemoji/14.0.2/svg"
-
-
-@lru_cache()
-def twemoji_url(emoji: str) -> str:
-    """Return a data URI embedding the Twemoji SVG for ``emoji``.
-
-    Some forums block external image loads inside pasted SVGs. By
-    inlining the emoji as a base64 ``data:`` URI, the generated SVG is
-    self-contained and renders correctly when copied elsewhere.
-    """
-    code_points = "-".join(f"{ord(c):x}" for c in emoji)
-    url = f"{TWEMOJI_BASE}/{code_points}.svg"
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        encoded = base64.b64encode(resp.content).decode("ascii")
-        return f"data:image/svg+xml;base64,{encoded}"
-    except Exception:
-        return ""
-
-
 env.filters["twemoji_url"] = twemoji_url
 
 
@@ -49,69 +37,147 @@ def add_months(dt: date, months: int) -> date:
     return date(year, month, day)
 
 
-def calculate_remaining(vps):
-    today = date.today()
-    if not vps.purchase_date or not vps.renewal_days:
-        return {
-            "remaining_days": 0,
-            "remaining_value": 0.0,
-            "total_value": 0.0,
-            "cycle_start": None,
-            "cycle_end": None,
-        }
+MONTHS_MAP = {30: 1, 90: 3, 365: 12, 1095: 36}
 
-    months_map = {30: 1, 90: 3, 365: 12, 1095: 36}
-    start = vps.purchase_date
-    if vps.renewal_days in months_map:
-        months = months_map[vps.renewal_days]
-        while add_months(start, months) <= today:
-            start = add_months(start, months)
-        end = add_months(start, months)
-    else:
-        delta = timedelta(days=vps.renewal_days)
-        while start + delta <= today:
-            start += delta
-        end = start + delta
-
-    remaining_days = max((end - today).days, 0)
-    total_days = max((end - start).days, 1)
-    rate = vps.exchange_rate or 1.0
-    if getattr(vps, "exchange_rate_source", "") == "system":
-        try:
-            resp = requests.get(
-                f"https://open.er-api.com/v6/latest/{vps.currency}", timeout=10
-            )
-            data = resp.json()
-            rate = data.get("rates", {}).get("CNY", rate)
-        except Exception:
-            pass
-    remaining_value = vps.renewal_price * rate * remaining_days / total_days
-    total_value = vps.renewal_price * rate
-    sale_percent = getattr(vps, "sale_percent", 0.0) or 0.0
-    sale_fixed = getattr(vps, "sale_fixed", 0.0) or 0.0
-    push_fee = getattr(vps, "push_fee", 0.0) or 0.0
-    push_currency = getattr(vps, "push_fee_currency", "CNY") or "CNY"
-    push_rate = 1.0
-    if push_currency != "CNY":
-        try:
-            resp = requests.get(
-                f"https://open.er-api.com/v6/latest/{push_currency}", timeout=10
-            )
-            data = resp.json()
-            push_rate = data.get("rates", {}).get("CNY", push_rate)
-        except Exception:
-            pass
-    push_fee_cny = push_fee * push_rate
-    final_price = (remaining_value + push_fee_cny) * (1 + sale_percent / 100) + sale_fixed
+
+def _month_index(dt: date) -> int:
+    return dt.year * 12 + dt.month - 1
+
+
+def current_cycle(purchase_date: date, renewal_days: int, today: date) -> Tuple[date, date]:
+    """Return ``(start, end)`` of the billing cycle that contains ``today``.
+
+    Cycles roll forward from ``purchase_date`` by ``renewal_days`` (or the
+    matching number of calendar months).  The cycle index is computed
+    directly, so the cost does not grow with the age of the server.
+    """
+    if renewal_days not in MONTHS_MAP:
+        delta = timedelta(days=renewal_days)
+        k = max((today - purchase_date).days // renewal_days, 0)
+        start = purchase_date + delta * k
+        return start, start + delta
+
+    months = MONTHS_MAP[renewal_days]
+    start = purchase_date
+    # Month-end clamping carries over: a cycle starting on Jan 31 continues
+    # from Feb 28/29 and never returns to the 31st.  The clamped day only
+    # changes on the first visit to each shorter month, which happens
+    # within two passes over the months reachable with this step (at most
+    # 24 steps), and only when the day is past the 28th.
+    limit = 2 * 12 // gcd(months, 12)
+    steps = 0
+    while start.day > 28 and steps < limit:
+        nxt = add_months(start, months)
+        if nxt > today:
+            return start, nxt
+        start = nxt
+        steps += 1
+
+    # From here on the day never changes, so the index is plain arithmetic.
+    k = max((_month_index(today) - _month_index(start)) // months, 0)
+    candidate = add_months(start, k * months)
+    if candidate > today and k > 0:
+        candidate = add_months(start, (k - 1) * months)
+    return candidate, add_months(candidate, months)
+
+
+def _empty_valuation():
     return {
-        "remaining_days": remaining_days,
-        "remaining_value": round(remaining_value, 2),
-        "total_value": round(total_value, 2),
-        "final_price": round(final_price, 2),
-        "push_fee_cny": round(push_fee_cny, 2),
-        "cycle_start": start,
-        "cycle_end": end,
+        "remaining_days": 0,
+        "remaining_value": 0.0,
+        "total_value": 0.0,
+        "cycle_start": None,
+        "cycle_end": None,
+    }
+
+
+def calculate_remaining_many(vps_list, today: Optional[date] = None) -> List[dict]:
+    """Value every VPS in ``vps_list`` in one pass.
+
+    ``vps_list`` may be any iterable of VPS rows, including a query.  Rate
+    lookups are shared across the batch and the money arithmetic runs as
+    vectorized NumPy operations.  The result is a list of valuation dicts
+    in input order, identical to calling :func:`calculate_remaining` on
+    each row.
+    """
+    import numpy as np
+
+    today = today or date.today()
+    rows = list(vps_list)
+    results: List[dict] = [None] * len(rows)
+    rate_lookup = {}
+
+    def cny_rate(currency):
+        if currency not in rate_lookup:
+            rate_lookup[currency] = get_rate(currency, "CNY")
+        return rate_lookup[currency]
+
+    index = []
+    cycles = []
+    columns = {
+        "price": [],
+        "rate": [],
+        "remaining_days": [],
+        "total_days": [],
+        "push_fee": [],
+        "push_rate": [],
+        "sale_percent": [],
+        "sale_fixed": [],
     }
+    for i, vps in enumerate(rows):
+        if not vps.purchase_date or not vps.renewal_days:
+            results[i] = _empty_valuation()
+            continue
+        start, end = current_cycle(vps.purchase_date, vps.renewal_days, today)
+        rate = vps.exchange_rate or 1.0
+        if getattr(vps, "exchange_rate_source", "") == "system":
+            system_rate = cny_rate(vps.currency)
+            if system_rate is not None:
+                rate = system_rate
+        push_currency = getattr(vps, "push_fee_currency", "CNY") or "CNY"
+        push_rate = 1.0
+        if push_currency != "CNY":
+            system_rate = cny_rate(push_currency)
+            if system_rate is not None:
+                push_rate = system_rate
+        index.append(i)
+        cycles.append((start, end))
+        columns["price"].append(vps.renewal_price or 0.0)
+        columns["rate"].append(rate)
+        columns["remaining_days"].append(max((end - today).days, 0))
+        columns["total_days"].append(max((end - start).days, 1))
+        columns["push_fee"].append(getattr(vps, "push_fee", 0.0) or 0.0)
+        columns["push_rate"].append(push_rate)
+        columns["sale_percent"].append(getattr(vps, "sale_percent", 0.0) or 0.0)
+        columns["sale_fixed"].append(getattr(vps, "sale_fixed", 0.0) or 0.0)
+
+    if not index:
+        return results
+
+    arr = {key: np.asarray(values, dtype=np.float64) for key, values in columns.items()}
+    total_value = arr["price"] * arr["rate"]
+    remaining_value = total_value * arr["remaining_days"] / arr["total_days"]
+    push_fee_cny = arr["push_fee"] * arr["push_rate"]
+    final_price = (remaining_value + push_fee_cny) * (
+        1 + arr["sale_percent"] / 100
+    ) + arr["sale_fixed"]
+
+    for pos, i in enumerate(index):
+        start, end = cycles[pos]
+        results[i] = {
+            "remaining_days": int(columns["remaining_days"][pos]),
+            "remaining_value": round(float(remaining_value[pos]), 2),
+            "total_value": round(float(total_value[pos]), 2),
+            "final_price": round(float(final_price[pos]), 2),
+            "push_fee_cny": round(float(push_fee_cny[pos]), 2),
+            "cycle_start": start,
+            "cycle_end": end,
+        }
+    return results
+
+
+def calculate_remaining(vps, today: Optional[date] = None):
+    return calculate_remaining_many([vps], today)[0]
 
 
 def parse_instance_config(config: str):
@@ -164,9 +230,11 @@ def mask_ip(ip: str) -> str:
     return f"{parts[0]}.{parts[1]}.**.**"
 
 
-_ping_cache = {}
-_flag_cache = {}
-_isp_cache = {}
+ONLINE = "🟢 在线"
+OFFLINE = "🔴 离线"
+# Seconds a ping status is reused; statuses are shared through ip_metadata
+PING_TTL = int(os.environ.get("PING_TTL", "600"))
+_ping_cache = LRUCache(IP_CACHE_SIZE)
 
 
 def parse_host_port(value: str) -> Tuple[str, Optional[int]]:
@@ -205,26 +273,49 @@ def parse_host_port(value: str) -> Tuple[str, Optional[int]]:
     return value, None
 
 
+def cached_ping(ip: str) -> Optional[str]:
+    """Return the status of a ping younger than ``PING_TTL``, if any."""
+    cached = _ping_cache.get(ip)
+    if not cached:
+        stored = load_ping(ip)
+        if stored:
+            cached = (stored[0].replace(tzinfo=timezone.utc).timestamp(), stored[1])
+            _ping_cache[ip] = cached
+    if cached and time.time() - cached[0] < PING_TTL:
+        return cached[1]
+    return None
+
+
+def record_pings(statuses: dict) -> None:
+    """Cache and persist ``{ip: status}``; one write for the whole batch."""
+    now = time.time()
+    for ip, status in statuses.items():
+        _ping_cache[ip] = (now, status)
+    store_pings(statuses)
+
+
+def record_ping(ip: str, status: str) -> None:
+    record_pings({ip: status})
+
+
 def ping_ip(ip: str) -> str:
     """Ping IP or ``ip:port`` and return emoji status with simple caching."""
     import subprocess
-    import time
     import platform
     import socket
     import shutil
 
-    now = time.time()
-    cached = _ping_cache.get(ip)
-    if cached and now - cached[0] < 600:
-        return cached[1]
+    cached = cached_ping(ip)
+    if cached:
+        return cached
 
-    status = "🔴 离线"
+    status = OFFLINE
     host, port = parse_host_port(ip)
     target = host or ip
     if port is not None:
         try:
             socket.create_connection((target, port), timeout=1).close()
-            status = "🟢 在线"
+            status = ONLINE
         except Exception:
             pass
     else:
@@ -240,55 +331,21 @@ def ping_ip(ip: str) -> str:
                     stderr=subprocess.DEVNULL,
                 )
                 if res.returncode == 0:
-                    status = "🟢 在线"
+                    status = ONLINE
             except Exception:
                 pass
 
-        if status == "🔴 离线":
+        if status == OFFLINE:
             try:
                 socket.create_connection((target, 80), timeout=1).close()
-                status = "🟢 在线"
+                status = ONLINE
             except Exception:
                 pass
 
-    _ping_cache[ip] = (now, status)
+    record_ping(ip, status)
     return status
 
 
-def traceroute_ip(ip: str, timeout: int = 60) -> str:
-    """Run ``traceroute`` for ``ip`` and return the output as text.
-
-    The command can take a long time depending on network conditions.  A
-    configurable ``timeout`` (default 60s) is used to avoid hanging
-    indefinitely.  If the ``traceroute`` binary is missing or a timeout
-    occurs, a human readable message is returned instead of raising an
-    exception.
-    """
-    import subprocess
-    import shutil
-
-    tr_exec = shutil.which("traceroute")
-    if not tr_exec:
-        return "traceroute unavailable"
-    try:
-        # ``-n`` avoids DNS lookups which can significantly slow down
-        # the command or even cause timeouts on some systems.  ``-w`` and
-        # ``-q`` reduce per-hop wait times and probe count so that a
-        # result is produced quickly for the probe page.
-        result = subprocess.run(
-            [tr_exec, "-n", "-w", "1", "-q", "1", ip],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            timeout=timeout,
-        )
-        return result.stdout.strip()
-    except subprocess.TimeoutExpired:
-        return "Traceroute timed out"
-    except Exception as exc:
-        return f"Traceroute error: {exc}"
-
-
 def run_speedtest(timeout: int = 120) -> dict:
     """Execute ``speedtest`` and return key metrics.
 
@@ -353,87 +410,177 @@ def run_speedtest(timeout: int = 120) -> dict:
 
 
 def ip_to_flag(ip: str) -> str:
-    """Return emoji flag for IP using ipapi.co.
+    """Return the emoji flag for the first IPv4 address in ``ip``.
 
-    The input ``ip`` may contain stray emoji or comments. We extract the
-    first IPv4 address before querying the API so that a stored value like
-    "🏳️ 160.1.2.3" still resolves correctly.
+    The input ``ip`` may contain stray emoji or comments, so a stored
+    value like "🏳️ 160.1.2.3" still resolves correctly.
     """
-    import re
-    now = time.time()
-    match = re.search(r"(?:\d{1,3}\.){3}\d{1,3}", ip)
-    if not match:
-        return "🏳️"
-    clean_ip = match.group(0)
+    return country_flag(lookup_geo(ip)["country_code"])
 
-    cached = _flag_cache.get(clean_ip)
-    if cached and now - cached[0] < 600:
-        return cached[1]
 
-    flag = "🏳️"
-    try:
-        resp = requests.get(
-            f"http://ip-api.com/json/{clean_ip}?fields=countryCode", timeout=5
-        )
-        code = None
-        try:
-            data = resp.json()
-            code = (
-                data.get("countryCode")
-                or data.get("country_code")
-                or data.get("country")
-            )
-        except Exception:
-            text = resp.text.strip().upper()
-            if len(text) == 2 and text.isalpha():
-                code = text
+def ip_to_isp(ip: str) -> str:
+    """Return the ISP name for the first IPv4 address in ``ip``."""
+    geo = lookup_geo(ip)
+    return geo["isp"] or geo["org"] or "-"
 
-        if code and len(code) == 2 and code.isalpha():
-            flag = chr(ord(code[0]) + 127397) + chr(ord(code[1]) + 127397)
-    except Exception:
-        pass
 
-    _flag_cache[clean_ip] = (now, flag)
-    return flag
+# Draw a 24h latency sparkline and uptime on the status row of cards
+SVG_LATENCY = os.environ.get("SVG_LATENCY", "").lower() in ("1", "true", "yes")
 
+# Rendered SVG cards keyed by a hash of everything the template reads.
+SVG_CACHE_SIZE = int(os.environ.get("SVG_CACHE_SIZE", "256"))
+_svg_cache: "OrderedDict[str, str]" = OrderedDict()
+_svg_cache_lock = threading.Lock()
+# Key of the content last written to static/images for each card
+_svg_published = {}
+# One lock per card name, so different renders of a card publish in turn
+_publish_locks = {}
+_publish_locks_lock = threading.Lock()
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
 
-def ip_to_isp(ip: str) -> str:
-    """Return ISP name for IP using ip-api.com.
 
-    The input ``ip`` may include comments or emoji. Extract the first
-    IPv4 address before querying to ensure the lookup succeeds.
+def single_flight(key, func):
+    """Run ``func`` once for all concurrent callers that share ``key``.
+
+    The first caller runs ``func``; callers arriving while it is running
+    wait and receive the same result (or exception).
     """
-    import re
-    now = time.time()
-    match = re.search(r"(?:\d{1,3}\.){3}\d{1,3}", ip)
-    if not match:
-        return "-"
-    clean_ip = match.group(0)
+    with _inflight_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = {"done": threading.Event(), "result": None, "error": None}
+            _inflight[key] = call
+    if not leader:
+        call["done"].wait()
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
+    try:
+        call["result"] = func()
+        return call["result"]
+    except Exception as exc:
+        call["error"] = exc
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        call["done"].set()
+
+
+# Read once at import, while no other thread can race the umask change
+_UMASK = os.umask(0)
+os.umask(_UMASK)
 
-    cached = _isp_cache.get(clean_ip)
-    if cached and now - cached[0] < 600:
-        return cached[1]
 
-    isp = "-"
+def atomic_write_text(path: Path, content: str) -> None:
+    """Write ``content`` to ``path`` so readers never see a partial file.
+
+    The file keeps the mode of the one it replaces, or gets the mode a
+    plain ``open`` would create, rather than ``mkstemp``'s 0600.
+    """
     try:
-        resp = requests.get(
-            f"http://ip-api.com/json/{clean_ip}?fields=isp", timeout=5
-        )
+        mode = path.stat().st_mode & 0o7777
+    except OSError:
+        mode = 0o666 & ~_UMASK
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(content)
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
         try:
-            data = resp.json()
-            isp = data.get("isp") or data.get("org") or "-"
-        except Exception:
-            isp = resp.text.strip() or "-"
-    except Exception:
-        pass
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def build_ip_info(vps) -> dict:
+    """Return the masked IP, status, flag and ISP shown on a VPS card.
+
+    With ``SVG_LATENCY`` enabled, active cards also get a ``latency``
+    summary (sparkline points and uptime) for the status row.
+    """
+    ip_raw = getattr(vps, "ip_address", "") or ""
+    probed = ip_raw and vps.status not in ["sold", "inactive"]
+    info = {
+        "ip_display": mask_ip(ip_raw) if ip_raw else "-",
+        "ping_status": ping_ip(ip_raw) if probed else "未知",
+        "flag": ip_to_flag(ip_raw) if ip_raw else "🏳️",
+        "isp": ip_to_isp(ip_raw) if ip_raw else "-",
+    }
+    if SVG_LATENCY and probed:
+        info["latency"] = latency_summary(ip_raw)
+    return info
+
+
+def _row_values(obj) -> dict:
+    if obj is None:
+        return {}
+    mapper = getattr(obj, "__mapper__", None)
+    if mapper is not None:
+        return {attr.key: getattr(obj, attr.key) for attr in mapper.column_attrs}
+    return dict(vars(obj))
+
+
+def svg_cache_key(vps, data, config, ip_info, today: date) -> str:
+    """Return a content hash of all inputs of the ``vps.svg`` template."""
+    payload = json.dumps(
+        [_row_values(vps), data, _row_values(config), ip_info, today],
+        sort_keys=True,
+        default=str,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def render_svg(vps, data, config=None, ip_info=None, today=None) -> Tuple[str, str]:
+    """Return ``(key, content)`` for a card, rendering only on a cache miss."""
+    today = today or date.today()
+    if ip_info is None:
+        ip_info = build_ip_info(vps)
+    key = svg_cache_key(vps, data, config, ip_info, today)
+    with _svg_cache_lock:
+        content = _svg_cache.get(key)
+        if content is not None:
+            _svg_cache.move_to_end(key)
+            return key, content
+
+    def render():
+        content = env.get_template("vps.svg").render(
+            vps=vps,
+            data=data,
+            specs=parse_instance_config(vps.instance_config),
+            today=today,
+            config=config,
+            ip_info=ip_info,
+        )
+        with _svg_cache_lock:
+            _svg_cache[key] = content
+            while len(_svg_cache) > SVG_CACHE_SIZE:
+                _svg_cache.popitem(last=False)
+        return content
+
+    return key, single_flight(("render", key), render)
+
+
+def svg_is_current(safe_name: str, key: str) -> bool:
+    """Return True if the published card for ``safe_name`` was rendered from ``key``."""
+    return _svg_published.get(safe_name) == key and (STATIC_DIR / f"{safe_name}.svg").exists()
 
-    _isp_cache[clean_ip] = (now, isp)
-    return isp
 
+def generate_svg(vps, data, config=None, safe_name=None, ip_info=None):
+    """Write the card for ``vps`` to ``static/images`` and return its path.
 
-def generate_svg(vps, data, config=None, safe_name=None):
-    template = env.get_template("vps.svg")
-    specs = parse_instance_config(vps.instance_config)
+    The file is only rewritten when the rendered content changed, and is
+    replaced atomically so concurrent readers never see a partial card.
+    Publishes of the same card are serialized, whatever content they carry.
+    """
     images_dir = STATIC_DIR.resolve()
     images_dir.mkdir(parents=True, exist_ok=True)
     if safe_name is None:
@@ -443,21 +590,18 @@ def generate_svg(vps, data, config=None, safe_name=None):
     if PurePath(safe_name).name != safe_name:
         raise ValueError("Unsafe VPS name detected")
     out_file = images_dir / f"{safe_name}.svg"
-    today = date.today()
-    ip_raw = getattr(vps, "ip_address", "") or ""
-    ip_info = {
-        "ip_display": mask_ip(ip_raw) if ip_raw else "-",
-        "ping_status": ping_ip(ip_raw) if ip_raw and vps.status not in ["sold", "inactive"] else "未知",
-        "flag": ip_to_flag(ip_raw) if ip_raw else "🏳️",
-        "isp": ip_to_isp(ip_raw) if ip_raw else "-",
-    }
-    content = template.render(
-        vps=vps,
-        data=data,
-        specs=specs,
-        today=today,
-        config=config,
-        ip_info=ip_info,
-    )
-    out_file.write_text(content, encoding="utf-8")
-    return out_file
+    key, content = render_svg(vps, data, config, ip_info)
+
+    with _publish_locks_lock:
+        lock = _publish_locks.setdefault(safe_name, threading.Lock())
+
+    def publish():
+        with lock:
+            if _svg_published.get(safe_name) != key or not out_file.exists():
+                # After a restart the file on disk may already hold this content
+                if not out_file.exists() or out_file.read_text(encoding="utf-8") != content:
+                    atomic_write_text(out_file, content)
+                _svg_published[safe_name] = key
+        return out_file
+
+    return single_flight(("publish", safe_name, key), publish)
@@ -0,0 +1,139 @@
+"""Materialized VPS valuations.
+
+Valuations are computed in batch by :func:`refresh_valuations` (from the
+scheduler and after every VPS write) and stored in ``vps_valuation``.
+Request handlers read them back with :func:`get_valuations`, which only
+falls back to computing rows that are missing or from an earlier day.
+"""
+
+import os
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .db import engine
+from .models import VPS, VPSValuation
+from .utils import calculate_remaining_many
+
+# Minutes between scheduled refreshes, so rate changes reach stored values.
+VALUATION_REFRESH_MINUTES = int(os.environ.get("VALUATION_REFRESH_MINUTES", "30"))
+# SQLite limits the number of bound parameters per statement.
+_ID_CHUNK = 500
+
+_FIELDS = (
+    "remaining_days",
+    "remaining_value",
+    "total_value",
+    "final_price",
+    "push_fee_cny",
+    "cycle_start",
+    "cycle_end",
+)
+
+
+def _row_to_data(row: VPSValuation) -> dict:
+    return {field: getattr(row, field) for field in _FIELDS}
+
+
+def _load_rows(db: Session, ids: List[int]) -> Dict[int, VPSValuation]:
+    rows = {}
+    for i in range(0, len(ids), _ID_CHUNK):
+        chunk = ids[i : i + _ID_CHUNK]
+        for row in db.query(VPSValuation).filter(VPSValuation.vps_id.in_(chunk)):
+            rows[row.vps_id] = row
+    return rows
+
+
+def _store(results: Dict[int, dict], today: date) -> None:
+    """Upsert ``results`` in a private session.
+
+    A separate session keeps the caller's instances from being expired
+    by the commit.
+    """
+    now = datetime.utcnow()
+    with Session(engine) as db:
+        existing = _load_rows(db, list(results))
+        for vps_id, data in results.items():
+            row = existing.get(vps_id)
+            if row is None:
+                row = VPSValuation(vps_id=vps_id)
+                db.add(row)
+            row.valued_on = today
+            row.updated_at = now
+            for field in _FIELDS:
+                setattr(row, field, data.get(field, 0.0))
+        db.commit()
+
+
+def _compute(vps_list: List[VPS], today: date) -> Dict[int, dict]:
+    results = {}
+    for vps, data in zip(vps_list, calculate_remaining_many(vps_list, today)):
+        data.setdefault("final_price", 0.0)
+        data.setdefault("push_fee_cny", 0.0)
+        results[vps.id] = {field: data[field] for field in _FIELDS}
+    return results
+
+
+def refresh_valuations(vps_list: Optional[Iterable[VPS]] = None) -> Dict[int, dict]:
+    """Recompute and store valuations, returning ``{vps_id: data}``.
+
+    All VPS rows are refreshed unless ``vps_list`` is given.
+    """
+    today = date.today()
+    if vps_list is None:
+        with Session(engine) as db:
+            results = _compute(db.query(VPS).all(), today)
+    else:
+        results = _compute(list(vps_list), today)
+    if results:
+        _store(results, today)
+    return results
+
+
+def refresh_stale_valuations() -> bool:
+    """Refresh every valuation if the oldest stored one predates today.
+
+    SQL list queries sort on the stored rows, so they must be current
+    before a page is ordered.  The check reads the ``valued_on`` index
+    only; returns True when a refresh ran.
+    """
+    today = date.today()
+    with Session(engine) as db:
+        oldest = db.query(func.min(VPSValuation.valued_on)).scalar()
+    if oldest is None or oldest >= today:
+        return False
+    refresh_valuations()
+    return True
+
+
+def get_valuations(db: Session, vps_list: Iterable[VPS]) -> Dict[int, dict]:
+    """Return stored valuations for ``vps_list`` as ``{vps_id: data}``.
+
+    Rows that are missing or were computed on an earlier day are valued
+    on the spot and written back, so callers always get current data.
+    """
+    rows = list(vps_list)
+    if not rows:
+        return {}
+    today = date.today()
+    existing = _load_rows(db, [vps.id for vps in rows])
+    results = {}
+    stale = []
+    for vps in rows:
+        row = existing.get(vps.id)
+        if row is not None and row.valued_on == today:
+            results[vps.id] = _row_to_data(row)
+        else:
+            stale.append(vps)
+    if stale:
+        fresh = _compute(stale, today)
+        _store(fresh, today)
+        results.update(fresh)
+    return results
+
+
+def delete_valuation(db: Session, vps_id: int) -> None:
+    """Remove the stored valuation of a deleted VPS; the caller commits."""
+    db.query(VPSValuation).filter(VPSValuation.vps_id == vps_id).delete()
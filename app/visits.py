@@ -0,0 +1,150 @@
+"""Write-behind visit counter.
+
+Hits are aggregated in memory and written as deltas at most every
+``VISIT_FLUSH_SECONDS`` (and at shutdown) instead of committing on every
+request.  Deltas are applied with ``col = col + delta`` upserts, so any
+number of worker processes can flush into the same database without
+losing counts.  Per-day totals are kept in ``visit_stats_daily``.
+"""
+
+import atexit
+import os
+import threading
+import time
+from datetime import date
+from typing import Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from .db import engine
+from .models import VisitDaily, VisitStats
+
+# Maximum age in seconds of hits that are not yet written to the database.
+VISIT_FLUSH_SECONDS = int(os.environ.get("VISIT_FLUSH_SECONDS", "30"))
+
+_pending: Dict[date, List[int]] = {}
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_last_flush = {"time": time.time()}
+# Stored totals as of the last flush or load
+_totals = {"visitors": 0, "crawlers": 0, "time": 0.0}
+
+
+def record_visit(is_bot: bool) -> None:
+    """Count one hit; schedule a background flush when the interval passed."""
+    today = date.today()
+    with _pending_lock:
+        bucket = _pending.setdefault(today, [0, 0])
+        bucket[1 if is_bot else 0] += 1
+    if time.time() - _last_flush["time"] >= VISIT_FLUSH_SECONDS:
+        if _flush_lock.acquire(blocking=False):
+            threading.Thread(target=_flush_in_background, daemon=True).start()
+
+
+def pending_visits() -> Dict[str, int]:
+    """Return hits counted in this process but not yet flushed."""
+    with _pending_lock:
+        visitors = sum(bucket[0] for bucket in _pending.values())
+        crawlers = sum(bucket[1] for bucket in _pending.values())
+    return {"visitors": visitors, "crawlers": crawlers}
+
+
+def _read_totals(conn) -> None:
+    row = conn.execute(
+        select(VisitStats.visitors, VisitStats.crawlers).where(VisitStats.id == 1)
+    ).first()
+    _totals["visitors"] = row.visitors if row else 0
+    _totals["crawlers"] = row.crawlers if row else 0
+    _totals["time"] = time.time()
+
+
+def get_visit_totals() -> Dict[str, int]:
+    """Return stored totals plus this process's pending hits.
+
+    Stored totals are re-read at most every ``VISIT_FLUSH_SECONDS`` so hits
+    flushed by other workers show up with the same staleness bound.
+    """
+    if time.time() - _totals["time"] >= VISIT_FLUSH_SECONDS:
+        try:
+            with engine.connect() as conn:
+                _read_totals(conn)
+        except Exception:
+            pass
+    pending = pending_visits()
+    return {key: _totals[key] + pending[key] for key in pending}
+
+
+def _take_pending() -> Dict[date, List[int]]:
+    global _pending
+    with _pending_lock:
+        taken, _pending = _pending, {}
+    return taken
+
+
+def _restore_pending(deltas: Dict[date, List[int]]) -> None:
+    with _pending_lock:
+        for day, (visitors, crawlers) in deltas.items():
+            bucket = _pending.setdefault(day, [0, 0])
+            bucket[0] += visitors
+            bucket[1] += crawlers
+
+
+def _write(deltas: Dict[date, List[int]]) -> None:
+    visitors = sum(v for v, _ in deltas.values())
+    crawlers = sum(c for _, c in deltas.values())
+    with engine.begin() as conn:
+        stmt = insert(VisitStats).values(id=1, visitors=visitors, crawlers=crawlers)
+        conn.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[VisitStats.id],
+                set_={
+                    "visitors": VisitStats.visitors + stmt.excluded.visitors,
+                    "crawlers": VisitStats.crawlers + stmt.excluded.crawlers,
+                },
+            )
+        )
+        for day, (day_visitors, day_crawlers) in deltas.items():
+            stmt = insert(VisitDaily).values(
+                day=day, visitors=day_visitors, crawlers=day_crawlers
+            )
+            conn.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[VisitDaily.day],
+                    set_={
+                        "visitors": VisitDaily.visitors + stmt.excluded.visitors,
+                        "crawlers": VisitDaily.crawlers + stmt.excluded.crawlers,
+                    },
+                )
+            )
+        _read_totals(conn)
+
+
+def _flush() -> bool:
+    _last_flush["time"] = time.time()
+    deltas = _take_pending()
+    if not deltas:
+        return True
+    try:
+        _write(deltas)
+    except Exception:
+        # Keep the counts for the next attempt rather than dropping them
+        _restore_pending(deltas)
+        return False
+    return True
+
+
+def _flush_in_background() -> None:
+    try:
+        _flush()
+    finally:
+        _flush_lock.release()
+
+
+def flush_visits() -> bool:
+    """Write pending hits to the database.  Returns ``False`` on failure."""
+    with _flush_lock:
+        return _flush()
+
+
+atexit.register(flush_visits)
@@ -0,0 +1,108 @@
+"""JSON records for the public fleet API.
+
+``vps_record`` turns a ``(vps, data, specs, ip_info)`` list row into the
+record served by ``/api/vps``.  Only the masked address is exposed, as on
+the public list.  ``fields`` selects top-level keys or single nested keys
+(``valuation.remaining_value``); ``id`` is always included so clients
+can page and join.
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import func
+
+from .models import IPMetadata, VPSChange, VPSValuation
+
+_VPS_FIELDS = (
+    "name",
+    "status",
+    "vendor_name",
+    "location",
+    "currency",
+    "renewal_price",
+    "renewal_days",
+    "purchase_date",
+    "traffic_limit",
+    "description",
+    "sale_percent",
+    "sale_fixed",
+    "sale_method",
+)
+_NESTED = {
+    "valuation": (
+        "remaining_days",
+        "remaining_value",
+        "total_value",
+        "final_price",
+        "push_fee_cny",
+        "cycle_start",
+        "cycle_end",
+    ),
+    "specs": ("cpu", "memory", "storage"),
+    "ip_info": ("ip_display", "flag", "isp", "ping_status"),
+}
+API_FIELDS = frozenset(
+    ("id",)
+    + _VPS_FIELDS
+    + tuple(_NESTED)
+    + tuple(f"{group}.{key}" for group, keys in _NESTED.items() for key in keys)
+)
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def vps_record(vps, data, specs, ip_info) -> dict:
+    record = {"id": vps.id}
+    record.update((field, _plain(getattr(vps, field))) for field in _VPS_FIELDS)
+    for group, source in (("valuation", data), ("specs", specs), ("ip_info", ip_info)):
+        record[group] = {key: _plain(source.get(key)) for key in _NESTED[group]}
+    return record
+
+
+def parse_fields(value):
+    """Return the field names in a ``fields=`` value, or ``None`` for all.
+
+    Raises ``ValueError`` naming the first unknown field.
+    """
+    if not value:
+        return None
+    fields = [name.strip() for name in value.split(",") if name.strip()]
+    for name in fields:
+        if name not in API_FIELDS:
+            raise ValueError(f"unknown field: {name}")
+    return fields
+
+
+def project(record: dict, fields) -> dict:
+    """Return ``record`` reduced to ``fields`` (see ``parse_fields``)."""
+    if fields is None:
+        return record
+    out = {"id": record["id"]}
+    for name in fields:
+        group, _, key = name.partition(".")
+        if not key:
+            out[group] = record[group]
+        elif out.get(group) is not record[group]:
+            out.setdefault(group, {})[key] = record[group][key]
+    return out
+
+
+def last_modified(db, vps_list):
+    """Return when the stored data behind ``vps_list`` last changed.
+
+    Covers valuations, geo/ping results and the VPS change log; ``None``
+    when nothing has been recorded yet.
+    """
+    ids = [vps.id for vps in vps_list]
+    ips = [vps.ip_address for vps in vps_list if vps.ip_address]
+    stamps = [
+        db.query(func.max(VPSChange.changed_at)).scalar(),
+        db.query(func.max(VPSValuation.updated_at)).filter(VPSValuation.vps_id.in_(ids)).scalar()
+        if ids else None,
+        db.query(func.max(IPMetadata.updated_at)).filter(IPMetadata.ip.in_(ips)).scalar()
+        if ips else None,
+    ]
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    return max(stamps) if stamps else None
@@ -0,0 +1,107 @@
+"""Incrementally maintained public VPS list.
+
+``VPSIndex`` keeps the ``(vps, data, specs, ip_info)`` rows keyed by VPS
+id together with a sorted list of ``(status rank, -remaining value, id)``
+keys, so one changed server is located with ``bisect`` in O(log n) and
+re-slotted without re-sorting the list.
+
+Writes append the changed id to the ``vps_changes`` table.  Each worker
+remembers the last change it applied and, on its next read, reloads only
+the servers changed since then in any process.  The log keeps the last
+``VPS_CHANGE_LOG_SIZE`` entries; a worker that fell further behind
+rebuilds its list.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+import os
+
+from sqlalchemy import delete, func, insert, select
+
+from .db import engine, read_engine
+from .models import VPSChange
+
+VPS_CHANGE_LOG_SIZE = int(os.environ.get("VPS_CHANGE_LOG_SIZE", "1000"))
+STATUS_ORDER = {"active": 0, "forsale": 1, "sold": 2, "inactive": 3}
+
+
+def sort_key(vps, data) -> tuple:
+    """Order active servers first, then by remaining value, highest first."""
+    return (STATUS_ORDER.get(vps.status, 3), -data["remaining_value"], vps.id)
+
+
+class VPSIndex:
+    def __init__(self, rows=()):
+        self._rows = {}
+        self._keys = []
+        self._list = None
+        for row in rows:
+            self.upsert(row)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, vps_id):
+        return vps_id in self._rows
+
+    def upsert(self, row) -> None:
+        """Insert or replace the row for ``row[0].id`` in sort order."""
+        vps, data = row[0], row[1]
+        self.remove(vps.id)
+        key = sort_key(vps, data)
+        insort(self._keys, key)
+        self._rows[vps.id] = (key, row)
+        self._list = None
+
+    def remove(self, vps_id) -> None:
+        entry = self._rows.pop(vps_id, None)
+        if entry is not None:
+            del self._keys[bisect_left(self._keys, entry[0])]
+            self._list = None
+
+    def rows(self) -> list:
+        """Return the rows in display order; reused until the next change."""
+        if self._list is None:
+            self._list = [self._rows[key[2]][1] for key in self._keys]
+        return self._list
+
+
+def page_rows(rows: list, after=None, limit: int = 50):
+    """Return ``(page, next key)`` from sorted ``rows``, after the key ``after``.
+
+    The next key is ``None`` on the last page.
+    """
+    key = lambda row: sort_key(row[0], row[1])
+    start = bisect_right(rows, tuple(after), key=key) if after is not None else 0
+    page = rows[start:start + limit]
+    more = start + limit < len(rows)
+    return page, key(page[-1]) if more else None
+
+
+def record_vps_change(vps_id: int) -> None:
+    """Log a change to ``vps_id`` for every worker's list."""
+    with engine.begin() as conn:
+        latest = conn.execute(insert(VPSChange).values(vps_id=vps_id)).inserted_primary_key[0]
+        conn.execute(delete(VPSChange).where(VPSChange.id <= latest - VPS_CHANGE_LOG_SIZE))
+
+
+def latest_vps_change() -> int:
+    with read_engine.connect() as conn:
+        return conn.execute(select(func.max(VPSChange.id))).scalar() or 0
+
+
+def vps_changes_since(cursor: int):
+    """Return ``(latest id, changed VPS ids, complete)`` after ``cursor``.
+
+    ``complete`` is False when entries after ``cursor`` were already pruned
+    and the caller must rebuild instead of applying the ids.
+    """
+    with read_engine.connect() as conn:
+        rows = conn.execute(
+            select(VPSChange.id, VPSChange.vps_id)
+            .where(VPSChange.id > cursor)
+            .order_by(VPSChange.id)
+        ).all()
+    if not rows:
+        return cursor, [], True
+    complete = rows[0].id == cursor + 1
+    return rows[-1].id, list(dict.fromkeys(row.vps_id for row in rows)), complete
@@ -0,0 +1,131 @@
+"""Filtered, keyset-paginated VPS list queries.
+
+Every sort order is a tuple of ascending SQL expressions ending in
+``VPS.id``; descending numeric keys are negated.  A page cursor is the
+key of the last row shown, and the next page is the rows whose key is
+greater, so no page skips over the rows before it the way ``OFFSET``
+does.  Pages are not free of the table size, though: the status rank and
+remaining value come from two tables, so SQLite still sorts the filtered
+rows for each page.  The default ``status`` order matches
+``vps_index.sort_key``, so cursors from the cached list and from SQL are
+interchangeable.
+
+Value and days orders read the stored ``vps_valuation`` rows, i.e. the
+valuation as of the last refresh.  Callers should run
+``valuation.refresh_stale_valuations`` first, so the order matches the
+values shown on the cards.
+"""
+
+import base64
+import json
+import os
+
+from sqlalchemy import case, distinct, func, tuple_
+
+from .models import VPS, VPSValuation
+from .vps_index import STATUS_ORDER
+
+VPS_PAGE_SIZE = int(os.environ.get("VPS_PAGE_SIZE", "50"))
+VPS_PAGE_MAX = int(os.environ.get("VPS_PAGE_MAX", "200"))
+
+FILTERS = {
+    "status": VPS.status,
+    "vendor": VPS.vendor_name,
+    "location": VPS.location,
+    "currency": VPS.currency,
+}
+
+_rank = case(STATUS_ORDER, value=VPS.status, else_=3)
+_value = func.coalesce(VPSValuation.remaining_value, 0.0)
+SORTS = {
+    # Active servers first, then by remaining value, highest first
+    "status": (_rank, -_value, VPS.id),
+    "value": (-_value, VPS.id),
+    # Closest to renewal first
+    "days": (func.coalesce(VPSValuation.remaining_days, 0), VPS.id),
+    "name": (func.coalesce(VPS.name, ""), VPS.id),
+}
+DEFAULT_SORT = "status"
+
+
+def encode_cursor(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, sort: str) -> tuple:
+    """Return the key in ``token``; ``ValueError`` if it is not one for ``sort``."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError) as exc:
+        raise ValueError("invalid cursor") from exc
+    if not isinstance(key, list) or len(key) != len(SORTS[sort]):
+        raise ValueError("invalid cursor")
+    # Only the name sort has a text key; ids are always integers
+    types = (str,) if sort == "name" else (int, float)
+    if any(not isinstance(v, types) or isinstance(v, bool) for v in key[:-1]):
+        raise ValueError("invalid cursor")
+    if not isinstance(key[-1], int) or isinstance(key[-1], bool):
+        raise ValueError("invalid cursor")
+    return tuple(key)
+
+
+def parse_list_args(args) -> dict:
+    """Validate list query parameters from a request's ``args``.
+
+    Returns ``{"filters", "sort", "after", "limit"}``; raises ``ValueError``
+    with a message suitable for a 400 response.
+    """
+    filters = {}
+    for name in FILTERS:
+        values = [v for v in args.getlist(name) if v]
+        if values:
+            filters[name] = values
+    sort = args.get("sort") or DEFAULT_SORT
+    if sort not in SORTS:
+        raise ValueError(f"unknown sort: {sort}")
+    try:
+        limit = int(args.get("limit") or VPS_PAGE_SIZE)
+    except ValueError as exc:
+        raise ValueError("limit must be an integer") from exc
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    after = args.get("after")
+    return {
+        "filters": filters,
+        "sort": sort,
+        "after": decode_cursor(after, sort) if after else None,
+        "limit": min(limit, VPS_PAGE_MAX),
+    }
+
+
+def list_query(db, filters=None, sort=DEFAULT_SORT, after=None):
+    """Return a query of ``(VPS, *sort key)`` rows in ``sort`` order."""
+    keys = SORTS[sort]
+    columns = [key.label(f"key{i}") for i, key in enumerate(keys)]
+    query = db.query(VPS, *columns).outerjoin(VPSValuation, VPSValuation.vps_id == VPS.id)
+    for name, values in (filters or {}).items():
+        query = query.filter(FILTERS[name].in_(values))
+    if after is not None:
+        query = query.filter(tuple_(*keys) > tuple_(*after))
+    return query.order_by(*keys)
+
+
+def query_page(db, filters=None, sort=DEFAULT_SORT, after=None, limit=VPS_PAGE_SIZE):
+    """Return ``(vps_list, next key)``; the key is ``None`` on the last page."""
+    rows = list_query(db, filters, sort, after).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return [row[0] for row in rows], tuple(rows[-1][1:]) if more else None
+
+
+def filter_options(db) -> dict:
+    """Return the distinct vendors, locations and currencies in use."""
+    options = {}
+    for name in ("vendor", "location", "currency"):
+        column = FILTERS[name]
+        options[name] = [
+            value
+            for (value,) in db.query(distinct(column)).filter(column.is_not(None)).order_by(column)
+            if value
+        ]
+    return options
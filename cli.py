@@ -1,16 +1,14 @@
 from datetime import datetime, date
 import argparse
-import requests
 from sqlalchemy.orm import Session
 from wcwidth import wcswidth
 
-from app.db import engine, Base
+from app.db import engine, run_migrations
+from app.emoji import build_emoji_assets
+from app.ipdb import IPDB_PATH, compile_ipdb
 from app.models import VPS
-from app.utils import calculate_remaining
-
-Base.metadata.create_all(bind=engine)
-
-RATE_API = "https://open.er-api.com/v6/latest/"
+from app.rates import get_rate, load_rate_snapshot
+from app.utils import calculate_remaining_many
 
 CYCLE_CHOICES = {
     "1": ("Monthly", 30),
@@ -20,14 +18,8 @@ CYCLE_CHOICES = {
 }
 
 def fetch_rate(currency: str) -> float:
-    """Fetch exchange rate for currency to CNY."""
-    try:
-        resp = requests.get(f"{RATE_API}{currency}", timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        return float(data.get("rates", {}).get("CNY", 1.0))
-    except Exception:
-        return 1.0
+    """Return the exchange rate for currency to CNY."""
+    return get_rate(currency, "CNY", 1.0)
 
 def prompt_date(prompt: str, default: date | None = None) -> date:
     while True:
@@ -87,8 +79,7 @@ def list_vps():
         f"{pad('Price',10,'right')} {pad('Remain(d)',10,'right')} {pad('Value(CNY)',12,'right')}"
     )
     print(header)
-    for vps in vps_list:
-        data = calculate_remaining(vps)
+    for vps, data in zip(vps_list, calculate_remaining_many(vps_list)):
         price_str = f"{vps.renewal_price:.2f}"
         remain_value_str = f"{data['remaining_value']:.2f}"
         line = (
@@ -99,6 +90,11 @@ def list_vps():
         )
         print(line)
 
+def build_emoji():
+    """Download the flag and status emoji into static/twemoji."""
+    written, missing = build_emoji_assets()
+    print(f"{len(written)} emoji added, {len(missing)} not available.")
+
 def interactive_menu():
     while True:
         print("\n1. List VPS\n2. Add VPS\n3. Quit")
@@ -114,8 +110,20 @@ def interactive_menu():
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("action", nargs="?", choices=["list", "add"])
+    parser.add_argument("action", nargs="?", choices=["list", "add", "emoji", "ipdb"])
+    parser.add_argument("source", nargs="?", help="range CSV/TSV for the ipdb action")
     args = parser.parse_args()
+    if args.action == "emoji":
+        build_emoji()
+        return
+    if args.action == "ipdb":
+        if not args.source:
+            parser.error("ipdb needs the path of an ip2asn TSV or DB-IP CSV file")
+        count = compile_ipdb(args.source)
+        print(f"{count} IP ranges written to {IPDB_PATH}.")
+        return
+    run_migrations()
+    load_rate_snapshot()
     if args.action == "list":
         list_vps()
     elif args.action == "add":
@@ -6,8 +6,30 @@
                 return await res.text();
             },
             async () => {
-                const res = await fetch('/traceroute/1.1.1.1');
-                return await res.text();
+                // Start a traceroute job and follow its hops as they arrive;
+                // a recent result for the same target is replayed at once
+                const res = await fetch('/traceroute/jobs', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({target: '1.1.1.1'})
+                });
+                if (!res.ok) return;
+                const job = await res.json();
+                await new Promise(resolve => {
+                    const source = new EventSource(job.events);
+                    const finish = () => {
+                        source.close();
+                        resolve();
+                    };
+                    source.addEventListener('hop', event => {
+                        const hop = JSON.parse(event.data);
+                        if (hop.hop) {
+                            loadingOverlay.update(1, tests.length, '路由跟踪 第 ' + hop.hop + ' 跳');
+                        }
+                    });
+                    source.addEventListener('done', finish);
+                    source.onerror = finish;
+                });
             }
         ];
 
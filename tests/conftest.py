@@ -0,0 +1,16 @@
+import pytest
+from sqlalchemy import create_engine
+
+from app import ipmeta
+from app.models import IPMetadata
+
+
+@pytest.fixture(autouse=True)
+def ip_metadata_engine(tmp_path_factory, monkeypatch):
+    """Give every test its own empty ``ip_metadata`` table."""
+    path = tmp_path_factory.mktemp("ipmeta") / "ip_metadata.db"
+    engine = create_engine(f"sqlite:///{path}")
+    IPMetadata.__table__.create(engine)
+    monkeypatch.setattr(ipmeta, "engine", engine)
+    yield engine
+    engine.dispose()
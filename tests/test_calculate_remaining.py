@@ -0,0 +1,68 @@
+from datetime import date
+from types import SimpleNamespace
+
+from app.utils import calculate_remaining, calculate_remaining_many
+
+
+def make_vps(**kwargs):
+    defaults = dict(
+        purchase_date=date(2024, 1, 31),
+        renewal_days=30,
+        renewal_price=10.0,
+        currency="USD",
+        exchange_rate=7.0,
+        exchange_rate_source="custom",
+        sale_percent=0.0,
+        sale_fixed=0.0,
+        push_fee=0.0,
+        push_fee_currency="CNY",
+    )
+    defaults.update(kwargs)
+    return SimpleNamespace(**defaults)
+
+
+def test_calculate_remaining_monthly_cycle():
+    vps = make_vps(sale_percent=10.0, sale_fixed=5.0, push_fee=2.0)
+    data = calculate_remaining(vps, today=date(2024, 3, 10))
+    assert data["cycle_start"] == date(2024, 2, 29)
+    assert data["cycle_end"] == date(2024, 3, 29)
+    assert data["remaining_days"] == 19
+    assert data["total_value"] == 70.0
+    assert data["remaining_value"] == round(70.0 * 19 / 29, 2)
+    assert data["push_fee_cny"] == 2.0
+    assert data["final_price"] == round((70.0 * 19 / 29 + 2.0) * 1.1 + 5.0, 2)
+
+
+def test_calculate_remaining_without_purchase_date():
+    data = calculate_remaining(make_vps(purchase_date=None))
+    assert data == {
+        "remaining_days": 0,
+        "remaining_value": 0.0,
+        "total_value": 0.0,
+        "cycle_start": None,
+        "cycle_end": None,
+    }
+
+
+def test_calculate_remaining_many_matches_single_rows(monkeypatch):
+    lookups = []
+
+    def fake_get_rate(src, dst="CNY", default=None):
+        lookups.append(src)
+        return {"USD": 7.0, "EUR": 8.0, "CNY": 1.0}.get(src, default)
+
+    monkeypatch.setattr("app.utils.get_rate", fake_get_rate)
+    today = date(2025, 6, 15)
+    fleet = [
+        make_vps(),
+        make_vps(purchase_date=None),
+        make_vps(renewal_days=365, exchange_rate_source="system"),
+        make_vps(renewal_days=45, currency="EUR", exchange_rate_source="system"),
+        make_vps(push_fee=3.0, push_fee_currency="EUR", sale_percent=5.0),
+        make_vps(currency="JPY", exchange_rate=0.05, exchange_rate_source="system"),
+    ]
+    batch = calculate_remaining_many(fleet, today=today)
+    # One lookup per distinct currency for the whole batch
+    assert sorted(lookups) == ["EUR", "JPY", "USD"]
+    assert batch == [calculate_remaining(vps, today=today) for vps in fleet]
+    assert batch[5]["total_value"] == 0.5
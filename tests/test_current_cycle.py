@@ -0,0 +1,34 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.utils import MONTHS_MAP, add_months, current_cycle
+
+
+def loop_cycle(purchase_date, renewal_days, today):
+    """Reference implementation: roll forward one cycle at a time."""
+    start = purchase_date
+    if renewal_days in MONTHS_MAP:
+        months = MONTHS_MAP[renewal_days]
+        while add_months(start, months) <= today:
+            start = add_months(start, months)
+        end = add_months(start, months)
+    else:
+        delta = timedelta(days=renewal_days)
+        while start + delta <= today:
+            start += delta
+        end = start + delta
+    return start, end
+
+
+@pytest.mark.parametrize("renewal_days", sorted(MONTHS_MAP))
+@pytest.mark.parametrize(
+    "purchase_date",
+    [date(2000, 1, 28), date(2000, 1, 29), date(2000, 1, 31), date(2000, 2, 29)],
+)
+def test_current_cycle_month_end_clamping(renewal_days, purchase_date):
+    for offset in range(0, 365 * 12, 17):
+        today = purchase_date + timedelta(days=offset)
+        assert current_cycle(purchase_date, renewal_days, today) == loop_cycle(
+            purchase_date, renewal_days, today
+        )
@@ -0,0 +1,28 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.utils import MONTHS_MAP, add_months, current_cycle
+
+hypothesis = pytest.importorskip("hypothesis")
+from hypothesis import given, settings, strategies as st  # noqa: E402
+
+from test_current_cycle import loop_cycle  # noqa: E402
+
+
+dates = st.dates(min_value=date(1990, 1, 1), max_value=date(2060, 12, 31))
+month_ends = st.builds(
+    lambda d: add_months(date(d.year, d.month, 1), 1) - timedelta(days=1), dates
+)
+
+
+@settings(max_examples=500, deadline=None)
+@given(
+    purchase_date=st.one_of(dates, month_ends),
+    today=dates,
+    renewal_days=st.one_of(st.sampled_from(sorted(MONTHS_MAP)), st.integers(1, 1200)),
+)
+def test_current_cycle_matches_loop(purchase_date, today, renewal_days):
+    assert current_cycle(purchase_date, renewal_days, today) == loop_cycle(
+        purchase_date, renewal_days, today
+    )
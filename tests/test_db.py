@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.db import create_sqlite_engine
+
+
+@pytest.fixture
+def engines(tmp_path):
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    writer = create_sqlite_engine(url)
+    with writer.begin() as conn:
+        conn.execute(text("CREATE TABLE counter (id INTEGER PRIMARY KEY, n INTEGER)"))
+        conn.execute(text("INSERT INTO counter (id, n) VALUES (1, 0)"))
+    reader = create_sqlite_engine(url, read_only=True)
+    yield writer, reader
+    writer.dispose()
+    reader.dispose()
+
+
+def test_pragmas_applied_on_connect(engines):
+    writer, reader = engines
+    with reader.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA temp_store")).scalar() == 2  # MEMORY
+
+
+def test_read_only_engine_rejects_writes(engines):
+    _, reader = engines
+    with pytest.raises(OperationalError):
+        with reader.begin() as conn:
+            conn.execute(text("UPDATE counter SET n = n + 1"))
+
+
+def test_concurrent_readers_alongside_writer(engines):
+    writer, reader = engines
+    errors = []
+    seen = []
+    done = threading.Event()
+
+    def write():
+        try:
+            for _ in range(200):
+                with writer.begin() as conn:
+                    conn.execute(text("UPDATE counter SET n = n + 1"))
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            done.set()
+
+    def read():
+        try:
+            last = 0
+            while not done.is_set():
+                with reader.connect() as conn:
+                    value = conn.execute(text("SELECT n FROM counter")).scalar()
+                assert value >= last
+                last = value
+            seen.append(last)
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    threads.append(threading.Thread(target=write))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert len(seen) == 8
+    with reader.connect() as conn:
+        assert conn.execute(text("SELECT n FROM counter")).scalar() == 200
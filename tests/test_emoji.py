@@ -0,0 +1,74 @@
+import pytest
+
+from app import emoji
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b""):
+        self.status_code = status_code
+        self.content = content
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise OSError(self.status_code)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    def no_network(*args, **kwargs):
+        raise AssertionError("emoji lookups must not use the network")
+
+    monkeypatch.setattr(emoji.requests, "get", no_network)
+    monkeypatch.setattr(emoji, "EMOJI_DIR", tmp_path)
+    monkeypatch.setattr(emoji, "_data_uris", {})
+    monkeypatch.setattr(emoji, "_loaded", False)
+    return tmp_path
+
+
+def test_bundled_status_emoji_are_present():
+    for status in emoji.STATUS_EMOJI:
+        assert (emoji.EMOJI_DIR / f"{emoji.emoji_code(status)}.svg").exists()
+
+
+def test_lookup_reads_precomputed_data_uri(store):
+    (store / "1f1fa-1f1f8.svg").write_bytes(b"<svg/>")
+    assert emoji.load_emoji_assets() == 1
+    assert emoji.twemoji_url("🇺🇸") == "data:image/svg+xml;base64,PHN2Zy8+"
+
+
+def test_variation_selector_is_ignored(store):
+    (store / "1f3f3.svg").write_bytes(b"<svg/>")
+    assert emoji.emoji_code("🏳️") == "1f3f3"
+    assert emoji.twemoji_url("🏳️").startswith("data:image/svg+xml;base64,")
+
+
+def test_missing_emoji_is_not_remembered(store):
+    assert emoji.twemoji_url("🇯🇵") == ""
+    (store / "1f1ef-1f1f5.svg").write_bytes(b"<svg/>")
+    emoji.load_emoji_assets()
+    assert emoji.twemoji_url("🇯🇵") != ""
+
+
+def test_build_downloads_missing_assets(store, monkeypatch):
+    requested = []
+
+    class FakeSession:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def get(self, url, timeout):
+            requested.append(url.rsplit("/", 1)[1])
+            if url.endswith("1f1e6-1f1e6.svg"):
+                return FakeResponse(404)
+            return FakeResponse(200, b"<svg/>")
+
+    monkeypatch.setattr(emoji.requests, "Session", FakeSession)
+    (store / "1f534.svg").write_bytes(b"<svg/>")
+    written, missing = emoji.build_emoji_assets(emojis=["🔴", "🟢", "🇦🇦"])
+    assert written == ["🟢"]
+    assert missing == ["🇦🇦"]
+    assert requested == ["1f7e2.svg", "1f1e6-1f1e6.svg"]
+    assert emoji.has_emoji("🟢")
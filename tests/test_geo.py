@@ -0,0 +1,89 @@
+import pytest
+
+from app import geo
+
+
+class FakeResponse:
+    def __init__(self, data, headers=None, status_code=200):
+        self._data = data
+        self.headers = headers or {}
+        self.status_code = status_code
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise OSError(self.status_code)
+
+
+@pytest.fixture(autouse=True)
+def clean_cache(monkeypatch):
+    geo.reset_geo_cache()
+    monkeypatch.setattr(geo, "_paused_until", 0.0)
+    monkeypatch.setattr(geo, "lookup_offline", lambda ip: None)
+    yield
+    geo.reset_geo_cache()
+
+
+def answer(ip):
+    return {"query": ip, "countryCode": "DE", "isp": f"isp-{ip}", "org": "Org", "as": "AS1 Org"}
+
+
+def test_misses_are_grouped_into_batches(monkeypatch):
+    posts = []
+
+    def fake_post(url, json, timeout):
+        posts.append(list(json))
+        return FakeResponse([answer(ip) for ip in json])
+
+    monkeypatch.setattr(geo.requests, "post", fake_post)
+    values = [f"10.0.{i // 256}.{i % 256}" for i in range(150)]
+    result = geo.lookup_geo_many(values + ["🇩🇪 10.0.0.1:22"])
+
+    assert [len(chunk) for chunk in posts] == [100, 50]
+    assert result["🇩🇪 10.0.0.1:22"] == {
+        "country_code": "DE", "isp": "isp-10.0.0.1", "org": "Org", "as": "AS1 Org",
+    }
+
+    monkeypatch.setattr(geo.requests, "post", lambda *a, **k: pytest.fail("cached"))
+    assert geo.lookup_geo("10.0.0.5")["isp"] == "isp-10.0.0.5"
+
+
+def test_single_miss_uses_one_request_for_all_fields(monkeypatch):
+    calls = []
+
+    def fake_get(url, timeout=5):
+        calls.append(url)
+        return FakeResponse(answer("1.2.3.4"))
+
+    monkeypatch.setattr(geo.requests, "get", fake_get)
+    from app.utils import ip_to_flag, ip_to_isp
+
+    assert ip_to_flag("1.2.3.4") == "🇩🇪"
+    assert ip_to_isp("1.2.3.4") == "isp-1.2.3.4"
+    assert len(calls) == 1
+    assert "countryCode" in calls[0] and "isp" in calls[0]
+
+
+def test_exhausted_rate_limit_pauses_lookups(monkeypatch):
+    calls = []
+
+    def fake_get(url, timeout=5):
+        calls.append(url)
+        return FakeResponse(answer("1.1.1.1"), headers={"X-Rl": "0", "X-Ttl": "30"})
+
+    monkeypatch.setattr(geo.requests, "get", fake_get)
+    assert geo.lookup_geo("1.1.1.1")["country_code"] == "DE"
+    assert geo.lookup_geo("2.2.2.2") == geo.EMPTY_GEO
+    assert len(calls) == 1
+
+
+def test_failed_lookup_is_retried_after_short_delay(monkeypatch):
+    def broken(url, timeout=5):
+        raise OSError("network down")
+
+    monkeypatch.setattr(geo.requests, "get", broken)
+    assert geo.lookup_geo("3.3.3.3") == geo.EMPTY_GEO
+    expires, _ = geo._geo_cache["3.3.3.3"]
+    assert expires - geo.time.time() <= geo.GEO_RETRY
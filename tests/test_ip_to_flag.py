@@ -1,4 +1,5 @@
-from app.utils import ip_to_flag, _flag_cache
+from app.geo import reset_geo_cache
+from app.utils import ip_to_flag
 
 class DummyResponse:
     def __init__(self, data):
@@ -10,16 +11,16 @@ class DummyResponse:
 
 
 def test_ip_to_flag_handles_json_response(monkeypatch):
-    _flag_cache.clear()
+    reset_geo_cache()
     def fake_get(url, timeout=5):
         return DummyResponse({'countryCode': 'US'})
-    monkeypatch.setattr('app.utils.requests.get', fake_get)
+    monkeypatch.setattr('app.geo.requests.get', fake_get)
     assert ip_to_flag('8.8.8.8') == '\U0001F1FA\U0001F1F8'
 
 
 def test_ip_to_flag_extracts_ipv4(monkeypatch):
-    _flag_cache.clear()
+    reset_geo_cache()
     def fake_get(url, timeout=5):
         return DummyResponse({'countryCode': 'AU'})
-    monkeypatch.setattr('app.utils.requests.get', fake_get)
+    monkeypatch.setattr('app.geo.requests.get', fake_get)
     assert ip_to_flag('some text 🇺🇳 1.2.3.4') == '\U0001F1E6\U0001F1FA'
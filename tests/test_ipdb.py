@@ -0,0 +1,117 @@
+import pytest
+
+from app import geo, ipdb
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self._data = data
+        self.headers = {}
+        self.status_code = 200
+
+    def json(self):
+        return self._data
+
+
+IP2ASN = (
+    "1.0.0.0\t1.0.0.255\t13335\tUS\tCLOUDFLARENET\n"
+    "1.0.4.0\t1.0.7.255\t38803\tAU\tGTELECOM-AUSTRALIA\n"
+    "1.0.8.0\t1.0.15.255\t0\tNone\tNot routed\n"
+    "2001:db8::\t2001:db8::ffff\t64500\tDE\tEXAMPLE-V6\n"
+)
+
+
+@pytest.fixture
+def database(tmp_path):
+    source = tmp_path / "ip2asn-combined.tsv"
+    source.write_text(IP2ASN, encoding="utf-8")
+    out = tmp_path / "ipdb.bin"
+    assert ipdb.compile_ipdb(source, out) == 3
+    db = ipdb.IPDatabase(out)
+    yield db
+    db.close()
+
+
+def test_ipv4_range_lookup(database):
+    assert database.lookup("1.0.0.1") == {
+        "country_code": "US",
+        "isp": "CLOUDFLARENET",
+        "org": "CLOUDFLARENET",
+        "as": "AS13335 CLOUDFLARENET",
+    }
+    assert database.lookup("1.0.7.255")["country_code"] == "AU"
+
+
+def test_gaps_and_unrouted_space_are_not_covered(database):
+    assert database.lookup("0.255.255.255") is None
+    assert database.lookup("1.0.2.1") is None
+    assert database.lookup("1.0.9.9") is None
+    assert database.lookup("255.255.255.255") is None
+
+
+def test_ipv6_range_lookup(database):
+    assert database.lookup("2001:db8::42")["as"] == "AS64500 EXAMPLE-V6"
+    assert database.lookup("2001:db8::1:0") is None
+
+
+def test_dbip_country_csv(tmp_path):
+    source = tmp_path / "dbip-country-lite.csv"
+    source.write_text(
+        "ip_start,ip_end,country\n"
+        "8.8.8.0,8.8.8.255,US\n"
+        "2a00:1450::,2a00:1450:ffff:ffff:ffff:ffff:ffff:ffff,IE\n",
+        encoding="utf-8",
+    )
+    out = tmp_path / "ipdb.bin"
+    ipdb.compile_ipdb(source, out)
+    db = ipdb.IPDatabase(out)
+    try:
+        assert db.lookup("8.8.8.8") == {"country_code": "US", "isp": "", "org": "", "as": ""}
+        assert db.lookup("2a00:1450::1")["country_code"] == "IE"
+    finally:
+        db.close()
+
+
+def test_geo_prefers_local_database(database, monkeypatch):
+    geo.reset_geo_cache()
+    monkeypatch.setattr(geo, "lookup_offline", database.lookup)
+    monkeypatch.setattr(geo.requests, "get", lambda *a, **k: pytest.fail("network used"))
+    assert geo.lookup_geo("vps [2001:db8::7]:22")["country_code"] == "DE"
+
+    monkeypatch.setattr(geo, "GEO_HTTP_FALLBACK", False)
+    assert geo.lookup_geo("9.9.9.9") == geo.EMPTY_GEO
+    geo.reset_geo_cache()
+
+
+def test_country_only_records_take_isp_from_fallback(tmp_path, monkeypatch):
+    source = tmp_path / "dbip-country-lite.csv"
+    source.write_text("8.8.8.0,8.8.8.255,US\n", encoding="utf-8")
+    out = tmp_path / "ipdb.bin"
+    ipdb.compile_ipdb(source, out)
+    db = ipdb.IPDatabase(out)
+    requested = []
+
+    def fake_get(url, timeout=5):
+        requested.append(url)
+        return FakeResponse(
+            {"countryCode": "DE", "isp": "Google LLC", "org": "Google", "as": "AS15169"}
+        )
+
+    geo.reset_geo_cache()
+    monkeypatch.setattr(geo, "lookup_offline", db.lookup)
+    monkeypatch.setattr(geo, "GEO_HTTP_FALLBACK", True)
+    monkeypatch.setattr(geo.requests, "get", fake_get)
+    try:
+        result = geo.lookup_geo("8.8.8.8")
+        assert len(requested) == 1
+        # Local fields win; only the empty ones come from ip-api
+        assert result == {
+            "country_code": "US",
+            "isp": "Google LLC",
+            "org": "Google",
+            "as": "AS15169",
+        }
+        assert geo.lookup_geo_many(["8.8.8.8"], network=False)["8.8.8.8"] == result
+    finally:
+        geo.reset_geo_cache()
+        db.close()
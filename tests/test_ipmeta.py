@@ -0,0 +1,123 @@
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+
+from app import geo, ipmeta, utils
+from app.models import IPMetadata
+
+
+class FakeResponse:
+    headers = {}
+    status_code = 200
+
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+@pytest.fixture(autouse=True)
+def clean_caches(monkeypatch):
+    geo.reset_geo_cache()
+    utils._ping_cache.clear()
+    monkeypatch.setattr(geo, "_paused_until", 0.0)
+    monkeypatch.setattr(geo, "lookup_offline", lambda ip: None)
+    yield
+    geo.reset_geo_cache()
+    utils._ping_cache.clear()
+
+
+def offline(*args, **kwargs):
+    raise AssertionError("should be served from ip_metadata")
+
+
+def test_new_worker_reads_stored_geo(monkeypatch):
+    monkeypatch.setattr(
+        geo.requests, "get", lambda url, timeout=5: FakeResponse({"countryCode": "NL", "isp": "Stored"})
+    )
+    assert utils.ip_to_isp("5.5.5.5") == "Stored"
+
+    geo.reset_geo_cache()  # as in a freshly started process
+    monkeypatch.setattr(geo.requests, "get", offline)
+    assert utils.ip_to_flag("5.5.5.5") == "🇳🇱"
+    assert utils.ip_to_isp("5.5.5.5") == "Stored"
+
+
+def test_failed_lookups_expire_before_successful_ones(ip_metadata_engine, monkeypatch):
+    def broken(url, timeout=5):
+        raise OSError("down")
+
+    monkeypatch.setattr(geo.requests, "get", broken)
+    assert geo.lookup_geo("6.6.6.6") == geo.EMPTY_GEO
+    monkeypatch.setattr(
+        geo.requests, "get", lambda url, timeout=5: FakeResponse({"countryCode": "FR"})
+    )
+    assert geo.lookup_geo("7.7.7.7")["country_code"] == "FR"
+
+    # Age both rows past the negative TTL but within the positive one
+    aged = datetime.utcnow() - timedelta(seconds=geo.GEO_RETRY + 1)
+    with ip_metadata_engine.begin() as conn:
+        conn.execute(update(IPMetadata).values(geo_checked_at=aged))
+    geo.reset_geo_cache()
+
+    calls = []
+    monkeypatch.setattr(
+        geo.requests,
+        "get",
+        lambda url, timeout=5: calls.append(url) or FakeResponse({"countryCode": "BE"}),
+    )
+    assert geo.lookup_geo("7.7.7.7")["country_code"] == "FR"
+    assert geo.lookup_geo("6.6.6.6")["country_code"] == "BE"
+    assert len(calls) == 1
+
+
+def test_ping_status_is_shared(monkeypatch):
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    target = f"127.0.0.1:{server.getsockname()[1]}"
+    try:
+        assert utils.ping_ip(target) == "🟢 在线"
+    finally:
+        server.close()
+
+    utils._ping_cache.clear()
+    monkeypatch.setattr("socket.create_connection", offline)
+    assert utils.ping_ip(target) == "🟢 在线"
+
+
+def count_rows(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(IPMetadata)).scalar()
+
+
+def test_table_is_capped(ip_metadata_engine, monkeypatch):
+    monkeypatch.setattr(ipmeta, "IP_METADATA_MAX_ROWS", 3)
+    monkeypatch.setattr(ipmeta, "IP_METADATA_PRUNE_EVERY", 1)
+    for i in range(5):
+        ipmeta.store_geo({f"10.1.0.{i}": {"country_code": "US"}})
+    assert count_rows(ip_metadata_engine) == 3
+
+
+def test_prune_runs_every_n_writes(ip_metadata_engine, monkeypatch):
+    monkeypatch.setattr(ipmeta, "IP_METADATA_MAX_ROWS", 2)
+    monkeypatch.setattr(ipmeta, "IP_METADATA_PRUNE_EVERY", 4)
+    monkeypatch.setattr(ipmeta, "_writes", 1)
+    for i in range(3):
+        ipmeta.store_ping(f"10.2.0.{i}", "x")
+    assert count_rows(ip_metadata_engine) == 3  # no check yet
+    ipmeta.store_ping("10.2.0.3", "x")  # the 4th write checks and prunes
+    assert count_rows(ip_metadata_engine) == 2
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ipmeta.LRUCache(2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache.get("a") == 1
+    cache["c"] = 3
+    assert "b" not in cache
+    assert len(cache) == 2
@@ -0,0 +1,131 @@
+import importlib.util
+import sys
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from app import latency
+from app.db import Base
+from app.models import LatencyHourly, LatencySample
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+spec = importlib.util.spec_from_file_location("app_main", ROOT / "app.py")
+app_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_module)
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    # Write out samples queued by other tests before switching databases
+    latency.flush_latency()
+    engine = create_engine(f"sqlite:///{tmp_path / 'latency.db'}")
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(latency, "engine", engine)
+    monkeypatch.setattr(latency, "read_engine", engine)
+    latency._rings.clear()
+    latency._summaries.clear()
+    return engine
+
+
+def count(engine, model):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(model)).scalar()
+
+
+def test_finished_hours_are_rolled_up(engine):
+    now = datetime.utcnow().replace(minute=30, second=0, microsecond=0)
+    earlier = now - timedelta(hours=2)
+    latency.record_samples({"a": 10.0}, when=earlier)
+    latency.record_samples({"a": 20.0}, when=earlier + timedelta(minutes=5))
+    latency.record_samples({"a": None}, when=earlier + timedelta(minutes=10))
+    latency.record_samples({"a": 5.0}, when=now)
+    assert latency.flush_latency(now)
+
+    # A late sample for the same hour is merged into the existing row
+    latency.record_samples({"a": 30.0}, when=earlier + timedelta(minutes=15))
+    assert latency.flush_latency(now)
+
+    with engine.connect() as conn:
+        row = conn.execute(select(LatencyHourly)).one()
+    assert (row.samples, row.failures) == (4, 1)
+    assert (row.rtt_min, row.rtt_avg, row.rtt_max) == (10.0, 20.0, 30.0)
+    assert count(engine, LatencySample) == 1  # only the current hour stays raw
+
+    series = latency.latency_series("a")
+    assert [b["samples"] for b in series["hourly"]] == [4, 1]
+    assert series["uptime"] == 80.0
+
+
+def test_storage_stays_bounded(engine, monkeypatch):
+    monkeypatch.setattr(latency, "LATENCY_RING_SIZE", 3)
+    monkeypatch.setattr(latency, "LATENCY_RETENTION_DAYS", 1)
+    now = datetime.utcnow()
+    for hours_ago in range(48, 0, -1):
+        latency.record_samples({"b": float(hours_ago)}, when=now - timedelta(hours=hours_ago))
+    assert latency.flush_latency(now)
+    assert len(latency.recent_samples("b")) == 3
+    assert count(engine, LatencySample) == 0
+    assert count(engine, LatencyHourly) <= 25
+
+
+def test_sparkline_points_scale_into_box():
+    assert latency.sparkline_points([10, 20, None, 10], 30, 10) == "0.0,10.0 10.0,0.0 20.0,0.0 30.0,10.0"
+    assert latency.sparkline_points([5], 30, 10) == ""
+
+
+def test_latency_api(engine):
+    name = f"lat_{uuid.uuid4().hex}"
+    with app_module.Session(app_module.engine) as db:
+        vps = app_module.VPS(name=name, ip_address="198.51.100.7", dynamic_svg=True)
+        db.add(vps)
+        db.commit()
+        vps_id = vps.id
+    latency.record_samples({"198.51.100.7": 12.5})
+    latency.record_samples({"198.51.100.7": None})
+    latency.flush_latency()
+
+    client = app_module.app.test_client()
+    body = client.get(f"/api/latency/{vps_id}").get_json()
+    assert body["uptime"] == 50.0
+    assert body["hourly"][-1]["avg"] == 12.5
+    assert [s["rtt_ms"] for s in body["recent"]] == [12.5, None]
+    assert "198.51.100.7" not in str(body)
+    assert client.get("/api/latency/999999999").status_code == 404
+
+
+def test_card_shows_sparkline_when_enabled(engine, monkeypatch):
+    from app import utils
+
+    monkeypatch.setattr(utils, "SVG_LATENCY", True)
+    monkeypatch.setattr(utils, "ping_ip", lambda ip: utils.ONLINE)
+    monkeypatch.setattr(utils, "ip_to_flag", lambda ip: "🏳️")
+    monkeypatch.setattr(utils, "ip_to_isp", lambda ip: "-")
+    now = datetime.utcnow()
+    for hours_ago in (2, 1, 0):
+        latency.record_samples({"203.0.113.9": 10.0 * hours_ago + 5}, when=now - timedelta(hours=hours_ago))
+    latency.flush_latency(now)
+
+    vps = app_module.VPS(id=1, name="spark", ip_address="203.0.113.9", status="active")
+    info = utils.build_ip_info(vps)
+    assert info["latency"]["uptime"] == 100.0
+    _, content = utils.render_svg(vps, utils._empty_valuation(), ip_info=info)
+    assert "<polyline" in content
+    assert "100.0%" in content
+
+
+def test_public_ping_records_no_history(engine, monkeypatch):
+    from app import utils
+
+    class Conn:
+        def close(self):
+            pass
+
+    monkeypatch.setattr("socket.create_connection", lambda *args, **kwargs: Conn())
+    utils._ping_cache.pop("192.0.2.44:80", None)
+    utils.ping_ip("192.0.2.44:80")
+    assert latency.recent_samples("192.0.2.44:80") == []
+    assert latency._pending == []
@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+
+from app.db import MIGRATIONS, run_migrations, schema_version
+
+
+def make_engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+
+
+def test_fresh_database_is_created_at_latest_version(tmp_path):
+    engine = make_engine(tmp_path)
+    assert run_migrations(engine) == MIGRATIONS[-1][0]
+    tables = inspect(engine).get_table_names()
+    assert {"vps", "users", "site_config", "schema_version"} <= set(tables)
+
+
+def test_legacy_database_is_upgraded(tmp_path):
+    engine = make_engine(tmp_path)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE vps (id INTEGER PRIMARY KEY, name TEXT, expiry_date DATE, "
+            "renewal_days INTEGER, renewal_price FLOAT, currency TEXT, exchange_rate FLOAT)"
+        ))
+        conn.execute(text(
+            "INSERT INTO vps (name, expiry_date, renewal_days) VALUES ('old', '2024-02-01', 31)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE site_config (id INTEGER PRIMARY KEY, image_base_url TEXT, noodseek_id TEXT)"
+        ))
+        conn.execute(text(
+            "INSERT INTO site_config (image_base_url, noodseek_id) VALUES ('https://x', '@me')"
+        ))
+
+    run_migrations(engine)
+
+    inspector = inspect(engine)
+    vps_columns = {col["name"] for col in inspector.get_columns("vps")}
+    assert {"transaction_date", "push_fee_currency", "status"} <= vps_columns
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT transaction_date FROM vps")).scalar() == "2024-01-01"
+        row = conn.execute(text("SELECT site_url, username FROM site_config")).one()
+        assert tuple(row) == ("https://x", "@me")
+        assert schema_version(conn) == MIGRATIONS[-1][0]
+
+
+def test_current_schema_costs_one_read(tmp_path):
+    engine = make_engine(tmp_path)
+    run_migrations(engine)
+    statements = []
+    event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+    run_migrations(engine)
+    assert statements == ["SELECT MAX(version) FROM schema_version"]
+
+
+def test_failed_upgrade_rolls_back_every_step(tmp_path, monkeypatch):
+    engine = make_engine(tmp_path)
+    run_migrations(engine)
+    latest = MIGRATIONS[-1][0]
+
+    def add_table(conn):
+        conn.execute(text("CREATE TABLE extra (id INTEGER PRIMARY KEY)"))
+
+    def broken(conn):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(
+        "app.db.MIGRATIONS", MIGRATIONS + [(latest + 1, add_table), (latest + 2, broken)]
+    )
+    with pytest.raises(RuntimeError):
+        run_migrations(engine)
+    assert "extra" not in inspect(engine).get_table_names()
+    with engine.connect() as conn:
+        assert schema_version(conn) == latest
@@ -0,0 +1,76 @@
+import asyncio
+import socket
+import time
+
+from app import probe, utils
+
+
+def test_fleet_status_in_one_timeout_window(monkeypatch):
+    async def fake_open_connection(host, port):
+        if host.endswith(".3"):
+            await asyncio.sleep(10)  # unreachable: only the timeout ends it
+        reader = asyncio.StreamReader()
+
+        class Writer:
+            def close(self):
+                pass
+
+            async def wait_closed(self):
+                pass
+
+        return reader, Writer()
+
+    monkeypatch.setattr(probe.asyncio, "open_connection", fake_open_connection)
+    ips = [f"10.0.{i // 256}.{i % 10}:{1000 + i}" for i in range(300)]
+    started = time.monotonic()
+    statuses = probe.probe_fleet(ips, concurrency=300, timeout=0.5)
+    elapsed = time.monotonic() - started
+
+    assert len(statuses) == 300
+    down = [ip for ip, status in statuses.items() if status == utils.OFFLINE]
+    assert len(down) == 30
+    assert all(ip.split(":")[0].endswith(".3") for ip in down)
+    assert elapsed < 3
+
+
+def test_fleet_results_are_stored_in_one_write(monkeypatch):
+    async def fake_measure(ip, timeout=None):
+        return None if ip.endswith(".2") else 1.0
+
+    writes = []
+    monkeypatch.setattr(probe, "measure", fake_measure)
+    monkeypatch.setattr(utils, "store_pings", lambda statuses: writes.append(dict(statuses)))
+    ips = [f"10.9.0.{i}" for i in range(5)]
+    statuses = probe.probe_fleet(ips, force=True)
+    assert writes == [statuses]
+    assert statuses["10.9.0.2"] == utils.OFFLINE
+
+
+def test_real_connections_and_cache(monkeypatch):
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(8)
+    up = f"127.0.0.1:{server.getsockname()[1]}"
+    try:
+        statuses = probe.probe_fleet([up, "127.0.0.1:1", up], timeout=1)
+    finally:
+        server.close()
+    assert statuses == {up: utils.ONLINE, "127.0.0.1:1": utils.OFFLINE}
+
+    # Fresh statuses are shared with ping_ip and not probed again
+    monkeypatch.setattr(probe, "probe_many", None)
+    assert probe.probe_fleet([up]) == {up: utils.ONLINE}
+    assert utils.ping_ip(up) == utils.ONLINE
+
+
+def test_bare_ip_falls_back_to_port_80(monkeypatch):
+    ports = []
+
+    async def fake_open_connection(host, port):
+        ports.append(port)
+        raise OSError("refused")
+
+    monkeypatch.setattr(probe.shutil, "which", lambda name: None)
+    monkeypatch.setattr(probe.asyncio, "open_connection", fake_open_connection)
+    assert probe.probe_fleet(["192.0.2.1"], force=True) == {"192.0.2.1": utils.OFFLINE}
+    assert ports == [80]
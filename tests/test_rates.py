@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import create_engine
+
+from app import rates
+from app.db import Base
+
+
+class DummyResponse:
+    def __init__(self, data):
+        self._data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+@pytest.fixture(autouse=True)
+def rate_db(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr("app.rates.engine", engine)
+    rates.clear_rate_cache()
+    yield engine
+    rates.clear_rate_cache()
+
+
+def test_get_rate_derives_cross_rates_from_one_fetch(monkeypatch):
+    calls = []
+
+    def fake_get(url, timeout=10):
+        calls.append(url)
+        return DummyResponse({"rates": {"USD": 1.0, "CNY": 7.0, "EUR": 0.5}})
+
+    monkeypatch.setattr("app.rates.requests.get", fake_get)
+    assert rates.get_rate("USD", "CNY") == 7.0
+    assert rates.get_rate("EUR", "CNY") == 14.0
+    assert rates.get_rate("cny", "CNY") == 1.0
+    assert rates.get_rate("XXX", "CNY", 2.5) == 2.5
+    assert len(calls) == 1
+
+
+def test_get_rate_falls_back_when_api_fails(monkeypatch):
+    calls = []
+
+    def fake_get(url, timeout=10):
+        calls.append(url)
+        raise OSError("offline")
+
+    monkeypatch.setattr("app.rates.requests.get", fake_get)
+    assert rates.get_rate("USD", "CNY", 6.5) == 6.5
+    assert rates.get_rate("EUR", "CNY", 7.5) == 7.5
+    # Failed fetches are not retried until the backoff window passes
+    assert len(calls) == 1
+
+
+def test_snapshot_survives_restart(monkeypatch):
+    monkeypatch.setattr(
+        "app.rates.requests.get",
+        lambda url, timeout=10: DummyResponse({"rates": {"USD": 1.0, "CNY": 7.1}}),
+    )
+    assert rates.get_rate("USD", "CNY") == pytest.approx(7.1)
+
+    # Simulate a restart with the API unreachable
+    rates.clear_rate_cache()
+
+    def fail(url, timeout=10):
+        raise AssertionError("offline mode must not touch the network")
+
+    monkeypatch.setattr("app.rates.requests.get", fail)
+    monkeypatch.setattr("app.rates.RATE_OFFLINE", True)
+    assert rates.load_rate_snapshot()
+    assert rates.get_rate("USD", "CNY") == pytest.approx(7.1)
+
+
+def test_offline_mode_without_snapshot_uses_default(monkeypatch):
+    def fail(url, timeout=10):
+        raise AssertionError("offline mode must not touch the network")
+
+    monkeypatch.setattr("app.rates.requests.get", fail)
+    monkeypatch.setattr("app.rates.RATE_OFFLINE", True)
+    assert rates.get_rate("USD", "CNY", 7.3) == 7.3
@@ -0,0 +1,70 @@
+import importlib.util
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+spec = importlib.util.spec_from_file_location("app_main", ROOT / "app.py")
+app_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_module)
+
+
+@pytest.fixture
+def cards(tmp_path, monkeypatch):
+    from app import utils
+
+    monkeypatch.setattr(utils, "STATIC_DIR", tmp_path)
+    monkeypatch.setattr(utils, "_svg_published", {})
+    # Keep the refresh off the network
+    monkeypatch.setattr(app_module, "build_ip_info", lambda vps: {
+        "ip_display": "-", "ping_status": "未知", "flag": "🏳️", "isp": "-",
+    })
+    names = [f"refresh_{uuid.uuid4().hex}" for _ in range(3)]
+    with app_module.Session(app_module.engine) as db:
+        for name in names:
+            db.add(app_module.VPS(
+                name=name,
+                purchase_date=app_module.date(2024, 1, 1),
+                renewal_days=30,
+                renewal_price=10,
+                currency="CNY",
+                exchange_rate=1,
+                dynamic_svg=True,
+            ))
+        db.commit()
+    return names
+
+
+def test_second_refresh_skips_unchanged_cards(cards, tmp_path):
+    first = app_module.refresh_images(workers=4)
+    assert first["failed"] == 0
+    assert first["rendered"] >= len(cards)
+    assert {f"{name}.svg" for name in cards} <= {p.name for p in tmp_path.iterdir()}
+
+    second = app_module.refresh_images(workers=4)
+    assert second["rendered"] == 0
+    assert second["skipped"] == first["rendered"]
+    assert second["seconds"] >= 0
+
+    with app_module.Session(app_module.engine) as db:
+        vps = db.query(app_module.VPS).filter(app_module.VPS.name == cards[0]).one()
+        vps.vendor_name = "Changed"
+        db.commit()
+    third = app_module.refresh_images(workers=4)
+    assert third["rendered"] == 1
+    assert "Changed" in (tmp_path / f"{cards[0]}.svg").read_text(encoding="utf-8")
+
+
+def test_failed_card_is_reported_and_others_still_render(cards, monkeypatch):
+    def lookup(vps):
+        if vps.name == cards[1]:
+            raise OSError("lookup failed")
+        return {"ip_display": "-", "ping_status": "未知", "flag": "🏳️", "isp": "-"}
+
+    monkeypatch.setattr(app_module, "build_ip_info", lookup)
+    report = app_module.refresh_images(workers=2)
+    assert report["failed"] == 1
+    assert report["rendered"] >= len(cards) - 1
@@ -0,0 +1,55 @@
+import importlib.util
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+spec = importlib.util.spec_from_file_location("app_main", ROOT / "app.py")
+app_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_module)
+flask_app = app_module.app
+
+
+@pytest.fixture
+def client():
+    flask_app.config['TESTING'] = True
+    app_module.invalidate_site_cache()
+    with flask_app.test_client() as client:
+        yield client
+
+
+def test_login_page_reuses_cached_site_stats(client, monkeypatch):
+    calls = []
+    original = app_module._load_site_stats
+
+    def counting():
+        calls.append(1)
+        return original()
+
+    monkeypatch.setattr(app_module, "_load_site_stats", counting)
+    assert client.get('/login').status_code == 200
+    assert client.get('/login').status_code == 200
+    assert len(calls) == 1
+
+
+def test_vps_write_invalidates_site_stats(client):
+    username = f"u_{uuid.uuid4().hex}"
+    res = client.post('/register', data={'username': username, 'password': 'p', 'invite_code': 'Flanker'})
+    assert res.status_code == 302
+
+    before = app_module.get_site_stats()["count"]
+    res = client.post('/vps/new', data={
+        'name': f"vps_{uuid.uuid4().hex}",
+        'purchase_date': '2024-01-01',
+        'renewal_days': '30',
+        'renewal_price': '10',
+        'currency': 'CNY',
+        'exchange_rate': '1',
+        'exchange_rate_source': 'custom',
+        'status': 'active',
+    })
+    assert res.status_code == 302
+    assert app_module.get_site_stats()["count"] == before + 1
@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Cumulative import time allowed for loading app.py, in milliseconds
+IMPORT_TIME_BUDGET_MS = int(os.environ.get("IMPORT_TIME_BUDGET_MS", "1500"))
+
+LOAD_APP = (
+    "import importlib.util, sys; "
+    f"sys.path.insert(0, {str(ROOT)!r}); "
+    f"spec = importlib.util.spec_from_file_location('app_main', {str(ROOT / 'app.py')!r}); "
+    "m = importlib.util.module_from_spec(spec); spec.loader.exec_module(m); "
+    "print(m.scheduler is None)"
+)
+
+
+def parse_importtime(stderr: str):
+    """Return ``(total_us, module_names)`` from ``-X importtime`` output."""
+    total = 0
+    names = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Top-level imports have a single space of indentation
+        if not name.startswith("  "):
+            total += int(cumulative)
+        names.append(name.strip())
+    return total, names
+
+
+def test_app_import_is_lazy_and_within_budget():
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", LOAD_APP],
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+        timeout=60,
+    )
+    assert res.returncode == 0, res.stderr[-2000:]
+    assert res.stdout.strip() == "True", "importing app.py must not start the scheduler"
+    total_us, names = parse_importtime(res.stderr)
+    heavy = {name.split(".")[0] for name in names} & {"apscheduler", "numpy"}
+    assert not heavy, f"imported eagerly: {sorted(heavy)}"
+    assert total_us / 1000 < IMPORT_TIME_BUDGET_MS
@@ -0,0 +1,189 @@
+import importlib.util
+import sys
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import quote
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+spec = importlib.util.spec_from_file_location("app_main", ROOT / "app.py")
+app_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_module)
+flask_app = app_module.app
+
+
+@pytest.fixture
+def client():
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as client:
+        yield client
+
+
+def add_card(client):
+    username = f"u_{uuid.uuid4().hex}"
+    res = client.post('/register', data={'username': username, 'password': 'p', 'invite_code': 'Flanker'})
+    assert res.status_code == 302
+    name = f"svg_{uuid.uuid4().hex}"
+    res = client.post('/vps/new', data={
+        'name': name,
+        'purchase_date': '2024-01-01',
+        'renewal_days': '30',
+        'renewal_price': '10',
+        'currency': 'CNY',
+        'exchange_rate': '1',
+        'exchange_rate_source': 'custom',
+        'dynamic_svg': 'on',
+    })
+    assert res.status_code == 302
+    return name
+
+
+def test_svg_etag_answers_304_without_rendering(client, monkeypatch):
+    name = add_card(client)
+    url = f'/vps/{quote(name)}.svg'
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.mimetype == 'image/svg+xml'
+    etag = first.headers['ETag']
+    assert not etag.startswith('W/')
+    assert first.cache_control.public
+    assert 0 <= first.cache_control.max_age <= app_module.SVG_MAX_AGE
+
+    def no_render(*args, **kwargs):
+        raise AssertionError("304 responses must not render")
+
+    monkeypatch.setattr(app_module, "render_svg", no_render)
+    second = client.get(url, headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.headers['ETag'] == etag
+
+
+def test_svg_etag_changes_with_content(client):
+    name = add_card(client)
+    url = f'/vps/{quote(name)}.svg'
+    etag = client.get(url).headers['ETag']
+
+    with app_module.Session(app_module.engine) as db:
+        vps = db.query(app_module.VPS).filter(app_module.VPS.name == name).one()
+        vps_id = vps.id
+        form = app_module.build_vps_form_data(vps)
+    form.update({'vendor_name': 'NewVendor', 'dynamic_svg': 'on'})
+    res = client.post(f'/vps/{vps_id}/edit', data=form)
+    assert res.status_code == 302
+
+    resp = client.get(url, headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+    assert 'NewVendor' in resp.get_data(as_text=True)
+
+
+def test_concurrent_fetches_share_one_render(client, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app import utils
+
+    name = add_card(client)
+    url = f'/vps/{quote(name)}.svg'
+    with utils._svg_cache_lock:
+        utils._svg_cache.clear()
+
+    template = utils.env.get_template("vps.svg")
+    renders = []
+
+    class SlowTemplate:
+        def render(self, **kwargs):
+            renders.append(1)
+            time.sleep(0.2)
+            return template.render(**kwargs)
+
+    monkeypatch.setattr(utils.env, "get_template", lambda name: SlowTemplate())
+
+    def fetch(_):
+        with flask_app.test_client() as c:
+            res = c.get(url)
+            return res.status_code, res.headers['ETag'], res.get_data(as_text=True)
+
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        results = list(pool.map(fetch, range(300)))
+
+    assert len(renders) == 1
+    assert {r[0] for r in results} == {200}
+    assert len({(r[1], r[2]) for r in results}) == 1
+
+
+def test_published_card_is_never_partial(client, tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app import utils
+
+    monkeypatch.setattr(utils, "STATIC_DIR", tmp_path)
+    name = add_card(client)
+    with app_module.Session(app_module.engine) as db:
+        vps = db.query(app_module.VPS).filter(app_module.VPS.name == name).one()
+        data = app_module.refresh_valuations([vps])[vps.id]
+        out_file = utils.generate_svg(vps, data)
+        expected = out_file.read_text(encoding="utf-8")
+
+        def publish(i):
+            # Force a rewrite on every call so writers overlap with readers
+            utils._svg_published.pop(name, None)
+            utils.generate_svg(vps, data)
+            return out_file.read_text(encoding="utf-8")
+
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            contents = list(pool.map(publish, range(300)))
+
+    assert set(contents) == {expected}
+    assert [p.name for p in tmp_path.iterdir()] == [out_file.name]
+
+
+def test_published_card_gets_default_file_mode(client, tmp_path, monkeypatch):
+    from app import utils
+
+    monkeypatch.setattr(utils, "STATIC_DIR", tmp_path)
+    name = add_card(client)
+    with app_module.Session(app_module.engine) as db:
+        vps = db.query(app_module.VPS).filter(app_module.VPS.name == name).one()
+        data = app_module.refresh_valuations([vps])[vps.id]
+        out_file = utils.generate_svg(vps, data)
+    assert out_file.stat().st_mode & 0o777 == 0o666 & ~utils._UMASK
+
+
+def test_publishes_of_one_card_are_serialized(client, tmp_path, monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app import utils
+
+    monkeypatch.setattr(utils, "STATIC_DIR", tmp_path)
+    writing = []
+    overlaps = []
+    write = utils.atomic_write_text
+
+    def slow_write(path, content):
+        writing.append(path)
+        overlaps.append(len(writing))
+        time.sleep(0.01)
+        write(path, content)
+        writing.remove(path)
+
+    monkeypatch.setattr(utils, "atomic_write_text", slow_write)
+    name = add_card(client)
+    with app_module.Session(app_module.engine) as db:
+        vps = db.query(app_module.VPS).filter(app_module.VPS.name == name).one()
+        data = app_module.refresh_valuations([vps])[vps.id]
+        barrier = threading.Barrier(8)
+
+        def publish(i):
+            # A different address per call gives each publish its own content
+            barrier.wait()
+            return utils.generate_svg(vps, data, ip_info={"ip_display": f"10.0.0.{i}"})
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(publish, range(8)))
+
+    assert len(overlaps) >= 8
+    assert max(overlaps) == 1
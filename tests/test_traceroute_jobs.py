@@ -0,0 +1,126 @@
+import importlib.util
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from app import traceroute
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+spec = importlib.util.spec_from_file_location("app_main", ROOT / "app.py")
+app_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_module)
+
+
+@pytest.fixture
+def fake_traceroute(tmp_path, monkeypatch):
+    """Install a ``traceroute`` script; returns a writer for its body."""
+    log = tmp_path / "runs.log"
+    script = tmp_path / "traceroute"
+
+    def install(body):
+        # The target is the last argument, after -n -w 1 -q 1
+        script.write_text(f'#!/bin/sh\nfor t; do :; done\necho start $t >> "{log}"\n{body}\necho end $t >> "{log}"\n')
+        script.chmod(0o755)
+
+    install('echo "traceroute to $t"\necho " 1  10.0.0.1  0.5 ms"\necho " 2  $t  9.1 ms"')
+    monkeypatch.setattr(traceroute.shutil, "which", lambda name: str(script))
+    monkeypatch.setattr(traceroute, "_executor", None)
+    monkeypatch.setattr(traceroute, "_jobs", {})
+    monkeypatch.setattr(traceroute, "_by_target", {})
+    install.runs = lambda: log.read_text().split("\n")[:-1] if log.exists() else []
+    yield install
+    if traceroute._executor is not None:
+        traceroute._executor.shutdown(wait=True)
+
+
+def test_job_streams_hops_and_is_cached(fake_traceroute):
+    job = traceroute.start_traceroute("192.0.2.1")
+    lines = [item[1] for item in job.follow(heartbeat=0.1) if item is not None]
+    assert job.status == "done"
+    assert lines == ["traceroute to 192.0.2.1", " 1  10.0.0.1  0.5 ms", " 2  192.0.2.1  9.1 ms"]
+    assert [traceroute.parse_hop(line) for line in lines] == [None, 1, 2]
+
+    assert traceroute.start_traceroute("192.0.2.1") is job
+    assert fake_traceroute.runs() == ["start 192.0.2.1", "end 192.0.2.1"]
+
+
+def test_cache_expires(fake_traceroute, monkeypatch):
+    monkeypatch.setattr(traceroute, "TRACEROUTE_CACHE_TTL", 0)
+    first = traceroute.start_traceroute("192.0.2.1")
+    first.wait(5)
+    second = traceroute.start_traceroute("192.0.2.1")
+    assert second is not first
+    second.wait(5)
+    assert traceroute.get_job(first.id) is None
+
+
+def test_process_count_is_capped(fake_traceroute, monkeypatch):
+    monkeypatch.setattr(traceroute, "TRACEROUTE_CONCURRENCY", 1)
+    fake_traceroute("sleep 0.2")
+    jobs = [traceroute.start_traceroute(f"192.0.2.{i}") for i in range(1, 4)]
+    assert jobs[2].status == "queued"
+    for job in jobs:
+        assert job.wait(5)
+    runs = fake_traceroute.runs()
+    assert [run.split()[0] for run in runs] == ["start", "end"] * 3
+
+
+def test_pending_jobs_are_limited(fake_traceroute, monkeypatch):
+    monkeypatch.setattr(traceroute, "TRACEROUTE_MAX_PENDING", 1)
+    fake_traceroute("sleep 0.5")
+    traceroute.start_traceroute("192.0.2.1")
+    with pytest.raises(traceroute.TracerouteBusy):
+        traceroute.start_traceroute("192.0.2.2")
+
+
+def test_slow_traceroute_is_killed(fake_traceroute, monkeypatch):
+    monkeypatch.setattr(traceroute, "TRACEROUTE_TIMEOUT", 0.2)
+    fake_traceroute("sleep 5")
+    job = traceroute.start_traceroute("192.0.2.1")
+    started = time.monotonic()
+    assert job.wait(5)
+    assert time.monotonic() - started < 3
+    assert job.status == "failed"
+    assert job.lines[-1] == "Traceroute timed out"
+    # Failed runs are not served from the cache
+    assert traceroute.start_traceroute("192.0.2.1") is not job
+
+
+def test_job_routes(fake_traceroute):
+    client = app_module.app.test_client()
+    assert client.post("/traceroute/jobs", json={"target": "-n; rm"}).status_code == 400
+
+    res = client.post("/traceroute/jobs", json={"target": "192.0.2.7"})
+    assert res.status_code == 202
+    job = res.get_json()
+    events = client.get(job["events"])
+    assert events.mimetype == "text/event-stream"
+    body = events.get_data(as_text=True)
+    assert body.count("event: hop") == 3
+    assert 'data: {"hop": 2, "line": " 2  192.0.2.7  9.1 ms"}' in body
+    assert body.endswith('event: done\ndata: {"status": "done"}\n\n')
+
+    resumed = client.get(job["events"], headers={"Last-Event-ID": "1"}).get_data(as_text=True)
+    assert resumed.count("event: hop") == 1
+
+    status = client.get(f"/traceroute/jobs/{job['id']}").get_json()
+    assert [hop["hop"] for hop in status["hops"]] == [None, 1, 2]
+    assert client.get("/traceroute/jobs/missing").status_code == 404
+    assert client.get("/traceroute/192.0.2.7").get_data(as_text=True).startswith("traceroute to")
+
+
+def test_error_while_reading_fails_job(fake_traceroute, monkeypatch):
+    fake_traceroute("echo hop\nsleep 5")
+
+    def broken_append(self, line):
+        raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+    monkeypatch.setattr(traceroute.TracerouteJob, "_append", broken_append)
+    job = traceroute.start_traceroute("192.0.2.1")
+    started = time.monotonic()
+    assert job.wait(5)
+    assert time.monotonic() - started < 3  # the process was killed, not awaited
+    assert job.status == "failed"
@@ -1,20 +1,31 @@
 import json
-import subprocess
 from unittest.mock import patch, MagicMock
 
-from app.utils import traceroute_ip, run_speedtest
+from app import traceroute
+from app.utils import run_speedtest
 
 
 def test_traceroute_unavailable():
-    with patch('shutil.which', return_value=None):
-        assert traceroute_ip('1.1.1.1') == 'traceroute unavailable'
+    with patch('shutil.which', return_value=None), \
+         patch.object(traceroute, '_jobs', {}), \
+         patch.object(traceroute, '_by_target', {}):
+        job = traceroute.start_traceroute('1.1.1.1')
+        assert job.wait(5)
+        assert job.status == 'failed'
+        assert job.lines == ['traceroute unavailable']
 
 
-def test_traceroute_timeout():
-    mock_run = MagicMock(side_effect=subprocess.TimeoutExpired(cmd='traceroute', timeout=1))
+def test_traceroute_error_fails_job():
     with patch('shutil.which', return_value='/usr/bin/traceroute'), \
-         patch('subprocess.run', mock_run):
-        assert traceroute_ip('1.1.1.1', timeout=1) == 'Traceroute timed out'
+         patch('subprocess.Popen', MagicMock(side_effect=ValueError('bad pipe'))), \
+         patch.object(traceroute, '_jobs', {}), \
+         patch.object(traceroute, '_by_target', {}):
+        job = traceroute.start_traceroute('1.1.1.1')
+        assert job.wait(5)
+        assert job.status == 'failed'
+        assert job.lines == ['Traceroute error: bad pipe']
+        # A failed job does not hold a pending slot or the target
+        assert traceroute.start_traceroute('1.1.1.1') is not job
 
 
 def test_speedtest_not_installed():
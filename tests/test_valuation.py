@@ -0,0 +1,94 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import valuation
+from app.db import Base
+from app.models import VPS, VPSValuation
+from app.utils import calculate_remaining
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr("app.valuation.engine", engine)
+    return engine
+
+
+def add_vps(engine, **kwargs):
+    fields = dict(
+        name="v",
+        purchase_date=date.today() - timedelta(days=40),
+        renewal_days=30,
+        renewal_price=10.0,
+        currency="CNY",
+        exchange_rate=1.0,
+        exchange_rate_source="custom",
+    )
+    fields.update(kwargs)
+    with Session(engine) as db:
+        vps = VPS(**fields)
+        db.add(vps)
+        db.commit()
+        return vps.id
+
+
+def test_refresh_valuations_stores_calculate_remaining(engine):
+    vps_id = add_vps(engine)
+    results = valuation.refresh_valuations()
+    with Session(engine) as db:
+        vps = db.get(VPS, vps_id)
+        expected = calculate_remaining(vps)
+        row = db.get(VPSValuation, vps_id)
+    assert results[vps_id] == expected
+    assert row.valued_on == date.today()
+    assert row.remaining_value == expected["remaining_value"]
+    assert row.cycle_end == expected["cycle_end"]
+
+
+def test_get_valuations_reads_rows_and_recomputes_stale(engine, monkeypatch):
+    fresh_id = add_vps(engine, name="fresh")
+    stale_id = add_vps(engine, name="stale")
+    valuation.refresh_valuations()
+    with Session(engine) as db:
+        db.get(VPSValuation, fresh_id).remaining_value = 123.0
+        db.get(VPSValuation, stale_id).valued_on = date.today() - timedelta(days=1)
+        db.commit()
+
+    computed = []
+    original = valuation.calculate_remaining_many
+
+    def counting(vps_list, today=None):
+        computed.extend(vps.id for vps in vps_list)
+        return original(vps_list, today)
+
+    monkeypatch.setattr("app.valuation.calculate_remaining_many", counting)
+    with Session(engine) as db:
+        rows = db.query(VPS).all()
+        results = valuation.get_valuations(db, rows)
+        # Instances stay usable after the stale rows were written back
+        assert {vps.name for vps in rows} == {"fresh", "stale"}
+    assert computed == [stale_id]
+    assert results[fresh_id]["remaining_value"] == 123.0
+    with Session(engine) as db:
+        assert db.get(VPSValuation, stale_id).valued_on == date.today()
+
+
+def test_refresh_stale_valuations_only_runs_for_old_rows(engine):
+    first = add_vps(engine, name="first")
+    second = add_vps(engine, name="second")
+    valuation.refresh_valuations()
+    assert valuation.refresh_stale_valuations() is False
+
+    with Session(engine) as db:
+        db.get(VPSValuation, first).valued_on = date.today() - timedelta(days=1)
+        db.get(VPSValuation, second).remaining_value = 123.0
+        db.commit()
+    assert valuation.refresh_stale_valuations() is True
+    with Session(engine) as db:
+        rows = db.query(VPSValuation).all()
+        assert {row.valued_on for row in rows} == {date.today()}
+        assert db.get(VPSValuation, second).remaining_value != 123.0
@@ -0,0 +1,83 @@
+import threading
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import visits
+from app.db import Base
+from app.models import VisitDaily, VisitStats
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    # Write out hits counted by other tests before switching databases
+    visits.flush_visits()
+    engine = create_engine(f"sqlite:///{tmp_path / 'visits.db'}")
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr("app.visits.engine", engine)
+    # Keep record_visit from flushing on its own during the test
+    monkeypatch.setattr("app.visits.VISIT_FLUSH_SECONDS", 3600)
+    yield engine
+    # Drop anything left pending so it never reaches the real database
+    visits._take_pending()
+
+
+def test_concurrent_hits_are_flushed_as_one_delta(engine):
+    def hit(is_bot):
+        for _ in range(250):
+            visits.record_visit(is_bot)
+
+    threads = [threading.Thread(target=hit, args=(i % 4 == 0,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert visits.pending_visits() == {"visitors": 1500, "crawlers": 500}
+    with Session(engine) as db:
+        assert db.get(VisitStats, 1) is None
+
+    assert visits.flush_visits()
+    assert visits.pending_visits() == {"visitors": 0, "crawlers": 0}
+    assert visits.get_visit_totals() == {"visitors": 1500, "crawlers": 500}
+    with Session(engine) as db:
+        stats = db.get(VisitStats, 1)
+        daily = db.get(VisitDaily, date.today())
+        assert (stats.visitors, stats.crawlers) == (1500, 500)
+        assert (daily.visitors, daily.crawlers) == (1500, 500)
+
+
+def test_flush_adds_to_counts_written_by_other_workers(engine):
+    with Session(engine) as db:
+        db.add(VisitStats(id=1, visitors=10, crawlers=2))
+        db.add(VisitDaily(day=date.today(), visitors=4, crawlers=1))
+        db.commit()
+
+    visits.record_visit(False)
+    visits.record_visit(True)
+    assert visits.flush_visits()
+    with Session(engine) as db:
+        stats = db.get(VisitStats, 1)
+        daily = db.get(VisitDaily, date.today())
+        assert (stats.visitors, stats.crawlers) == (11, 3)
+        assert (daily.visitors, daily.crawlers) == (5, 2)
+
+
+def test_failed_flush_keeps_pending_hits(engine, monkeypatch):
+    def broken(deltas):
+        raise OSError("database unavailable")
+
+    write = visits._write
+    monkeypatch.setattr("app.visits._write", broken)
+    visits.record_visit(False)
+    assert not visits.flush_visits()
+    assert visits.pending_visits() == {"visitors": 1, "crawlers": 0}
+
+    # The retained hit goes to the test database on the next flush
+    monkeypatch.setattr("app.visits._write", write)
+    assert visits.flush_visits()
+    assert visits.pending_visits() == {"visitors": 0, "crawlers": 0}
+    with Session(engine) as db:
+        assert db.get(VisitStats, 1).visitors == 1
@@ -0,0 +1,105 @@
+import importlib.util
+import json
+import sys
+import uuid
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from app.vps_api import parse_fields, project
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+spec = importlib.util.spec_from_file_location("app_main", ROOT / "app.py")
+app_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_module)
+
+
+@pytest.fixture
+def vps_id(monkeypatch):
+    monkeypatch.setattr(app_module, "_start_vps_refresh", lambda: None)
+    with app_module.Session(app_module.engine) as db:
+        vps = app_module.VPS(
+            name=f"api_{uuid.uuid4().hex}",
+            ip_address="203.0.113.9",
+            purchase_date=date(2024, 1, 1),
+            renewal_days=365,
+            renewal_price=100.0,
+            currency="USD",
+            vendor_name="api-vendor",
+            instance_config="2C / 2G / 40G",
+        )
+        db.add(vps)
+        db.commit()
+        return vps.id
+
+
+def test_detail_record_and_projection(vps_id):
+    client = app_module.app.test_client()
+    body = client.get(f"/api/vps/{vps_id}").get_json()
+    assert body["id"] == vps_id
+    assert body["purchase_date"] == "2024-01-01"
+    assert set(body["valuation"]) >= {"remaining_value", "remaining_days"}
+    assert body["ip_info"]["ip_display"] != "203.0.113.9"
+    assert "203.0.113.9" not in json.dumps(body)
+
+    body = client.get(f"/api/vps/{vps_id}?fields=name,valuation.remaining_value").get_json()
+    assert set(body) == {"id", "name", "valuation"}
+    assert set(body["valuation"]) == {"remaining_value"}
+
+    assert client.get(f"/api/vps/{vps_id}?fields=ip_address").status_code == 400
+    assert client.get("/api/vps/999999999").status_code == 404
+
+
+def test_conditional_get(vps_id):
+    client = app_module.app.test_client()
+    first = client.get(f"/api/vps/{vps_id}")
+    assert first.headers["ETag"]
+    assert first.headers["Last-Modified"]
+    again = client.get(f"/api/vps/{vps_id}", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.get_data() == b""
+
+
+def test_list_pages_and_ndjson_export(vps_id):
+    client = app_module.app.test_client()
+    page = client.get("/api/vps?vendor=api-vendor&limit=1&fields=name").get_json()
+    assert len(page["items"]) == 1
+    assert set(page["items"][0]) == {"id", "name"}
+
+    response = client.get("/api/vps?vendor=api-vendor&format=ndjson")
+    assert response.mimetype == "application/x-ndjson"
+    assert response.is_streamed
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert vps_id in {line["id"] for line in lines}
+    assert all(line["vendor_name"] == "api-vendor" for line in lines)
+
+    accepted = client.get("/api/vps?vendor=api-vendor", headers={"Accept": "application/x-ndjson"})
+    assert accepted.mimetype == "application/x-ndjson"
+
+
+def test_ndjson_export_refreshes_stale_valuations_first(vps_id, monkeypatch):
+    calls = []
+    real_refresh, real_query = app_module.refresh_stale_valuations, app_module.list_query
+
+    def refresh():
+        calls.append("refresh")
+        return real_refresh()
+
+    def query(*args, **kwargs):
+        calls.append("query")
+        return real_query(*args, **kwargs)
+
+    monkeypatch.setattr(app_module, "refresh_stale_valuations", refresh)
+    monkeypatch.setattr(app_module, "list_query", query)
+    client = app_module.app.test_client()
+    client.get("/api/vps?vendor=api-vendor&sort=value&format=ndjson").get_data()
+    assert calls == ["refresh", "query"]
+
+
+def test_project_keeps_whole_groups():
+    record = {"id": 1, "name": "a", "valuation": {"remaining_value": 1.0, "final_price": 2.0}}
+    fields = parse_fields("valuation.final_price, valuation")
+    assert project(record, fields) == {"id": 1, "valuation": record["valuation"]}
+    assert project(record, None) is record
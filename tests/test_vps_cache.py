@@ -0,0 +1,137 @@
+import importlib.util
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+spec = importlib.util.spec_from_file_location("app_main", ROOT / "app.py")
+app_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_module)
+
+
+def row(vps_id, status="active", value=0.0):
+    return (SimpleNamespace(id=vps_id, status=status), {"remaining_value": value}, {}, {})
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(app_module, "VPS_CACHE_TTL", 60)
+    monkeypatch.setattr(app_module, "VPS_CACHE_MAX_AGE", 600)
+    app_module.invalidate_vps_cache()
+    app_module._vps_cache["cursor"] = app_module.latest_vps_change()
+    yield app_module._vps_cache
+    deadline = time.time() + 5
+    while app_module._vps_cache["refreshing"] and time.time() < deadline:
+        time.sleep(0.01)
+    app_module.invalidate_vps_cache()
+
+
+def test_stale_list_is_served_while_one_thread_rebuilds(cache, monkeypatch):
+    release = threading.Event()
+    builds = []
+
+    def slow_build(network=True, ids=None):
+        builds.append(network)
+        release.wait(5)
+        return [row(2)]
+
+    monkeypatch.setattr(app_module, "_build_vps_data", slow_build)
+    cache["index"] = app_module.VPSIndex([row(1)])
+    cache["time"] = time.time() - 120
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(app_module.get_vps_data()))
+        for _ in range(20)
+    ]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert time.monotonic() - started < 1
+    assert results == [[row(1)]] * 20
+
+    release.set()
+    deadline = time.time() + 5
+    while cache["refreshing"] and time.time() < deadline:
+        time.sleep(0.01)
+    assert builds == [True]
+    assert app_module.get_vps_data() == [row(2)]
+
+
+def test_expired_list_is_rebuilt_without_network(cache, monkeypatch):
+    def no_network(*args, **kwargs):
+        raise AssertionError("request path must not probe or call APIs")
+
+    monkeypatch.setattr(app_module, "probe_fleet", no_network)
+    monkeypatch.setattr("app.geo.requests.get", no_network)
+    monkeypatch.setattr("app.geo.requests.post", no_network)
+    monkeypatch.setattr(app_module, "_start_vps_refresh", lambda: None)
+    cache["index"] = app_module.VPSIndex([row(-1)])
+    cache["time"] = time.time() - 601
+
+    data = app_module.get_vps_data()
+    assert data != [row(-1)]
+    assert all(len(row) == 4 for row in data)
+
+
+def test_write_during_rebuild_is_not_overwritten(cache, monkeypatch):
+    calls = []
+
+    def build(network=True, ids=None):
+        calls.append(network)
+        if len(calls) == 1:
+            app_module.invalidate_vps_cache()  # a reset lands mid-rebuild
+            return [row(1)]
+        return [row(2)]
+
+    monkeypatch.setattr(app_module, "_build_vps_data", build)
+    cache["refreshing"] = True
+    app_module._refresh_vps_data()
+    assert calls == [True, True]
+    assert cache["index"].rows() == [row(2)]
+
+
+def test_logged_change_updates_only_that_row(cache, monkeypatch):
+    builds = []
+
+    def build(network=True, ids=None):
+        builds.append(ids)
+        return [row(2, "active", 50.0)] if 2 in ids else []
+
+    monkeypatch.setattr(app_module, "_build_vps_data", build)
+    monkeypatch.setattr(app_module, "_start_vps_refresh", lambda: None)
+    cache["index"] = app_module.VPSIndex(
+        [row(1, "active", 10.0), row(2, "sold", 90.0), row(3, "active", 30.0)]
+    )
+    cache["time"] = time.time()
+
+    # Another worker edits server 2 and deletes server 3
+    app_module.invalidate_vps_cache(2)
+    app_module.invalidate_vps_cache(3)
+
+    data = app_module.get_vps_data()
+    assert builds == [[2, 3]]
+    assert [r[0].id for r in data] == [2, 1]
+    assert app_module.get_vps_data() is data
+
+
+def test_pruned_change_log_forces_rebuild(cache, monkeypatch):
+    monkeypatch.setattr("app.vps_index.VPS_CHANGE_LOG_SIZE", 1)
+    monkeypatch.setattr(
+        app_module, "_build_vps_data", lambda network=True, ids=None: [row(9)]
+    )
+    monkeypatch.setattr(app_module, "_start_vps_refresh", lambda: None)
+    cache["index"] = app_module.VPSIndex([row(1)])
+    cache["time"] = time.time()
+
+    app_module.invalidate_vps_cache(1)
+    app_module.invalidate_vps_cache(2)
+
+    assert app_module.get_vps_data() == [row(9)]
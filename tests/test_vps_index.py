@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+from app.vps_index import VPSIndex, page_rows
+
+
+def row(vps_id, status, value):
+    return (SimpleNamespace(id=vps_id, status=status), {"remaining_value": value}, {}, {})
+
+
+def ids(index):
+    return [r[0].id for r in index.rows()]
+
+
+def test_rows_are_ordered_by_status_then_value():
+    index = VPSIndex([
+        row(1, "sold", 100.0),
+        row(2, "active", 10.0),
+        row(3, "forsale", 50.0),
+        row(4, "active", 80.0),
+    ])
+    assert ids(index) == [4, 2, 3, 1]
+
+
+def test_upsert_moves_changed_row():
+    index = VPSIndex([row(1, "active", 10.0), row(2, "active", 20.0)])
+    index.upsert(row(1, "active", 30.0))
+    assert ids(index) == [1, 2]
+    index.upsert(row(1, "inactive", 30.0))
+    assert ids(index) == [2, 1]
+    assert len(index) == 2
+
+
+def test_remove_drops_row():
+    index = VPSIndex([row(1, "active", 10.0), row(2, "active", 10.0)])
+    index.remove(1)
+    index.remove(5)
+    assert ids(index) == [2]
+    assert 1 not in index
+
+
+def test_page_rows_continues_after_key():
+    index = VPSIndex([row(i, "active", float(i % 3)) for i in range(1, 8)])
+    rows = index.rows()
+    page, key = page_rows(rows, limit=3)
+    seen = list(page)
+    while key is not None:
+        page, key = page_rows(rows, after=key, limit=3)
+        seen.extend(page)
+    assert seen == rows
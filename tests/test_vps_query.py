@@ -0,0 +1,96 @@
+import importlib.util
+import sys
+from datetime import date
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.db import Base
+from app.models import VPS, VPSValuation
+from app.vps_query import decode_cursor, filter_options, query_page
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+spec = importlib.util.spec_from_file_location("app_main", ROOT / "app.py")
+app_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_module)
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'vps.db'}")
+    Base.metadata.create_all(bind=engine)
+    statuses = ["active", "sold", "forsale", "inactive"]
+    with Session(engine) as db:
+        for i in range(1, 41):
+            db.add(VPS(
+                id=i,
+                name=f"vps{i:02d}",
+                status=statuses[i % 4],
+                vendor_name="acme" if i % 2 else "globex",
+                location="LA" if i % 3 else "HK",
+                currency="USD",
+            ))
+            # Equal values on some rows exercise the id tie-breaker
+            db.add(VPSValuation(vps_id=i, valued_on=date.today(), remaining_value=float(i % 7)))
+        db.commit()
+        yield db
+
+
+def walk(db, **kwargs):
+    seen, after = [], None
+    while True:
+        page, after = query_page(db, after=after, limit=7, **kwargs)
+        assert len(page) <= 7
+        seen.extend(page)
+        if after is None:
+            return seen
+
+
+def test_pages_cover_every_row_once_in_order(db):
+    rows = walk(db)
+    assert len(rows) == len({vps.id for vps in rows}) == 40
+    values = {v.vps_id: v.remaining_value for v in db.query(VPSValuation)}
+    rank = {"active": 0, "forsale": 1, "sold": 2, "inactive": 3}
+    keys = [(rank[vps.status], -values[vps.id], vps.id) for vps in rows]
+    assert keys == sorted(keys)
+
+
+def test_filters_and_other_sorts(db):
+    rows = walk(db, filters={"vendor": ["acme"], "location": ["LA"]}, sort="name")
+    assert rows == sorted(rows, key=lambda vps: vps.name)
+    assert all(vps.vendor_name == "acme" and vps.location == "LA" for vps in rows)
+    assert len(rows) == len([i for i in range(1, 41) if i % 2 and i % 3])
+
+
+def test_filter_options(db):
+    assert filter_options(db) == {
+        "vendor": ["acme", "globex"],
+        "location": ["HK", "LA"],
+        "currency": ["USD"],
+    }
+
+
+def test_bad_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor", "status")
+    with pytest.raises(ValueError):
+        decode_cursor("WzFd", "status")  # a one-element key
+
+
+def test_vps_route_pages_and_validates():
+    client = app_module.app.test_client()
+    assert client.get("/vps?sort=bogus").status_code == 400
+    assert client.get("/vps?after=garbage").status_code == 400
+    assert client.get("/vps?status=active&sort=value&limit=1").status_code == 200
+
+
+def test_default_list_renders_pager(monkeypatch):
+    monkeypatch.setattr(app_module, "_start_vps_refresh", lambda: None)
+    client = app_module.app.test_client()
+    with app_module.Session(app_module.engine) as db:
+        total = db.query(VPS).count()
+    body = client.get("/vps?limit=1").get_data(as_text=True)
+    assert ("下一页" in body) == (total > 1)
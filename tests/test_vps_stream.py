@@ -0,0 +1,74 @@
+import importlib.util
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+from app.vps_query import decode_cursor
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+spec = importlib.util.spec_from_file_location("app_main", ROOT / "app.py")
+app_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_module)
+
+
+@pytest.fixture
+def vendor(monkeypatch):
+    monkeypatch.setattr(app_module, "_start_vps_refresh", lambda: None)
+    vendor = f"stream_{uuid.uuid4().hex}"
+    with app_module.Session(app_module.engine) as db:
+        for i in range(5):
+            db.add(app_module.VPS(name=f"{vendor}_{i}", vendor_name=vendor))
+        db.commit()
+    return vendor
+
+
+@pytest.fixture
+def built(monkeypatch):
+    built = []
+    real = app_module._vps_rows
+
+    def record(db, vps_list, network=True):
+        built.append(len(vps_list))
+        return real(db, vps_list, network)
+
+    monkeypatch.setattr(app_module, "_vps_rows", record)
+    return built
+
+
+def test_page_is_valued_in_chunks(vendor, built, monkeypatch):
+    monkeypatch.setattr(app_module, "VPS_STREAM_CHUNK", 2)
+    page = {}
+    rows = app_module.iter_vps_page(page, filters={"vendor": [vendor]}, sort="name", limit=3)
+    assert built == []  # nothing is valued until rows are consumed
+    names = [row[0].name for row in rows]
+    assert names == [f"{vendor}_{i}" for i in range(3)]
+    assert built == [2, 1]
+    assert page["next"]
+
+    rest = list(app_module.iter_vps_page(page, filters={"vendor": [vendor]}, sort="name",
+                                         after=decode_cursor(page["next"], "name")))
+    assert [row[0].name for row in rest] == [f"{vendor}_3", f"{vendor}_4"]
+    assert page["next"] is None
+
+
+def test_head_is_flushed_before_cards_are_valued(vendor, built):
+    client = app_module.app.test_client()
+    response = client.get(f"/vps?vendor={vendor}", buffered=False)
+    assert "Content-Length" not in response.headers
+    chunks = iter(response.response)
+    assert b"<!DOCTYPE html>" in next(chunks)
+    assert built == []
+    body = b"".join(chunks).decode()
+    response.close()
+    assert built
+    assert body.count("data-href=") == 5
+
+
+def test_streaming_can_be_disabled(vendor, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "STREAM_VPS_LIST", False)
+    response = app_module.app.test_client().get(f"/vps?vendor={vendor}")
+    assert "Content-Length" in response.headers
+    assert response.get_data(as_text=True).count("data-href=") == 5